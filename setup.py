@@ -14,11 +14,17 @@ setup(
         "requests==2.22.0",
         "singer-python==5.8.1",
         "pydantic==1.8.2",
-        "backoff==1.8.0",
     ],
+    extras_require={
+        "parquet": ["pyarrow"],
+        "zstd": ["zstandard"],
+    },
     entry_points="""
           [console_scripts]
           tap-salesforce=tap_salesforce:main
+          tap-salesforce-runner=tap_salesforce.runner:main
+          tap-salesforce-shard=tap_salesforce.shard:main
+          tap-salesforce-journal=tap_salesforce.journal:main
       """,
     packages=["tap_salesforce"],
 )
@@ -1,19 +1,30 @@
 #!/usr/bin/env python3
-import sys
-from typing import Tuple, Optional, List
-from datetime import datetime, timezone, date, timedelta
-from dateutil.rrule import rrule, WEEKLY
+# the startup timer is imported first, so it measures the imports of the tap
+from tap_salesforce.startup import STARTUP
 
+import sys
+import json
+import argparse
+from typing import TYPE_CHECKING, Tuple, Optional, List, Dict, TextIO
+from datetime import datetime, timezone, timedelta
 
+# singer provides the logger and strptime, its catalog module is imported by discovery
 import singer
 import singer.utils as singer_utils
-import requests
-
 
 from tap_salesforce.stream import Stream
-from tap_salesforce.client import Salesforce, Table, PrimaryKeyNotMatch
+from tap_salesforce.client import (
+    Salesforce,
+    Table,
+    PrimaryKeyNotMatch,
+    DEFAULT_QUOTA_PERCENT_TOTAL,
+    DEFAULT_QUOTA_PERCENT_PER_RUN,
+)
+from tap_salesforce.config import flag
 from tap_salesforce.exceptions import (
     build_salesforce_exception,
+    SalesforceException,
+    PipelineError,
     TapSalesforceException,
     TapSalesforceQuotaExceededException,
     TapSalesforceInvalidCredentialsException,
@@ -21,11 +32,31 @@ from tap_salesforce.exceptions import (
     TapSalesforceReportException,
 )
 
+# the modules of the sync and of optional features are imported when they are used
+if TYPE_CHECKING:
+    import requests
+
+    from tap_salesforce.catalog import FieldSelector
+    from tap_salesforce.checkpoint import Checkpoint
+    from tap_salesforce.converter import RecordConverter
+    from tap_salesforce.dedupe import OverlapFilter
+    from tap_salesforce.diff_index import DiffIndex
+    from tap_salesforce.pipeline import Pipeline
+
+STARTUP.mark("imports")
+
 LOGGER = singer.get_logger()
 
 REQUIRED_CONFIG_KEYS = ["refresh_token", "client_id", "client_secret", "start_date"]
 FOUR_YEARS_AGO = (datetime.now(timezone.utc) - timedelta(days=4 * 365)).date()
 FIVE_YEARS_AGO = (datetime.now(timezone.utc) - timedelta(days=5 * 365)).date()
+# incremental syncs re-read this window before the bookmark to catch late-queryable records
+OVERLAP_WINDOW = timedelta(minutes=3)
+# low volume tables whose queries are batched into composite requests
+COMPOSITE_TABLES = ["RecordType", "CurrencyType", "User", "OpportunityContactRole"]
+
+# records of a window above which it is synced in smaller windows
+DEFAULT_PROBE_SPLIT_RECORDS = 1000000
 
 CONFIG = {
     "refresh_token": None,
@@ -41,30 +72,211 @@ class Replication:
     incremental = "INCREMENTAL"  # means we append new records to the table
 
 
+def parse_args() -> argparse.Namespace:
+    """
+    parses the arguments of singer's parse_args, but only loads the config file. the state
+    and catalog files are left to the caller, so they can be loaded during the login.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--config", help="Config file", required=True)
+    parser.add_argument("-s", "--state", help="State file")
+    parser.add_argument(
+        "-p", "--properties", help="Property selections: DEPRECATED, Please use --catalog instead"
+    )
+    parser.add_argument("--catalog", help="Catalog file")
+    parser.add_argument("-d", "--discover", action="store_true", help="Do schema discovery")
+
+    args = parser.parse_args()
+    args.config = singer_utils.load_json(args.config)
+    singer_utils.check_config(args.config, REQUIRED_CONFIG_KEYS)
+    return args
+
+
 def main_impl():
-    args = singer_utils.parse_args(REQUIRED_CONFIG_KEYS)
-    is_sandbox = args.config.get("is_sandbox", False)
-
-    sf = Salesforce(
-        refresh_token=args.config["refresh_token"],
-        client_id=args.config["client_id"],
-        client_secret=args.config["client_secret"],
-        is_sandbox=is_sandbox,
+    args = parse_args()
+    STARTUP.mark("arguments")
+    # the catalog and the state are loaded while the login request is in flight
+    sf = build_salesforce(args.config, login_async=True)
+
+    catalog = None
+    if args.catalog:
+        from singer.catalog import Catalog
+
+        catalog = Catalog.load(args.catalog).to_dict()
+    elif args.properties:
+        catalog = singer_utils.load_json(args.properties)
+
+    stream = None
+    if not args.discover:
+        state = singer_utils.load_json(args.state) if args.state else {}
+        stream = build_stream(args.config, state)
+    STARTUP.mark("state")
+
+    sf.wait_for_login()
+    STARTUP.mark("login")
+    STARTUP.report()
+
+    if args.discover:
+        do_discover(sf, args.config)
+        return
+
+    if flag(args.config, "streaming"):
+        do_stream(sf, stream, args.config, catalog)
+        return
+    do_sync(sf, stream, args.config, catalog)
+
+
+def build_salesforce(
+    config: Dict,
+    session: Optional["requests.Session"] = None,
+    login_async: bool = False,
+) -> Salesforce:
+    from tap_salesforce.latency import DEFAULT_HEDGE_BUDGET
+    from tap_salesforce.retry import (
+        RetryEngine,
+        DEFAULT_MAX_TRIES,
+        DEFAULT_RETRY_BUDGET_PER_RUN,
+        DEFAULT_RETRY_BUDGET_PER_TABLE,
+    )
+
+    hedge_budget = 0
+    if flag(config, "hedge_requests"):
+        hedge_budget = int(config.get("hedge_budget") or DEFAULT_HEDGE_BUDGET)
+    return Salesforce(
+        refresh_token=config["refresh_token"],
+        client_id=config["client_id"],
+        client_secret=config["client_secret"],
+        quota_percent_total=float(
+            config.get("quota_percent_total") or DEFAULT_QUOTA_PERCENT_TOTAL
+        ),
+        quota_percent_per_run=float(
+            config.get("quota_percent_per_run") or DEFAULT_QUOTA_PERCENT_PER_RUN
+        ),
+        is_sandbox=config.get("is_sandbox", False),
+        session=session,
+        retries=RetryEngine(
+            max_tries=int(config.get("retry_max_tries") or DEFAULT_MAX_TRIES),
+            budget_per_run=int(
+                config.get("retry_budget_per_run") or DEFAULT_RETRY_BUDGET_PER_RUN
+            ),
+            budget_per_table=int(
+                config.get("retry_budget_per_table") or DEFAULT_RETRY_BUDGET_PER_TABLE
+            ),
+        ),
+        timeouts=request_timeouts(config),
+        login_async=login_async,
+        hedge_budget=hedge_budget,
+    )
+
+
+def request_timeouts(config: Dict) -> Dict[str, Tuple[float, float]]:
+    """returns the (connect, read) timeouts of the endpoint classes configured with {class}_timeout_seconds"""
+    from tap_salesforce.latency import DEFAULT_TIMEOUTS
+
+    timeouts = {}
+    for endpoint_class, (connect, read) in DEFAULT_TIMEOUTS.items():
+        read = float(config.get(f"{endpoint_class}_timeout_seconds") or read)
+        timeouts[endpoint_class] = (
+            float(config.get("connect_timeout_seconds") or connect),
+            read,
+        )
+    return timeouts
+
+
+def do_sync(sf: Salesforce, stream: Stream, config: Dict, catalog: Optional[Dict] = None):
+    import requests
+
+    from tap_salesforce.catalog import FieldSelector
+    from tap_salesforce.checkpoint import Checkpoint, DEFAULT_CHECKPOINT_INTERVAL
+    from tap_salesforce.fields import sync_fields, DEFAULT_FIELDS_FULL_REFRESH_HOURS
+    from tap_salesforce.history import (
+        TableRun,
+        expected_records,
+        record_run,
+        DEFAULT_HISTORY_SIZE,
+        DEFAULT_REGRESSION_FACTOR,
     )
 
-    start_date_conf = args.config["start_date"]
+    advanced_features_enabled = config.get("advanced_features_enabled", False)
+    custom_objects = config.get("custom_objects", [])
+    special_objects = config.get("special_objects", [])
 
-    config_start = singer_utils.strptime_with_tz(start_date_conf).astimezone(
+    selector = FieldSelector(catalog, config)
+
+    memory_budget_mb = config.get("memory_budget_mb")
+    if memory_budget_mb:
+        from tap_salesforce.memory import GOVERNOR
+
+        GOVERNOR.configure(
+            int(float(memory_budget_mb) * 1024 * 1024),
+            float(config.get("memory_max_wait_seconds") or 30),
+        )
+
+    query_plan_advisor = config.get("query_plan_advisor", "off")
+    if query_plan_advisor != "off":
+        from tap_salesforce.query_plan import QueryPlanAdvisor
+
+        sf.query_plan_advisor = QueryPlanAdvisor(sf, query_plan_advisor)
+
+    config_start = singer_utils.strptime_with_tz(config["start_date"]).astimezone(
         timezone.utc
     )
-    stream = Stream(args.state)
 
-    advanced_features_enabled = args.config.pop("advanced_features_enabled", False)
-    custom_objects = args.config.pop("custom_objects", [])
-    special_objects = args.config.pop("special_objects", [])
+    fields_full_refresh_hours = config.get(
+        "fields_full_refresh_hours", DEFAULT_FIELDS_FULL_REFRESH_HOURS
+    )
+    fields_full_refresh_interval = None
+    if fields_full_refresh_hours:
+        fields_full_refresh_interval = timedelta(hours=float(fields_full_refresh_hours))
+
+    checkpoint_interval = int(
+        config.get("checkpoint_interval") or DEFAULT_CHECKPOINT_INTERVAL
+    )
+
+    overlap_dedupe = flag(config, "overlap_dedupe", True)
+
+    composite_tables = config.get("composite_tables", COMPOSITE_TABLES)
+    change_probes = flag(config, "change_probes", True)
+    probe_split_records = int(
+        config.get("probe_split_records", DEFAULT_PROBE_SPLIT_RECORDS) or 0
+    )
+
+    diff_index_dir = config.get("diff_index_dir")
+
+    history_size = int(config.get("performance_history_size", DEFAULT_HISTORY_SIZE) or 0)
+    regression_factor = float(
+        config.get("regression_factor") or DEFAULT_REGRESSION_FACTOR
+    )
+
+    convert_records = flag(config, "convert_records", True)
+    if convert_records:
+        from tap_salesforce.converter import RecordConverter
+    compound_fields = config.get("compound_fields", "keep")
+    normalize_types = flag(config, "normalize_types")
+
+    pipeline = None
+    pipeline_workers = int(config.get("pipeline_workers") or 0)
+    passthrough = flag(config, "passthrough")
+    if passthrough and convert_records:
+        LOGGER.warning("passthrough requires convert_records to be false, records are converted")
+        passthrough = False
+    if pipeline_workers > 0 or passthrough:
+        from tap_salesforce.pipeline import Pipeline
+
+        pipeline = Pipeline(pipeline_workers, passthrough)
+
     missing_tables = []
     try:
-        for table in sf.get_tables(advanced_features_enabled, custom_objects, special_objects):
+        tables = list(
+            sf.get_tables(advanced_features_enabled, custom_objects, special_objects)
+        )
+        windows = prefetch_small_tables(
+            sf, stream, tables, selector, config_start, composite_tables
+        )
+        counts = {}
+        if change_probes:
+            counts = probe_changes(sf, stream, tables, selector, config_start, windows)
+        for table in tables:
             if table.not_found:
                 missing_tables.append(table.name)
                 continue
@@ -73,34 +285,112 @@ def main_impl():
                     f"skipping stream {table.name} since it does not exist on this account"
                 )
                 continue
+            if not selector.is_selected(table):
+                LOGGER.info(f"skipping stream {table.name} since it is not selected")
+                continue
 
-            end_time_buffer = timedelta(minutes=3)
-            if sf.instance_url == "https://zi.my.salesforce.com" and table.name == "Campaign":
-                end_time_buffer = timedelta(seconds=-10)
-            end_time = datetime.now(timezone.utc) - end_time_buffer
+            start_time, end_time, resync = windows.pop(table.name, None) or table_window(
+                sf, stream, table, config_start
+            )
 
             if table.should_sync_fields:
-                stream_id = f"{table.name}Fields"
-                for field in table.fields:
-                    stream.write_record(field, stream_id)
+                sync_fields(stream, table, fields_full_refresh_interval)
 
+            count = counts.get(table.name)
+            if count == 0:
+                # a skipped table is not a run, it would lower the medians of its history
+                LOGGER.info(
+                    f"skipping stream {table.name} since no records changed in [{start_time}, {end_time})"
+                )
+                stream.set_stream_state(table.name, table.replication_key, end_time)
+                stream.set_stream_state(table.name, Replication.key, Replication.incremental)
+                stream.write_state()
+                continue
+
+            run = TableRun(sf, table.name)
             LOGGER.info(f"processing stream {table.name}")
+            selected_fields = selector.select_fields(table)
+            if stream.journal is not None:
+                stream.journal.replication_keys[table.name] = table.replication_key
 
-            state_bookmark = stream.get_stream_state(table.name, table.replication_key)
-            start_time = state_bookmark or config_start
-            if state_bookmark is not None:
-                # Re-read an overlap window to catch late-queryable records.
-                start_time = state_bookmark - timedelta(minutes=3)
-            resync = table.should_resync_all_historical_data()
-            if resync:
-                if sf.instance_url == "https://zi.my.salesforce.com" and table.name in ["CampaignMember", "Event"]:
-                    start_time = FIVE_YEARS_AGO
-                else:
-                    start_time = FOUR_YEARS_AGO
+            field_names = [field["name"] for field in selected_fields]
+            converter = None
+            if convert_records:
+                converter = RecordConverter(
+                    selected_fields, compound_fields, normalize_types
+                )
+            stream.set_table_fields(
+                table.name, converter.fields if converter else selected_fields
+            )
+            overlap_filter = None
+            if overlap_dedupe and table.replication_key and not resync:
+                from tap_salesforce.dedupe import OverlapFilter, DEFAULT_OVERLAP_MAX_SIZE
+
+                overlap_filter = OverlapFilter.from_state(
+                    stream.get_bookmark(table.name),
+                    OVERLAP_WINDOW,
+                    int(config.get("overlap_dedupe_max_size") or DEFAULT_OVERLAP_MAX_SIZE),
+                )
+            checkpoint = Checkpoint.from_dict(
+                stream.get_bookmark(table.name).get("checkpoint")
+            )
+            diff_index = None
+            if diff_index_dir and resync:
+                from tap_salesforce.diff_index import DiffIndex
 
-            field_names = [field["name"] for field in table.fields]
+                diff_index = DiffIndex.for_table(
+                    diff_index_dir,
+                    table.name,
+                    table.replication_key,
+                    stream.get_bookmark(table.name),
+                )
+                # applied with the STATE messages that cover its changes, closed with the stream
+                stream.state_listeners.append(diff_index)
+            # a resync that only emits the differences is no longer a full table replacement
+            full_table = resync and diff_index is None
+            pass_start = start_time
             try:
+                if checkpoint is not None:
+                    LOGGER.info(
+                        f"resuming stream {table.name} window [{checkpoint.start}, {checkpoint.end}) from checkpoint"
+                    )
+                    records = sync(
+                        sf,
+                        stream,
+                        table,
+                        field_names,
+                        checkpoint.start,
+                        checkpoint.end,
+                        checkpoint=checkpoint,
+                        checkpoint_interval=checkpoint_interval,
+                        overlap_filter=overlap_filter,
+                        converter=converter,
+                        diff_index=diff_index,
+                        pipeline=pipeline,
+                    )
+                    run.add_window(checkpoint.start, checkpoint.end, records)
+                    if table.replication_key is None:
+                        # without a replication key the resumed window was a full pass
+                        if diff_index is not None:
+                            write_tombstones(sf, stream, table, diff_index, None, None)
+                            stream.set_stream_state(
+                                table.name, Replication.key, Replication.incremental
+                            )
+                        else:
+                            stream.set_stream_state(
+                                table.name, Replication.key, Replication.full_table
+                            )
+                        if history_size:
+                            record_run(stream, run, history_size, regression_factor)
+                        continue
+                    # everything before the end of the resumed window has been emitted
+                    resumed_until = checkpoint.end - OVERLAP_WINDOW
+                    if resync or resumed_until > start_time:
+                        start_time = resumed_until
+
                 if table.apply_weekly_rule:
+                    from dateutil.rrule import rrule, WEEKLY
+
                     previous_datetime = start_time
 
                     for time_interval in rrule(
@@ -110,18 +400,60 @@ def main_impl():
                             time_interval = end_time
                         if previous_datetime == time_interval:
                             continue
-                        sync(
+                        records = sync(
                             sf,
                             stream,
                             table,
                             field_names,
                             start_time=previous_datetime,
                             end_time=time_interval,
+                            checkpoint_interval=checkpoint_interval,
+                            overlap_filter=overlap_filter,
+                            converter=converter,
+                            diff_index=diff_index,
+                            pipeline=pipeline,
                         )
+                        run.add_window(previous_datetime, time_interval, records)
                         previous_datetime = time_interval
+                    if diff_index is not None:
+                        write_tombstones(sf, stream, table, diff_index, pass_start, end_time)
                 else:
-                    sync(sf, stream, table, field_names, start_time, end_time)
-                    if resync:
+                    # a window with many records is synced in parts, so no query has to read all of them
+                    if count is None and not resync:
+                        # without a probe, the records are estimated from the previous runs
+                        count = expected_records(
+                            stream.get_history(table.name), start_time, end_time
+                        )
+                    parts = [(start_time, end_time)]
+                    if count and probe_split_records and count > probe_split_records:
+                        parts = split_window(
+                            start_time, end_time, -(-count // probe_split_records)
+                        )
+                        LOGGER.info(
+                            f"{table.name} has {count} records to sync, splitting the window in {len(parts)}"
+                        )
+                    for part_start, part_end in parts:
+                        records = sync(
+                            sf,
+                            stream,
+                            table,
+                            field_names,
+                            part_start,
+                            part_end,
+                            checkpoint_interval=checkpoint_interval,
+                            overlap_filter=overlap_filter,
+                            converter=converter,
+                            diff_index=diff_index,
+                            pipeline=pipeline,
+                        )
+                        run.add_window(part_start, part_end, records)
+                    if diff_index is not None:
+                        write_tombstones(sf, stream, table, diff_index, pass_start, end_time)
+                    if overlap_filter is not None and overlap_filter.suppressed:
+                        LOGGER.info(
+                            f"suppressed {overlap_filter.suppressed} records of {table.name} already emitted by the previous run"
+                        )
+                    if full_table:
                         stream.set_stream_state(
                             table.name, Replication.key, Replication.full_table
                         )
@@ -129,6 +461,8 @@ def main_impl():
                         stream.set_stream_state(
                             table.name, Replication.key, Replication.incremental
                         )
+                if history_size:
+                    record_run(stream, run, history_size, regression_factor)
             except requests.exceptions.HTTPError as err:
 
                 url = err.request.url
@@ -152,11 +486,328 @@ def main_impl():
             )
         raise
     finally:
+        stream.close()
+        if pipeline is not None:
+            pipeline.close()
+        sf.discard_prefetched()
+        sf.retries.report()
+        sf.latency.report()
         # write the tables in json format
         if missing_tables:
             raise TapSalesforceMissingTablesException(missing_tables)
 
 
+def table_window(
+    sf: Salesforce, stream: Stream, table: Table, config_start: datetime
+) -> Tuple[datetime, datetime, bool]:
+    """returns the start and end time of the table's sync and whether it resyncs all historical data"""
+    end_time_buffer = timedelta(minutes=3)
+    if sf.instance_url == "https://zi.my.salesforce.com" and table.name == "Campaign":
+        end_time_buffer = timedelta(seconds=-10)
+    end_time = datetime.now(timezone.utc) - end_time_buffer
+
+    state_bookmark = stream.get_stream_state(table.name, table.replication_key)
+    start_time = state_bookmark or config_start
+    if state_bookmark is not None:
+        # Re-read an overlap window to catch late-queryable records.
+        start_time = state_bookmark - OVERLAP_WINDOW
+    resync = table.should_resync_all_historical_data()
+    if resync:
+        if sf.instance_url == "https://zi.my.salesforce.com" and table.name in ["CampaignMember", "Event"]:
+            start_time = FIVE_YEARS_AGO
+        else:
+            start_time = FOUR_YEARS_AGO
+    return start_time, end_time, resync
+
+
+def prefetch_small_tables(
+    sf: Salesforce,
+    stream: Stream,
+    tables: List[Table],
+    selector: "FieldSelector",
+    config_start: datetime,
+    composite_tables: List[str],
+) -> Dict[str, Tuple[datetime, datetime, bool]]:
+    """
+    queries the low volume tables together through composite requests before the sync,
+    returns the windows the prefetched queries were built for
+    """
+    import requests
+
+    windows = {}
+    queries = []
+    for table in tables:
+        if (
+            table.name not in composite_tables
+            or table.not_found
+            or not table.fields
+            or table.apply_weekly_rule
+            or not selector.is_selected(table)
+            or stream.get_bookmark(table.name).get("checkpoint")
+        ):
+            continue
+
+        window = table_window(sf, stream, table, config_start)
+        field_names = [field["name"] for field in selector.select_fields(table)]
+        # the same query get_records builds, so the sync finds the prefetched page
+        field_names, use_tenant_filter = sf.tenant_query(table, field_names, window[0], window[1])
+        windows[table.name] = window
+        queries.append(
+            sf.construct_query(
+                table, field_names, window[0], window[1], use_tenant_filter=use_tenant_filter
+            )
+        )
+
+    if len(queries) < 2:
+        # the tables are probed and queried on their own
+        return {}
+    try:
+        sf.prefetch_queries(queries)
+    except (SalesforceException, requests.exceptions.RequestException) as e:
+        # the tables are queried on their own when they are synced
+        LOGGER.info(f"prefetching small tables failed, querying them one by one: {e}")
+        return {}
+    return windows
+
+
+def split_window(
+    start_time: datetime, end_time: datetime, parts: int
+) -> List[Tuple[datetime, datetime]]:
+    length = (end_time - start_time) / parts
+    return [
+        (start_time + i * length, end_time if i == parts - 1 else start_time + (i + 1) * length)
+        for i in range(parts)
+    ]
+
+
+def probe_changes(
+    sf: Salesforce,
+    stream: Stream,
+    tables: List[Table],
+    selector: "FieldSelector",
+    config_start: datetime,
+    windows: Dict[str, Tuple[datetime, datetime, bool]],
+) -> Dict[str, int]:
+    """
+    counts the records of the incremental tables' sync windows through composite requests
+    before the sync, returns the counts of the probes that succeeded. the windows the probes
+    were built for are added to `windows`, so the tables are synced in the window that was
+    counted.
+    """
+    import requests
+
+    probes = {}
+    for table in tables:
+        if (
+            table.name in windows
+            or table.not_found
+            or not table.fields
+            or table.replication_key is None
+            or not selector.is_selected(table)
+            or stream.get_bookmark(table.name).get("checkpoint")
+        ):
+            continue
+
+        window = table_window(sf, stream, table, config_start)
+        if window[2]:
+            # a resync reads the whole table regardless of what changed
+            continue
+        windows[table.name] = window
+        probes[table.name] = sf.count_query(table, window[0], window[1])
+
+    if not probes:
+        return {}
+
+    try:
+        results = sf.composite_queries(list(probes.values()))
+    except (SalesforceException, requests.exceptions.RequestException) as e:
+        # the probes only save queries, the tables are synced without them
+        LOGGER.info(f"change probes failed, syncing all tables: {e}")
+        return {}
+    counts = {}
+    for name, query in probes.items():
+        if query in results:
+            counts[name] = results[query].get("totalSize", 0)
+    LOGGER.info(
+        f"probed {len(probes)} tables, {sum(1 for count in counts.values() if count == 0)} without changes"
+    )
+    return counts
+
+
+def do_stream(sf: Salesforce, stream: Stream, config: Dict, catalog: Optional[Dict] = None):
+    """writes change data capture events of the streaming tables until the max runtime is reached"""
+    from tap_salesforce.catalog import FieldSelector
+    from tap_salesforce.converter import RecordConverter
+    from tap_salesforce.streaming import (
+        ChangeDataCaptureSync,
+        DEFAULT_STREAMING_TABLES,
+        DEFAULT_STATE_INTERVAL_SECONDS,
+    )
+
+    selector = FieldSelector(catalog, config)
+    streaming_tables = config.get("streaming_tables", DEFAULT_STREAMING_TABLES)
+    config_start = singer_utils.strptime_with_tz(config["start_date"]).astimezone(
+        timezone.utc
+    )
+
+    tables = []
+    fields = {}
+    converters = {}
+    for table in sf.get_tables(
+        config.get("advanced_features_enabled", False),
+        config.get("custom_objects", []),
+        config.get("special_objects", []),
+    ):
+        if table.name not in streaming_tables or table.not_found or not table.fields:
+            continue
+        if not selector.is_selected(table):
+            LOGGER.info(f"skipping stream {table.name} since it is not selected")
+            continue
+
+        selected_fields = selector.select_fields(table)
+        fields[table.name] = [field["name"] for field in selected_fields]
+        if flag(config, "convert_records", True):
+            converters[table.name] = RecordConverter(
+                selected_fields,
+                config.get("compound_fields", "keep"),
+                flag(config, "normalize_types"),
+            )
+        stream.set_table_fields(
+            table.name,
+            converters[table.name].fields if table.name in converters else selected_fields,
+        )
+        tables.append(table)
+
+    if not tables:
+        raise TapSalesforceException(f"none of the streaming tables {streaming_tables} can be synced")
+
+    def repair(table: Table):
+        start_time = config_start
+        if table.replication_key:
+            state_bookmark = stream.get_stream_state(table.name, table.replication_key)
+            if state_bookmark is not None:
+                start_time = state_bookmark - OVERLAP_WINDOW
+        sync(
+            sf,
+            stream,
+            table,
+            fields[table.name],
+            start_time,
+            datetime.now(timezone.utc),
+            converter=converters.get(table.name),
+        )
+
+    max_runtime = config.get("streaming_max_runtime_seconds")
+    try:
+        ChangeDataCaptureSync(
+            sf,
+            stream,
+            tables,
+            fields,
+            repair,
+            state_interval_seconds=int(
+                config.get("streaming_state_interval_seconds")
+                or DEFAULT_STATE_INTERVAL_SECONDS
+            ),
+            converters=converters,
+        ).run(float(max_runtime) if max_runtime else None)
+    finally:
+        stream.close()
+
+
+def do_discover(sf: Salesforce, config: Dict):
+    from tap_salesforce.catalog import FieldSelector, build_catalog
+
+    tables = [
+        table
+        for table in sf.get_tables(
+            config.get("advanced_features_enabled", False),
+            config.get("custom_objects", []),
+            config.get("special_objects", []),
+        )
+        if not table.not_found and table.fields
+    ]
+    catalog = build_catalog(
+        tables, FieldSelector(config=config).select_fields_by_default
+    )
+    json.dump(catalog, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+def build_stream(
+    config: Dict, state: Optional[Dict], output: Optional[TextIO] = None
+) -> Stream:
+    output_mode = config.get("output_mode", "singer")
+    if config.get("journal_dir") and output_mode != "singer":
+        # the records of the other output modes are written to files, not as singer messages
+        raise TapSalesforceException(
+            f"journal_dir is only supported with output_mode 'singer', not '{output_mode}'"
+        )
+
+    stream = _build_output_stream(config, state, output)
+    if config.get("journal_dir"):
+        from tap_salesforce.journal import (
+            Journal,
+            DEFAULT_JOURNAL_MAX_AGE_DAYS,
+            DEFAULT_JOURNAL_MAX_BYTES,
+        )
+
+        stream.journal = Journal(
+            config["journal_dir"],
+            max_age=timedelta(
+                days=float(config.get("journal_max_age_days") or DEFAULT_JOURNAL_MAX_AGE_DAYS)
+            ),
+            max_bytes=int(
+                float(config.get("journal_max_gb") or 0) * 1024 * 1024 * 1024
+                or DEFAULT_JOURNAL_MAX_BYTES
+            ),
+        )
+    return stream
+
+
+def _build_output_stream(
+    config: Dict, state: Optional[Dict], output: Optional[TextIO] = None
+) -> Stream:
+    output_mode = config.get("output_mode", "singer")
+    if output_mode == "singer":
+        return Stream(state, output)
+
+    if output_mode in ("parquet", "arrow"):
+        from tap_salesforce.parquet import (
+            ParquetStream,
+            DEFAULT_ROW_GROUP_SIZE,
+            DEFAULT_PART_MAX_ROWS,
+        )
+
+        return ParquetStream(
+            state,
+            output,
+            output_dir=config.get("output_dir", "."),
+            file_format=output_mode,
+            row_group_size=int(config.get("row_group_size") or DEFAULT_ROW_GROUP_SIZE),
+            compression=config.get("output_compression"),
+            part_max_rows=int(config.get("part_max_rows") or DEFAULT_PART_MAX_ROWS),
+        )
+
+    if output_mode == "batch":
+        from tap_salesforce.batch import (
+            BatchStream,
+            DEFAULT_BATCH_MAX_ROWS,
+            DEFAULT_BATCH_MAX_BYTES,
+        )
+
+        return BatchStream(
+            state,
+            output,
+            output_dir=config.get("output_dir", "."),
+            compression=config.get("batch_compression", "gzip"),
+            max_rows=int(config.get("batch_max_rows") or DEFAULT_BATCH_MAX_ROWS),
+            max_bytes=int(config.get("batch_max_bytes") or DEFAULT_BATCH_MAX_BYTES),
+        )
+
+    raise TapSalesforceException(f"unsupported output_mode: {output_mode}")
+
+
 def sync(
     sf: Salesforce,
     stream: Stream,
@@ -165,20 +816,62 @@ def sync(
     start_time: datetime,
     end_time: datetime,
     limit: Optional[int] = None,
-):
+    checkpoint: Optional["Checkpoint"] = None,
+    checkpoint_interval: Optional[int] = None,
+    overlap_filter: Optional["OverlapFilter"] = None,
+    converter: Optional["RecordConverter"] = None,
+    diff_index: Optional["DiffIndex"] = None,
+    pipeline: Optional["Pipeline"] = None,
+) -> int:
+    """syncs the records of the window, returns the number of records read"""
+    from tap_salesforce.checkpoint import Checkpoint, DEFAULT_CHECKPOINT_INTERVAL
+
+    if checkpoint_interval is None:
+        checkpoint_interval = DEFAULT_CHECKPOINT_INTERVAL
     attempt = 0
     state_value = start_time
+    if checkpoint is None:
+        checkpoint = Checkpoint(start_time, end_time)
+    emitted = 0
     while True:
         try:
+            if pipeline is not None and limit is None and diff_index is None:
+                query = sf.construct_query(table, fields, start_time, end_time)
+                if pipeline.supports(sf, stream, table, query, checkpoint):
+                    emitted += pipeline.sync(
+                        sf,
+                        stream,
+                        table,
+                        query,
+                        checkpoint,
+                        checkpoint_interval,
+                        converter=converter,
+                        overlap_filter=overlap_filter,
+                    )
+                    stream.clear_stream_state(table.name, "checkpoint")
+                    return emitted
+
             for record in sf.get_records(
                 table,
                 fields,
                 start_time,
                 end_date=end_time,
                 limit=limit,
+                checkpoint=checkpoint,
             ):
+                if (
+                    overlap_filter is None
+                    or not overlap_filter.is_duplicate(
+                        record.get("Id"), record[table.replication_key]
+                    )
+                ) and (diff_index is None or diff_index.changed(record)):
+                    stream.write_record(
+                        record if converter is None else converter(record), table.name
+                    )
 
-                stream.write_record(record, table.name)
+                checkpoint.record_emitted(
+                    record, table.replication_key, table.primary_key
+                )
                 if table.replication_key:
                     state_value = datetime.strptime(
                         record[table.replication_key], "%Y-%m-%dT%H:%M:%S.%f%z"
@@ -186,19 +879,81 @@ def sync(
                     stream.set_stream_state(
                         table.name, table.replication_key, state_value
                     )
-            return
+                    if overlap_filter is not None:
+                        overlap_filter.add(
+                            record.get("Id"), record[table.replication_key], state_value
+                        )
+
+                emitted += 1
+                if emitted % checkpoint_interval == 0:
+                    stream.set_stream_state(table.name, "checkpoint", checkpoint.to_dict())
+                    if diff_index is not None:
+                        diff_index.commit()
+                    stream.write_state()
+            stream.clear_stream_state(table.name, "checkpoint")
+            return emitted
         except PrimaryKeyNotMatch:
             attempt += 1
             if attempt <= 10:
                 start_time = state_value
                 LOGGER.info(f"retry {attempt} attempt start from {start_time}")
                 continue
+            stream.set_stream_state(table.name, "checkpoint", checkpoint.to_dict())
+            raise
+        except PipelineError as e:
+            # the regular sync continues from the checkpoint, and shrinks the window on timeouts
+            LOGGER.info(
+                f"pipelined sync of {table.name} failed with {e.error.code}, continuing without the pipeline"
+            )
+            pipeline = None
+            continue
+        except Exception:
+            stream.set_stream_state(table.name, "checkpoint", checkpoint.to_dict())
             raise
         finally:
+            if overlap_filter is not None:
+                for key, value in overlap_filter.to_state().items():
+                    stream.set_stream_state(table.name, key, value)
+            if diff_index is not None:
+                diff_index.commit()
             stream.write_state()
 
 
-def parse_exception(resp: requests.Response) -> Tuple[int, str, str]:
+def write_tombstones(
+    sf: Salesforce,
+    stream: Stream,
+    table: Table,
+    diff_index: "DiffIndex",
+    start_time: Optional[datetime],
+    end_time: Optional[datetime],
+):
+    """writes a deleted record for every Id the finished resync pass did not see"""
+    missing = diff_index.missing(start_time, end_time)
+    if table.replication_key is not None:
+        # a record changed during the pass has moved out of its window, it still exists
+        existing = set()
+        for i in range(0, len(missing), 200):
+            ids = ",".join(f"'{record_id}'" for record_id in missing[i : i + 200])
+            existing.update(
+                record["Id"]
+                for record in sf.paginate(
+                    "GET",
+                    f"/services/data/{sf.api_version}/query/",
+                    params={"q": f"SELECT Id FROM {table.name} WHERE Id IN ({ids})"},
+                )
+            )
+        missing = [record_id for record_id in missing if record_id not in existing]
+
+    deleted_at = datetime.now(timezone.utc)
+    for record_id in missing:
+        stream.write_record(
+            {"Id": record_id, "_sdc_deleted_at": deleted_at.isoformat()}, table.name
+        )
+    # the deleted Ids leave the index with the STATE that covers their tombstones
+    diff_index.finish(missing)
+
+
+def parse_exception(resp: "requests.Response") -> Tuple[int, str, str]:
     data = resp.json()
     err = data[0]
     return resp.status_code, err["message"], err["errorCode"]
@@ -0,0 +1,150 @@
+import os
+import gzip
+from datetime import datetime, timezone
+from typing import Dict, Optional, TextIO
+
+import singer
+
+from tap_salesforce.stream import Stream
+from tap_salesforce.exceptions import TapSalesforceException
+
+LOGGER = singer.get_logger()
+
+DEFAULT_BATCH_MAX_ROWS = 100000
+DEFAULT_BATCH_MAX_BYTES = 256 * 1024 * 1024
+
+COMPRESSIONS = {"gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}
+
+
+class _Part:
+    """a single compressed jsonl part file that records are appended to"""
+
+    def __init__(self, path: str, compression: str):
+        self.path = path
+        self.rows = 0
+        self.bytes = 0
+
+        if compression == "gzip":
+            self._file = gzip.open(path, "wb", compresslevel=6)
+        else:
+            try:
+                import zstandard
+            except ImportError:
+                raise TapSalesforceException(
+                    "batch_compression 'zstd' requires zstandard: pip install tap-salesforce[zstd]"
+                )
+            self._raw = open(path, "wb")
+            self._file = zstandard.ZstdCompressor().stream_writer(self._raw)
+
+    def write(self, line: bytes):
+        self._file.write(line)
+        self.rows += 1
+        self.bytes += len(line)
+
+    def close(self):
+        self._file.close()
+        if hasattr(self, "_raw"):
+            self._raw.close()
+
+
+class BatchStream(Stream):
+    """
+    writes records to rotating compressed jsonl part files per stream instead of stdout.
+    every finished part is announced with a singer BATCH message carrying its manifest.
+
+    parts stay open across STATE messages until they reach the rotation size. a STATE is
+    held back until the parts with the records it covers are finished, it is emitted after
+    their BATCH messages.
+    """
+
+    def __init__(
+        self,
+        state: Optional[Dict] = None,
+        output: Optional[TextIO] = None,
+        output_dir: str = ".",
+        compression: str = "gzip",
+        max_rows: int = DEFAULT_BATCH_MAX_ROWS,
+        max_bytes: int = DEFAULT_BATCH_MAX_BYTES,
+    ):
+        super().__init__(state, output)
+
+        if compression not in COMPRESSIONS:
+            raise TapSalesforceException(
+                f"unsupported batch_compression {compression}, expected one of {list(COMPRESSIONS)}"
+            )
+        if max_rows < 1 or max_bytes < 1:
+            raise TapSalesforceException(
+                f"invalid batch rotation: max rows ({max_rows}) and max bytes ({max_bytes}) must be greater than 0"
+            )
+
+        self.output_dir = output_dir
+        self.compression = compression
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self._run_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        self._parts: Dict[str, _Part] = {}
+        self._part_numbers: Dict[str, int] = {}
+        # the last STATE, until the parts with the records it covers are finished
+        self._pending_state: Optional[Dict] = None
+
+    def write_record(self, record: Dict, stream_id: str, file: Optional[TextIO] = None):
+        part = self._parts.get(stream_id)
+        if part is None:
+            part = self._open(stream_id)
+
+        part.write(self.serialize(record).encode("utf-8") + b"\n")
+
+        if part.rows >= self.max_rows or part.bytes >= self.max_bytes:
+            self._finish_parts(file)
+
+    def write_state(self, file: Optional[TextIO] = None):
+        self._pending_state = self.get_state()
+        if not self._parts:
+            self._write_pending_state(file)
+
+    def close(self):
+        self._finish_parts(None)
+        super().close()
+
+    def _open(self, stream_id: str) -> _Part:
+        directory = os.path.join(self.output_dir, stream_id)
+        os.makedirs(directory, exist_ok=True)
+
+        number = self._part_numbers.get(stream_id, 0)
+        self._part_numbers[stream_id] = number + 1
+        path = os.path.abspath(
+            os.path.join(
+                directory,
+                f"{stream_id}-{self._run_id}-{number:05d}{COMPRESSIONS[self.compression]}",
+            )
+        )
+
+        part = _Part(path, self.compression)
+        self._parts[stream_id] = part
+        return part
+
+    def _finish_parts(self, file: Optional[TextIO]):
+        # a STATE covers the records of every stream, so all open parts are finished
+        for stream_id in list(self._parts):
+            self._finish(stream_id, file)
+        self._write_pending_state(file)
+
+    def _write_pending_state(self, file: Optional[TextIO]):
+        if self._pending_state is not None:
+            self.write_message(dict(type="STATE", value=self._pending_state), file=file)
+            self._pending_state = None
+
+    def _finish(self, stream_id: str, file: Optional[TextIO]):
+        part = self._parts.pop(stream_id)
+        part.close()
+        LOGGER.info(f"wrote {part.rows} records of {stream_id} to {part.path}")
+
+        self.write_message(
+            dict(
+                type="BATCH",
+                stream=stream_id,
+                encoding=dict(format="jsonl", compression=self.compression),
+                manifest=[f"file://{part.path}"],
+            ),
+            file=file,
+        )
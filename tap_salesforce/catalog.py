@@ -0,0 +1,206 @@
+from typing import Dict, List, Optional, Iterable
+
+import singer
+
+from tap_salesforce.client import Table
+from tap_salesforce.config import flag
+
+LOGGER = singer.get_logger()
+
+# describe types of compound fields, their values are also available as separate component fields
+COMPOUND_TYPES = {"address", "location"}
+
+# the components of the values of compound fields, with the describe type of each component
+COMPOUND_COMPONENTS = {
+    "address": {
+        "street": "textarea",
+        "city": "string",
+        "state": "string",
+        "stateCode": "picklist",
+        "postalCode": "string",
+        "country": "string",
+        "countryCode": "picklist",
+        "latitude": "double",
+        "longitude": "double",
+        "geocodeAccuracy": "picklist",
+    },
+    "location": {"latitude": "double", "longitude": "double"},
+}
+
+STRING_TYPES = {
+    "id",
+    "string",
+    "reference",
+    "picklist",
+    "multipicklist",
+    "textarea",
+    "phone",
+    "url",
+    "email",
+    "combobox",
+    "encryptedstring",
+    "base64",
+    "time",
+}
+
+
+def field_schema(field: Dict) -> Dict:
+    """returns the json schema of a salesforce describe field"""
+    field_type = field.get("type")
+
+    if field_type in STRING_TYPES:
+        return {"type": ["null", "string"]}
+    if field_type == "boolean":
+        return {"type": ["null", "boolean"]}
+    if field_type in ("int", "long"):
+        return {"type": ["null", "integer"]}
+    if field_type in ("double", "currency", "percent"):
+        return {"type": ["null", "number"]}
+    if field_type == "date":
+        return {"anyOf": [{"type": "string", "format": "date"}, {"type": ["string", "null"]}]}
+    if field_type == "datetime":
+        return {"anyOf": [{"type": "string", "format": "date-time"}, {"type": ["string", "null"]}]}
+    if field_type in COMPOUND_TYPES:
+        return {"type": ["null", "object"], "additionalProperties": True}
+    return {}
+
+
+def automatic_fields(table: Table) -> List[str]:
+    return [name for name in ("Id", table.primary_key, table.replication_key) if name]
+
+
+def build_catalog(tables: Iterable[Table], select_fields_by_default: bool = True) -> Dict:
+    streams = []
+    for table in tables:
+        automatic = set(automatic_fields(table))
+
+        table_metadata = {"selected": True}
+        if table.primary_key:
+            table_metadata["table-key-properties"] = [table.primary_key]
+        if table.replication_key:
+            table_metadata["valid-replication-keys"] = [table.replication_key]
+            table_metadata["forced-replication-method"] = "INCREMENTAL"
+        else:
+            table_metadata["forced-replication-method"] = "FULL_TABLE"
+
+        metadata = [{"breadcrumb": [], "metadata": table_metadata}]
+        properties = {}
+        for field in table.fields:
+            name = field["name"]
+            properties[name] = field_schema(field)
+            metadata.append(
+                {
+                    "breadcrumb": ["properties", name],
+                    "metadata": {
+                        "inclusion": "automatic" if name in automatic else "available",
+                        "selected-by-default": select_fields_by_default,
+                    },
+                }
+            )
+
+        streams.append(
+            {
+                "tap_stream_id": table.name,
+                "stream": table.name,
+                "schema": {
+                    "type": "object",
+                    "additionalProperties": False,
+                    "properties": properties,
+                },
+                "metadata": metadata,
+            }
+        )
+
+    return {"streams": streams}
+
+
+class FieldSelector:
+    """
+    decides which tables are synced and which of their describe fields are queried,
+    based on an optional catalog and the field exclusion policies from the config:
+
+    - exclude_compound_fields: drop address/location fields, their components are kept
+    - exclude_formula_fields: drop calculated (formula) fields
+    - exclude_deprecated_fields: drop fields that are deprecated and hidden
+    - exclude_fields: {"Table": ["Field", ...]} fields to never query
+
+    the primary key, replication key and Id are always selected.
+    """
+
+    def __init__(self, catalog: Optional[Dict] = None, config: Optional[Dict] = None):
+        config = config or {}
+        self.select_fields_by_default = flag(config, "select_fields_by_default", True)
+        self.exclude_compound_fields = flag(config, "exclude_compound_fields")
+        self.exclude_formula_fields = flag(config, "exclude_formula_fields")
+        self.exclude_deprecated_fields = flag(config, "exclude_deprecated_fields")
+        self.exclude_fields: Dict[str, List[str]] = config.get("exclude_fields") or {}
+
+        self._streams: Optional[Dict[str, Dict]] = None
+        if catalog is not None:
+            self._streams = {
+                stream["tap_stream_id"]: stream for stream in catalog.get("streams", [])
+            }
+
+    def is_selected(self, table: Table) -> bool:
+        if self._streams is None:
+            return True
+
+        stream = self._streams.get(table.name)
+        if stream is None:
+            return False
+
+        table_metadata = _metadata_map(stream).get((), {})
+        return bool(
+            table_metadata.get("selected", stream.get("schema", {}).get("selected", False))
+        )
+
+    def select_fields(self, table: Table) -> List[Dict]:
+        """returns the describe fields of the table that should be queried"""
+        automatic = set(automatic_fields(table))
+        excluded = set(self.exclude_fields.get(table.name, []))
+
+        field_metadata = {}
+        if self._streams is not None and table.name in self._streams:
+            field_metadata = _metadata_map(self._streams[table.name])
+
+        selected = []
+        for field in table.fields:
+            name = field["name"]
+            if name in automatic:
+                selected.append(field)
+                continue
+            if name in excluded:
+                continue
+            if self.exclude_compound_fields and field.get("type") in COMPOUND_TYPES:
+                continue
+            if self.exclude_formula_fields and field.get("calculated"):
+                continue
+            if self.exclude_deprecated_fields and field.get("deprecatedAndHidden"):
+                continue
+
+            metadata = field_metadata.get(("properties", name))
+            if metadata is None:
+                # fields that are new since the catalog was discovered
+                is_selected = self.select_fields_by_default
+            elif metadata.get("inclusion") == "unsupported":
+                is_selected = False
+            else:
+                is_selected = metadata.get(
+                    "selected", metadata.get("selected-by-default", False)
+                )
+
+            if is_selected:
+                selected.append(field)
+
+        if len(selected) < len(table.fields):
+            LOGGER.info(
+                f"selected {len(selected)} of {len(table.fields)} fields for stream {table.name}"
+            )
+        return selected
+
+
+def _metadata_map(stream: Dict) -> Dict:
+    return {
+        tuple(entry.get("breadcrumb", [])): entry.get("metadata", {})
+        for entry in stream.get("metadata", [])
+    }
@@ -0,0 +1,89 @@
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional, Tuple
+
+DEFAULT_CHECKPOINT_INTERVAL = 10000
+
+
+class Checkpoint:
+    """
+    tracks how far into a sync window records have been emitted, so an interrupted
+    window can be continued instead of replayed:
+
+    - cursor / offset: the locator url of the page that is being emitted and how many of
+      its records were emitted, only tracked when records come from a single paginator
+    - after: the last emitted (replication key, primary key) pair, used to build a
+      `(key, Id) >` predicate once the cursor has expired
+    - inclusive: whether `after` itself may not have been emitted yet, which is the case
+      for the low watermark of the merge buffer
+    """
+
+    start: datetime
+    end: datetime
+    cursor: Optional[str] = None
+    offset: int = 0
+    inclusive: bool = False
+
+    _last: Optional[Tuple[str, Optional[str]]] = None
+    _watermark: Optional[Callable[[], Optional[Tuple[str, Optional[str]]]]] = None
+
+    def __init__(self, start: datetime, end: datetime):
+        self.start = start
+        self.end = end
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict]) -> Optional["Checkpoint"]:
+        if not data:
+            return None
+
+        checkpoint = cls(_parse_datetime(data["start"]), _parse_datetime(data["end"]))
+        checkpoint.cursor = data.get("cursor")
+        checkpoint.offset = data.get("offset", 0)
+        checkpoint.inclusive = data.get("inclusive", False)
+        if data.get("after"):
+            checkpoint._last = tuple(data["after"])
+        return checkpoint
+
+    def to_dict(self) -> Dict[str, Any]:
+        after = self.after
+        return {
+            "start": self.start.isoformat(),
+            "end": self.end.isoformat(),
+            "cursor": self.cursor,
+            "offset": self.offset,
+            "after": list(after) if after else None,
+            "inclusive": self.inclusive,
+        }
+
+    @property
+    def after(self) -> Optional[Tuple[str, Optional[str]]]:
+        if self._watermark is not None:
+            return self._watermark()
+        return self._last
+
+    def set_cursor(self, cursor: Optional[str], offset: int):
+        self.cursor = cursor
+        self.offset = offset
+
+    def set_watermark(self, watermark: Callable[[], Optional[Tuple[str, Optional[str]]]]):
+        """the merge path emits records out of order, so it reports a low watermark instead"""
+        self._watermark = watermark
+        self.cursor = None
+        self.inclusive = True
+
+    def record_emitted(self, record: Dict, replication_key: Optional[str], primary_key: Optional[str]):
+        self.offset += 1
+        if replication_key is None or self._watermark is not None:
+            return
+        self._last = (record[replication_key], record.get(primary_key) if primary_key else None)
+        self.inclusive = False
+
+    def expire_cursor(self):
+        self.cursor = None
+        self.offset = 0
+
+
+def _parse_datetime(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
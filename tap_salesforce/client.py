@@ -1,8 +1,11 @@
-from typing import Any, Optional, Dict, List, Iterator
+from typing import Optional, Dict, List, Iterator, Tuple
 from datetime import datetime, timedelta
-from collections import OrderedDict
 import re
-import backoff
+import time
+import itertools
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlencode
 from pydantic.main import BaseModel
 
 
@@ -11,10 +14,6 @@ import requests
 
 from tap_salesforce.exceptions import (
     SalesforceException,
-    SalesforceFunctionalityTemporarilyUnavailableException,
-    SalesforceUnexpectedException,
-    SalesforceQueryTimeoutException,
-    SalesforceSessionExpiredException,
     TapSalesforceOauthException,
     TapSalesforceQuotaExceededException,
     TapSalesforceInvalidCredentialsException,
@@ -22,8 +21,28 @@ from tap_salesforce.exceptions import (
     build_salesforce_exception,
 )
 from tap_salesforce.metrics import Metrics
+from tap_salesforce.checkpoint import Checkpoint
+from tap_salesforce.query_plan import QueryPlanAdvisor, filter_records
+from tap_salesforce.retry import RetryEngine, SESSION_CODES
+from tap_salesforce.memory import GOVERNOR, OK as MEMORY_OK, SpillBuffer, row_bytes
+from tap_salesforce.rows import FieldIndex, pack_page, unpack_page
+from tap_salesforce.latency import (
+    LatencyTracker,
+    DEFAULT_TIMEOUTS,
+    HEDGE_FACTOR,
+    MIN_HEDGE_DELAY_SECONDS,
+    LOGIN,
+    QUERY,
+    endpoint,
+)
 
 MAX_QUERY_LENGTH = 10000
+# the composite api accepts at most 25 subrequests per call
+COMPOSITE_MAX_SUBREQUESTS = 25
+# merged records between checks of the memory pressure
+_MEMORY_CHECK_INTERVAL = 1000
+
+_page_buffers = itertools.count()
 
 
 LOGGER = singer.get_logger()
@@ -36,12 +55,6 @@ QUOTA_PERCENT_FOR_INSTANCE_URL = {
 DEFAULT_QUOTA_PERCENT_TOTAL = 80.0
 DEFAULT_QUOTA_PERCENT_PER_RUN = 25.0
 
-def log_backoff_attempt(details):
-    LOGGER.info(
-        "ConnectionError detected, triggering backoff: %d try", details.get("tries")
-    )
-
-
 class Table(BaseModel):
     name: str
     primary_key: Optional[str]
@@ -71,11 +84,13 @@ class PrimaryKeyNotMatch(Exception):
     pass
 
 
+# tables some customers sync besides the default ones, as the keyword arguments of their
+# Table, the models are only built for the instance that is synced
 LEGACY_CUSTOMER_OBJECTS = {
-    "https://imanage.my.salesforce.com": [Table(name="OpportunityLineItem")],
+    "https://imanage.my.salesforce.com": [dict(name="OpportunityLineItem")],
     "https://leica.my.salesforce.com": [
-        Table(name="OpportunityLineItem"),
-        Table(
+        dict(name="OpportunityLineItem"),
+        dict(
             name="CurrencyType",
             replication_key="SystemModstamp",
             primary_key="Id",
@@ -83,24 +98,24 @@ LEGACY_CUSTOMER_OBJECTS = {
         ),
     ],
     "https://parloagmbh.my.salesforce.com": [
-        Table(name="Case", replication_key="SystemModstamp", primary_key="Id"),
+        dict(name="Case", replication_key="SystemModstamp", primary_key="Id"),
     ],
     "https://superside.my.salesforce.com": [
-        Table(name="Revenue_Lifecycle__c", replication_key="SystemModstamp"),
-        Table(
+        dict(name="Revenue_Lifecycle__c", replication_key="SystemModstamp"),
+        dict(
             name="TrulyActivity__Truly_Activity__c",
             replication_key="SystemModstamp",
         ),
     ],
     "https://rwsholdings.my.salesforce.com": [
-        Table(
+        dict(
             name="Task_Milestone__c",
             replication_key="SystemModstamp",
             primary_key="Id",
         )
     ],
     "https://pigment.my.salesforce.com": [
-        Table(
+        dict(
             name="Engagement__c",
             replication_key="SystemModstamp",
             primary_key="Id",
@@ -108,7 +123,7 @@ LEGACY_CUSTOMER_OBJECTS = {
         )
     ],
     "https://misys.my.salesforce.com": [
-        Table(
+        dict(
             name="Opportunity_By_BU__c",
             replication_key="SystemModstamp",
             primary_key="Id",
@@ -116,7 +131,7 @@ LEGACY_CUSTOMER_OBJECTS = {
         )
     ],
     "https://wunderkind.my.salesforce.com": [
-        Table(
+        dict(
             name="Field_Reports__c",
             replication_key="SystemModstamp",
             primary_key="Id",
@@ -124,7 +139,7 @@ LEGACY_CUSTOMER_OBJECTS = {
         )
     ],
     "https://cognism.my.salesforce.com": [
-        Table(
+        dict(
             name="Organisation__c",
             replication_key="SystemModstamp",
             primary_key="Id",
@@ -132,17 +147,38 @@ LEGACY_CUSTOMER_OBJECTS = {
         )
     ],
     "https://woodmac.my.salesforce.com": [
-        Table(name="OpportunityLineItem", should_sync_fields=True)
+        dict(name="OpportunityLineItem", should_sync_fields=True)
     ],
     "https://criteo.my.salesforce.com": [
-        Table(name="AccountContactRelation", replication_key="SystemModstamp")
+        dict(name="AccountContactRelation", replication_key="SystemModstamp")
     ],
     "https://cepheid.my.salesforce.com": [
-        Table(name="Product2", replication_key="SystemModstamp")
+        dict(name="Product2", replication_key="SystemModstamp")
     ],
 }
 
 
+# some customers only share part of their org, their tables are limited by a field IN (...) predicate
+TENANT_FILTERS = {
+    ("https://squareinc.my.salesforce.com", "Account"): (
+        "Business_Unit__c",
+        ("Afterpay", "afterpay"),
+    ),
+    ("https://squareinc.my.salesforce.com", "Contact"): (
+        "Business_Unit__c",
+        ("Afterpay", "afterpay"),
+    ),
+    ("https://squareinc.my.salesforce.com", "Lead"): (
+        "Business_Unit__c",
+        ("Afterpay", "afterpay"),
+    ),
+    ("https://squareinc.my.salesforce.com", "Opportunity"): (
+        "Opportunity_Record_Type_Name__c",
+        ("AP Global SMB", "AP Global Enterprise"),
+    ),
+}
+
+
 class Salesforce:
     client_id: str
     client_secret: str
@@ -150,11 +186,20 @@ class Salesforce:
     quota_percent_total: float
     quota_percent_per_run: float
     is_sandbox: bool
-    instance_url: Optional[str] = None
+    query_plan_advisor: Optional[QueryPlanAdvisor] = None
+    retries: RetryEngine
+    latency: LatencyTracker
+    hedge_budget: int = 0
+    hedges: int = 0
 
     _access_token: Optional[str] = None
+    _instance_url: Optional[str] = None
+    _login_thread: Optional[threading.Thread] = None
+    _login_error: Optional[Exception] = None
     _token_expiration_time: Optional[datetime] = None
     _metrics_http_requests: int = 0
+    _metrics_bytes: int = 0
+    _metrics_timeouts: int = 0
     _metrics: Metrics
 
     # CONSTANTS
@@ -169,6 +214,11 @@ class Salesforce:
         quota_percent_total: float = DEFAULT_QUOTA_PERCENT_TOTAL,
         quota_percent_per_run: float = DEFAULT_QUOTA_PERCENT_PER_RUN,
         is_sandbox: bool = False,
+        session: Optional[requests.Session] = None,
+        retries: Optional[RetryEngine] = None,
+        timeouts: Optional[Dict[str, Tuple[float, float]]] = None,
+        hedge_budget: int = 0,
+        login_async: bool = False,
     ):
         self.refresh_token = refresh_token
         self.client_id = client_id
@@ -177,8 +227,21 @@ class Salesforce:
 
         self.quota_percent_total = quota_percent_total
         self.quota_percent_per_run = quota_percent_per_run
-
-        self.session = requests.Session()
+        self._configured_quota_percent_total = quota_percent_total
+        self._configured_quota_percent_per_run = quota_percent_per_run
+
+        self.session = session or requests.Session()
+        self.retries = retries or RetryEngine()
+        # (connect, read) timeouts of every endpoint class
+        self.timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+        self.latency = LatencyTracker()
+        # slow query pages requested a second time, at most `hedge_budget` per run
+        self.hedge_budget = hedge_budget
+        self.hedges = 0
+        self._hedge_pool: Optional[ThreadPoolExecutor] = None
+        # first result pages of queries fetched ahead through the composite api, with the name
+        # of their memory governor buffer
+        self._prefetched: Dict[str, Tuple[str, Tuple[FieldIndex, Dict]]] = {}
 
         self._metrics = Metrics(
             "used %.2f%% of daily Salesforce REST API Quota",
@@ -186,7 +249,57 @@ class Salesforce:
             logger=LOGGER,
         )
 
-        self._login()
+        if login_async:
+            # the caller parses its config and state while the login request is in flight,
+            # everything that needs the token or the instance url waits for it
+            self._login_thread = threading.Thread(
+                target=self._login_in_background, name="salesforce-login", daemon=True
+            )
+            self._login_thread.start()
+        else:
+            self._login()
+
+    @property
+    def instance_url(self) -> Optional[str]:
+        self.wait_for_login()
+        return self._instance_url
+
+    @instance_url.setter
+    def instance_url(self, instance_url: Optional[str]):
+        self._instance_url = instance_url
+
+    @property
+    def api_version(self) -> str:
+        return self._API_VERSION
+
+    def metrics(self) -> Dict[str, int]:
+        """returns a snapshot of the request counters of the client"""
+        return {
+            "requests": self._metrics_http_requests,
+            "pages": self.latency.requests(QUERY),
+            "bytes": self._metrics_bytes,
+            "timeouts": self._metrics_timeouts,
+        }
+
+    def wait_for_login(self):
+        """waits for a login started in the background, raising its error when it failed"""
+        thread = self._login_thread
+        if thread is None or thread is threading.current_thread():
+            return
+        thread.join()
+        self._login_thread = None
+        if self._login_error is not None:
+            raise self._login_error
+
+    def expire_session(self):
+        """makes the next request log in again, e.g. after the server rejected the token"""
+        self._token_expiration_time = None
+
+    def _login_in_background(self):
+        try:
+            self._login()
+        except Exception as err:
+            self._login_error = err
 
     def get_tables(
         self, advanced_features_enabled=False, custom_objects=[], special_objects=[]
@@ -277,8 +390,8 @@ class Salesforce:
         elif self.instance_url in LEGACY_CUSTOMER_OBJECTS:
             existing_names = {t.name for t in selected_tables}
             selected_tables.extend(
-                t for t in LEGACY_CUSTOMER_OBJECTS[self.instance_url]
-                if t.name not in existing_names
+                Table(**obj) for obj in LEGACY_CUSTOMER_OBJECTS[self.instance_url]
+                if obj["name"] not in existing_names
             )
 
         selected_tables.append(
@@ -304,6 +417,7 @@ class Salesforce:
                     raise e
 
     def describe(self, table: str) -> Dict:
+        self.retries.table = table
         try:
             resp = self._make_request(
                 "GET", f"/services/data/{self._API_VERSION}/sobjects/{table}/describe/"
@@ -352,6 +466,9 @@ class Salesforce:
         start_date: datetime,
         end_date: Optional[datetime] = None,
         limit: Optional[int] = None,
+        after: Optional[Tuple[str, Optional[str]]] = None,
+        inclusive: bool = False,
+        use_tenant_filter: bool = True,
     ):
         replication_key = table.replication_key
         primary_key = table.primary_key
@@ -367,16 +484,13 @@ class Salesforce:
             where_stm += (
                 f" AND {replication_key} < {end_date.strftime('%Y-%m-%dT%H:%M:%SZ')} "
             )
-            if (
-                self.instance_url == "https://squareinc.my.salesforce.com"
-                and table.name in ["Account", "Contact", "Lead"]
-            ):
-                where_stm += f" AND (Business_Unit__c IN ('Afterpay','afterpay')) "
-            elif (
-                self.instance_url == "https://squareinc.my.salesforce.com"
-                and table.name in ["Opportunity"]
-            ):
-                where_stm += f" AND (Opportunity_Record_Type_Name__c IN ('AP Global SMB','AP Global Enterprise')) "
+            if after is not None:
+                where_stm += self._after_predicate(table, after, inclusive)
+            tenant_filter = self.tenant_filter(table)
+            if tenant_filter is not None and use_tenant_filter:
+                field, values = tenant_filter
+                values_stm = ",".join(f"'{value}'" for value in values)
+                where_stm += f" AND ({field} IN ({values_stm})) "
 
             order_by_stm = f"ORDER BY {replication_key} ASC "
             if primary_key:
@@ -392,6 +506,61 @@ class Salesforce:
         query = f"{select_stm} {from_stm} {where_stm} {order_by_stm} {limit_stm}"
         return query
 
+    def count_query(self, table: Table, start_date: datetime, end_date: datetime) -> str:
+        """returns the query counting the records of a table's sync window"""
+        query = (
+            f"SELECT COUNT() FROM {table.name} "
+            f"WHERE {table.replication_key} >= {start_date.strftime('%Y-%m-%dT%H:%M:%SZ')} "
+            f"AND {table.replication_key} < {end_date.strftime('%Y-%m-%dT%H:%M:%SZ')}"
+        )
+        tenant_filter = self.tenant_filter(table)
+        if tenant_filter is not None:
+            field, values = tenant_filter
+            values_stm = ",".join(f"'{value}'" for value in values)
+            query += f" AND ({field} IN ({values_stm}))"
+        return query
+
+    def tenant_query(
+        self, table: Table, fields: List[str], start_date: datetime, end_date: Optional[datetime]
+    ) -> Tuple[List[str], bool]:
+        """
+        returns the fields to query and whether the tenant predicate stays in the query. when
+        the query plan advisor moves the predicate out of the query, the tenant field is added
+        to the fields so the records can be filtered after querying them.
+        """
+        if self.query_plan_advisor is None:
+            return fields, True
+        use_tenant_filter = self.query_plan_advisor.use_tenant_filter(
+            table, fields, start_date, end_date
+        )
+        if not use_tenant_filter:
+            field = self.tenant_filter(table)[0]
+            if field not in fields:
+                fields = fields + [field]
+        return fields, use_tenant_filter
+
+    def tenant_filter(self, table: Table) -> Optional[Tuple[str, Tuple[str, ...]]]:
+        """returns the (field, values) predicate that limits a table to part of the org"""
+        return TENANT_FILTERS.get((self.instance_url, table.name))
+
+    def _after_predicate(
+        self, table: Table, after: Tuple[str, Optional[str]], inclusive: bool
+    ) -> str:
+        """continues a window after an already emitted (replication key, primary key) pair"""
+        key, pk = after
+        key = datetime.strptime(key, "%Y-%m-%dT%H:%M:%S.%f%z").strftime(
+            "%Y-%m-%dT%H:%M:%SZ"
+        )
+        replication_key = table.replication_key
+        if table.primary_key and pk:
+            operator = ">=" if inclusive else ">"
+            return (
+                f" AND ({replication_key} > {key} OR "
+                f"({replication_key} = {key} AND {table.primary_key} {operator} '{pk}')) "
+            )
+        # without a primary key in the sort order, ties on the replication key are re-read
+        return f" AND {replication_key} >= {key} "
+
     def field_chunker(self, fields: List[str], size: int) -> Iterator[List[str]]:
         field_chunk = []
         length = 0
@@ -406,56 +575,79 @@ class Salesforce:
                 length = 0
 
     def merge_records(
-        self, paginators: List[Iterator[Dict]], table: Table
+        self,
+        paginators: List[Iterator[Dict]],
+        table: Table,
+        checkpoint: Optional[Checkpoint] = None,
+        fields: Optional[List[str]] = None,
     ) -> Iterator[Dict]:
         """
         Merge records from multiple paginators by primary key.
-        Uses a bounded buffer to limit memory usage.
+        Uses a bounded buffer of compact rows to limit memory usage.
         """
         pk_field = table.primary_key
+        rk_field = table.replication_key
         # Bounded buffer: when it reaches this size, yield oldest record
         max_buffer_size = 10000
-        merged_records: OrderedDict[str, Any] = OrderedDict()
+        # spilled to disk when the process is close to its memory budget
+        merged_records = SpillBuffer(rk_field, FieldIndex(fields or []))
+        buffer_name = f"merge buffer {next(_page_buffers)}"
+        merged = 0
 
         # Track active paginators
         active_paginators = list(range(len(paginators)))
+        last_read: Dict[int, Tuple[str, str]] = {}
+
+        def watermark() -> Optional[Tuple[str, str]]:
+            # every record that has not been yielded yet is either buffered or sorts
+            # after the last record read by each active paginator
+            if rk_field is None:
+                return None
+            if any(idx not in last_read for idx in active_paginators):
+                return None
+            pairs = [last_read[idx] for idx in active_paginators]
+            pairs.extend(merged_records.pairs())
+            return min(pairs) if pairs else None
+
+        if checkpoint is not None:
+            checkpoint.set_watermark(watermark)
+
+        try:
+            while active_paginators:
+                # Process one record from each active paginator
+                for paginator_idx in active_paginators[:]:  # Copy list to allow modification
+                    try:
+                        record = next(paginators[paginator_idx])
+                        pk = record[pk_field]
+                        if rk_field is not None:
+                            last_read[paginator_idx] = (record[rk_field], pk)
+
+                        # Merge into buffer, moves the record to the end (LRU order)
+                        merged_records.merge(pk, record)
+                        merged += 1
+
+                    except StopIteration:
+                        # This paginator is exhausted
+                        active_paginators.remove(paginator_idx)
+
+                if merged >= _MEMORY_CHECK_INTERVAL:
+                    merged = 0
+                    GOVERNOR.track(buffer_name, merged_records.memory_bytes())
+                    if GOVERNOR.pressure() != MEMORY_OK:
+                        merged_records.spill()
+                        GOVERNOR.track(buffer_name, 0)
+
+                # If buffer is too large, yield oldest record so we are certain that we have merged from all paginators
+                while len(merged_records) > max_buffer_size:
+                    yield merged_records.pop_oldest()
+
+            # Yield all remaining records
+            while merged_records:
+                yield merged_records.pop_oldest()
+        finally:
+            GOVERNOR.track(buffer_name, 0)
+            merged_records.close()
 
-        while active_paginators:
-            # Process one record from each active paginator
-            for paginator_idx in active_paginators[:]:  # Copy list to allow modification
-                try:
-                    record = next(paginators[paginator_idx])
-                    pk = record[pk_field]
-
-                    # Merge into buffer
-                    if pk not in merged_records:
-                        merged_records[pk] = {}
-                    merged_records[pk].update(record)
-
-                    # Move to end (LRU order)
-                    merged_records.move_to_end(pk)
-
-                except StopIteration:
-                    # This paginator is exhausted
-                    active_paginators.remove(paginator_idx)
-
-            # If buffer is too large, yield oldest record so we are certain that we have merged from all paginators
-            while len(merged_records) > max_buffer_size:
-                pk, record = merged_records.popitem(last=False)  # Remove oldest
-                yield record
-
-        # Yield all remaining records
-        while merged_records:
-            pk, record = merged_records.popitem(last=False)
-            yield record
-
-    @backoff.on_exception(
-        backoff.expo,
-        (PrimaryKeyNotMatch),
-        max_tries=5,
-        factor=2,
-        on_backoff=log_backoff_attempt,
-    )
     def get_records(
         self,
         table: Table,
@@ -464,16 +656,46 @@ class Salesforce:
         end_date: Optional[datetime] = None,
         limit: Optional[int] = None,
         shrink_window_factor: int = 2,
+        checkpoint: Optional[Checkpoint] = None,
     ):
-        query = self.construct_query(table, fields, start_date, end_date, limit)
+        self.retries.table = table.name
+        tenant_filter = self.tenant_filter(table)
+        query_fields, use_tenant_filter = self.tenant_query(table, fields, start_date, end_date)
+        # the tenant field is only queried to filter the records, it is not emitted
+        strip_tenant_field = len(query_fields) > len(fields)
+        fields = query_fields
+
         try:
+            after, inclusive = None, False
+            if checkpoint is not None:
+                if checkpoint.cursor:
+                    records = self._resume_cursor(checkpoint)
+                    if not use_tenant_filter:
+                        records = filter_records(records, tenant_filter, strip_tenant_field)
+                    yield from records
+                after, inclusive = checkpoint.after, checkpoint.inclusive
+
+            query = self.construct_query(
+                table,
+                fields,
+                start_date,
+                end_date,
+                limit,
+                after,
+                inclusive,
+                use_tenant_filter,
+            )
             if len(query) <= MAX_QUERY_LENGTH:
                 LOGGER.info(query)
-                yield from self._paginate(
+                records = self._paginate(
                     "GET",
                     f"/services/data/{self._API_VERSION}/queryAll/",
                     params={"q": query},
+                    checkpoint=checkpoint,
                 )
+                if not use_tenant_filter:
+                    records = filter_records(records, tenant_filter, strip_tenant_field)
+                yield from records
             elif table.primary_key:
                 LOGGER.info(f"query too long {len(query)}, split into subqueries")
                 paginators = []
@@ -486,6 +708,9 @@ class Salesforce:
                         start_date,
                         end_date,
                         limit,
+                        after,
+                        inclusive,
+                        use_tenant_filter,
                     )
                     LOGGER.info(query)
                     paginators.append(
@@ -496,7 +721,10 @@ class Salesforce:
                         )
                     )
 
-                yield from self.merge_records(paginators, table)
+                records = self.merge_records(paginators, table, checkpoint, fields)
+                if not use_tenant_filter:
+                    records = filter_records(records, tenant_filter, strip_tenant_field)
+                yield from records
             else:
                 raise QueryLengthExceedLimit(
                     f"query length for table {table.name} is too long. The limit is {MAX_QUERY_LENGTH} characters."
@@ -516,6 +744,10 @@ class Salesforce:
             LOGGER.info(
                 f"get_records in date range [{start_date}, {end_date}] failed with timeout. Shrinking window by factor {shrink_window_factor}"
             )
+            if checkpoint is not None:
+                # the locator belongs to the query of the whole window, the smaller windows
+                # continue after the last emitted record instead
+                checkpoint.expire_cursor()
             for i in range(shrink_window_factor):
                 yield from self.get_records(
                     table,
@@ -524,64 +756,257 @@ class Salesforce:
                     end_date=start_date + timedelta(seconds=((i + 1) * nth)),
                     limit=limit,
                     shrink_window_factor=shrink_window_factor + 1,
+                    checkpoint=checkpoint,
                 )
 
+    def prefetch_queries(self, queries: List[str]):
+        """
+        runs the queries as subrequests of composite requests, the first result page of
+        every query is kept until the query is paginated. queries with more pages continue
+        from their nextRecordsUrl, failed subrequests are retried as regular requests.
+        """
+        for query, body in self.composite_queries(queries).items():
+            buffer_name = f"prefetched page {next(_page_buffers)}"
+            index, packed = pack_page(body)
+            rows = packed["records"]
+            GOVERNOR.track(buffer_name, len(rows) * row_bytes(rows[0]) if rows else 0)
+            self._prefetched[query] = (buffer_name, (index, packed))
+
+    def take_prefetched(self, query: str) -> Optional[Dict]:
+        """returns the prefetched first page of the query once, None when it was not prefetched"""
+        prefetched = self._prefetched.pop(query, None)
+        if prefetched is None:
+            return None
+        buffer_name, packed = prefetched
+        GOVERNOR.track(buffer_name, 0)
+        return unpack_page(packed)
+
+    def discard_prefetched(self):
+        """releases the prefetched pages that were not paginated"""
+        for buffer_name, _ in self._prefetched.values():
+            GOVERNOR.track(buffer_name, 0)
+        if self._prefetched:
+            LOGGER.info(f"discarded {len(self._prefetched)} prefetched pages that were not queried")
+        self._prefetched.clear()
+
+    def composite_queries(self, queries: List[str]) -> Dict[str, Dict]:
+        """runs the queries in composite requests, returns the first page of every query that succeeded"""
+        results = {}
+        queries = [query for query in queries if len(query) <= MAX_QUERY_LENGTH]
+        for i in range(0, len(queries), COMPOSITE_MAX_SUBREQUESTS):
+            batch = queries[i : i + COMPOSITE_MAX_SUBREQUESTS]
+            LOGGER.info(f"running {len(batch)} queries in one composite request")
+            resp = self._make_request(
+                "POST",
+                f"/services/data/{self._API_VERSION}/composite",
+                json={
+                    "allOrNone": False,
+                    "compositeRequest": [
+                        {
+                            "method": "GET",
+                            "url": f"/services/data/{self._API_VERSION}/queryAll/?"
+                            + urlencode({"q": query}),
+                            "referenceId": f"query{index}",
+                        }
+                        for index, query in enumerate(batch)
+                    ],
+                },
+            )
+            for result in resp.json().get("compositeResponse", []):
+                index = int(result["referenceId"][len("query") :])
+                if result.get("httpStatusCode") == 200:
+                    results[batch[index]] = result["body"]
+                else:
+                    LOGGER.info(
+                        f"composite query failed with {result.get('httpStatusCode')}: {result.get('body')}"
+                    )
+        return results
+
+    def _resume_cursor(self, checkpoint: Checkpoint) -> Iterator[Dict]:
+        """
+        continues the query locator of an interrupted window, once it is exhausted or
+        has expired the window is continued with a predicate on the last emitted record
+        """
+        LOGGER.info(
+            f"resuming query cursor {checkpoint.cursor} at record {checkpoint.offset}"
+        )
+        try:
+            yield from self._paginate("GET", checkpoint.cursor, checkpoint=checkpoint)
+        except SalesforceException as e:
+            if e.code != "INVALID_QUERY_LOCATOR":
+                raise e
+            LOGGER.info("query cursor expired, continuing after the last emitted record")
+        checkpoint.expire_cursor()
+
+    def request(
+        self, method, path, data=None, params=None, json=None, headers=None
+    ) -> requests.Response:
+        """sends a request to the salesforce api, with the retries of the client"""
+        return self._make_request(
+            method, path, data=data, params=params, json=json, headers=headers
+        )
+
+    def paginate(
+        self,
+        method: str,
+        path: str,
+        data: Dict = None,
+        params: Dict = None,
+    ) -> Iterator[Dict]:
+        """returns the records of every page of a query"""
+        return self._paginate(method, path, data=data, params=params)
+
     def _paginate(
         self,
         method: str,
         path: str,
         data: Dict = None,
         params: Dict = None,
+        checkpoint: Optional[Checkpoint] = None,
     ) -> Iterator[Dict]:
         next_page: Optional[str] = path
+        # locator url of the current page, the first page of a query has none
+        page: Optional[str] = None
+        offset = 0
+        if checkpoint is not None and checkpoint.cursor == path:
+            page, offset = path, checkpoint.offset
+
+        prefetched = None
+        headers = None
+        if page is None and params is not None and "q" in params:
+            prefetched = self.take_prefetched(params["q"])
+            # the page size is fixed when a query starts, its nextRecordsUrl pages keep it
+            page_size = GOVERNOR.query_page_size()
+            if page_size is not None:
+                headers = {"Sforce-Query-Options": f"batchSize={page_size}"}
+
+        buffer_name = f"page {next(_page_buffers)}"
+        try:
+            while True:
+                if prefetched is not None:
+                    resp_data, prefetched = prefetched, None
+                else:
+                    if method == "GET" and page is not None:
+                        resp = self.next_page(next_page, headers)
+                    else:
+                        resp = self._make_request(
+                            method, next_page, data=data, params=params, headers=headers
+                        )
+                    GOVERNOR.track(buffer_name, len(resp.content))
+                    resp_data = resp.json()
+
+                records = resp_data.get("records", [])
+                if checkpoint is None:
+                    yield from records
+                else:
+                    for index in range(offset, len(records)):
+                        # the record counts once the caller has emitted it
+                        checkpoint.set_cursor(page, index)
+                        yield records[index]
+                offset = 0
+
+                next_page = resp_data.get("nextRecordsUrl")
+                if next_page is None:
+                    return
+                page = next_page
+        finally:
+            GOVERNOR.track(buffer_name, 0)
+
+    def _make_request(
+        self, method, path, data=None, params=None, json=None, headers=None
+    ) -> requests.Response:
+        extra_headers = headers or {}
+        endpoint_class = endpoint(path)
+        tries = 0
         while True:
-            resp = self._make_request(method, next_page, data=data, params=params)
-
-            resp_data = resp.json()
-            yield from resp_data.get("records", [])
-            next_page = resp_data.get("nextRecordsUrl")
-            if next_page is None:
-                return
-
-    @backoff.on_exception(
-        backoff.expo,
-        (
-            requests.exceptions.ConnectionError,
-            requests.exceptions.Timeout,
-            requests.exceptions.ChunkedEncodingError,
-            requests.exceptions.HTTPError,
-            SalesforceFunctionalityTemporarilyUnavailableException,
-            SalesforceUnexpectedException,
-            SalesforceSessionExpiredException,
-            SalesforceQueryTimeoutException,
-        ),
-        max_tries=5,
-        factor=2,
-        on_backoff=log_backoff_attempt,
-    )
-    def _make_request(self, method, path, data=None, params=None) -> requests.Response:
-        now = datetime.now()
+            tries += 1
+            resp = None
+            try:
+                headers = {**self.auth_headers(), **extra_headers}
+
+                url = f"{self.instance_url}{path}"
+                started = time.monotonic()
+                resp = self.session.request(
+                    method,
+                    url,
+                    headers=headers,
+                    params=params,
+                    data=data,
+                    json=json,
+                    timeout=self.timeouts[endpoint_class],
+                )
+                self.latency.record(endpoint_class, time.monotonic() - started)
+
+                if resp.status_code < 200 or resp.status_code > 299:
+                    ex = build_salesforce_exception(resp)
+                    if ex:
+                        raise ex
+                    resp.raise_for_status()
+                break
+            except (SalesforceException, requests.exceptions.RequestException) as e:
+                if isinstance(e, requests.exceptions.Timeout):
+                    self._metrics_timeouts += 1
+                cause = self.retries.backoff(tries, e, resp)
+                if cause is None:
+                    raise
+                if cause in SESSION_CODES:
+                    # log in again before the next attempt
+                    self.expire_session()
 
-        if self._token_expiration_time is None or self._token_expiration_time < now:
-            self._login()
+        self._metrics_http_requests += 1
+        self._metrics_bytes += len(resp.content)
+        self._check_rest_quota_usage(resp.headers)
 
-        headers = {"Authorization": "Bearer {}".format(self._access_token)}
+        return resp
 
-        url = f"{self.instance_url}{path}"
-        resp = self.session.request(
-            method, url, headers=headers, params=params, data=data
-        )
+    def next_page(self, path: str, headers: Optional[Dict] = None) -> requests.Response:
+        """
+        requests the nextRecordsUrl page of a query. with a hedge budget, a page that takes
+        much longer than the p99 of recent query requests is requested a second time, the
+        response that arrives first is used. query locator pages can be read any number
+        of times, so the second request does not change the result.
+        """
+        p99 = None
+        if self.hedges < self.hedge_budget:
+            p99 = self.latency.percentile(QUERY, 99)
+        if p99 is None:
+            return self._make_request("GET", path, headers=headers)
+        delay = max(p99 * HEDGE_FACTOR, MIN_HEDGE_DELAY_SECONDS)
+
+        if self._hedge_pool is None:
+            self._hedge_pool = ThreadPoolExecutor(
+                max_workers=4, thread_name_prefix="hedge"
+            )
+        pending = {self._hedge_pool.submit(self._make_request, "GET", path, headers=headers)}
+        done, _ = wait(pending, timeout=delay)
+        if not done and self.hedges < self.hedge_budget:
+            self.hedges += 1
+            LOGGER.info(
+                f"page {path} is slower than {delay:.1f}s, requesting it again ({self.hedges} of {self.hedge_budget})"
+            )
+            pending.add(
+                self._hedge_pool.submit(self._make_request, "GET", path, headers=headers)
+            )
 
-        if resp.status_code < 200 or resp.status_code > 299:
-            ex = build_salesforce_exception(resp)
-            if ex:
-                raise ex
-            resp.raise_for_status()
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # the slower request finishes in the background, bounded by its timeout
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def auth_headers(self) -> Dict[str, str]:
+        """returns the authorization header, logging in again when the token has expired"""
+        self.wait_for_login()
+        now = datetime.now()
 
-        self._metrics_http_requests += 1
-        self._check_rest_quota_usage(resp.headers)
+        if self._token_expiration_time is None or self._token_expiration_time < now:
+            self._login()
 
-        return resp
+        return {"Authorization": "Bearer {}".format(self._access_token)}
 
     def _login(self):
         if self.is_sandbox:
@@ -599,11 +1024,14 @@ class Salesforce:
         LOGGER.info("Attempting login via OAuth2")
 
         try:
+            started = time.monotonic()
             resp = self.session.post(
                 login_url,
                 headers={"Content-Type": "application/x-www-form-urlencoded"},
                 data=data,
+                timeout=self.timeouts[LOGIN],
             )
+            self.latency.record(LOGIN, time.monotonic() - started)
 
             resp.raise_for_status()
 
@@ -642,8 +1070,8 @@ class Salesforce:
             return
 
         used, total = map(int, match.groups())
-        self.quota_percent_total = QUOTA_PERCENT_FOR_INSTANCE_URL.get(self.instance_url, DEFAULT_QUOTA_PERCENT_TOTAL)
-        self.quota_percent_per_run = QUOTA_PERCENT_FOR_INSTANCE_URL.get(self.instance_url, DEFAULT_QUOTA_PERCENT_PER_RUN)
+        self.quota_percent_total = QUOTA_PERCENT_FOR_INSTANCE_URL.get(self.instance_url, self._configured_quota_percent_total)
+        self.quota_percent_per_run = QUOTA_PERCENT_FOR_INSTANCE_URL.get(self.instance_url, self._configured_quota_percent_per_run)
 
         used_percent = (used / total) * 100.0
 
@@ -0,0 +1,9 @@
+from typing import Dict
+
+
+def flag(config: Dict, key: str, default: bool = False) -> bool:
+    """returns a boolean config value, values passed as strings (e.g. "false") are only true when they say so"""
+    value = config.get(key, default)
+    if isinstance(value, str):
+        return value.lower() == "true"
+    return bool(value)
@@ -0,0 +1,110 @@
+from datetime import date, datetime, timezone
+from typing import Any, Callable, Dict, List
+
+from tap_salesforce.catalog import COMPOUND_TYPES, COMPOUND_COMPONENTS
+from tap_salesforce.exceptions import TapSalesforceException
+
+COMPOUND_FIELD_MODES = ("keep", "flatten", "omit")
+
+# keys salesforce adds to every record that are not fields of the describe
+METADATA_KEYS = {"attributes"}
+
+
+def _datetime(value: Any) -> Any:
+    # salesforce returns utc datetimes as 2021-01-01T10:00:00.000+0000
+    if isinstance(value, str) and value.endswith("+0000"):
+        return value[:-5] + "000Z"
+    if isinstance(value, str):
+        value = datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%f%z")
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def _date(value: Any) -> str:
+    # salesforce returns dates as 2021-01-01
+    if isinstance(value, datetime):
+        value = value.date()
+    if isinstance(value, str):
+        value = date.fromisoformat(value[:10])
+    return value.isoformat()
+
+
+def _integer(value: Any) -> int:
+    return int(float(value)) if isinstance(value, str) else int(value)
+
+
+def _boolean(value: Any) -> bool:
+    if isinstance(value, str):
+        return value.lower() == "true"
+    return bool(value)
+
+
+TYPE_CONVERTERS: Dict[str, Callable[[Any], Any]] = {
+    "datetime": _datetime,
+    "date": _date,
+    "int": _integer,
+    "long": _integer,
+    "double": float,
+    "currency": float,
+    "percent": float,
+    "boolean": _boolean,
+}
+
+
+class RecordConverter:
+    """
+    converts the records of a table in a single pass, the conversion of every field is
+    decided once from the describe fields of the table. `attributes` is always dropped,
+    compound fields are kept, flattened into `<field>_<component>` or omitted, and with
+    `normalize_types` values are coerced to the type of their describe field.
+    """
+
+    def __init__(
+        self,
+        fields: List[Dict],
+        compound_fields: str = "keep",
+        normalize_types: bool = False,
+    ):
+        if compound_fields not in COMPOUND_FIELD_MODES:
+            raise TapSalesforceException(
+                f"invalid compound_fields {compound_fields}, expected one of {COMPOUND_FIELD_MODES}"
+            )
+
+        self._drop = set(METADATA_KEYS)
+        self._flatten = set()
+        self._convert: Dict[str, Callable[[Any], Any]] = {}
+        # the describe fields of the converted records, for output modes with a schema
+        self.fields: List[Dict] = []
+
+        for field in fields:
+            field_type = field.get("type")
+            if field_type in COMPOUND_TYPES:
+                if compound_fields == "omit":
+                    self._drop.add(field["name"])
+                    continue
+                if compound_fields == "flatten":
+                    self._flatten.add(field["name"])
+                    self.fields.extend(
+                        {"name": f"{field['name']}_{component}", "type": component_type}
+                        for component, component_type in COMPOUND_COMPONENTS[field_type].items()
+                    )
+                    continue
+            elif normalize_types and field_type in TYPE_CONVERTERS:
+                self._convert[field["name"]] = TYPE_CONVERTERS[field_type]
+            self.fields.append(field)
+
+    def __call__(self, record: Dict) -> Dict:
+        drop, flatten, convert = self._drop, self._flatten, self._convert
+        converted = {}
+        for name, value in record.items():
+            if name in drop:
+                continue
+            if value is None:
+                converted[name] = None
+            elif name in flatten:
+                for component, component_value in value.items():
+                    converted[f"{name}_{component}"] = component_value
+            elif name in convert:
+                converted[name] = convert[name](value)
+            else:
+                converted[name] = value
+        return converted
@@ -0,0 +1,233 @@
+import os
+import json
+import sqlite3
+import hashlib
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, List, Optional, Union
+
+import singer
+
+LOGGER = singer.get_logger()
+
+DEFAULT_MAX_PASS_AGE = timedelta(days=1)
+
+# rows written between commits of the index
+_COMMIT_INTERVAL = 10000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    id TEXT PRIMARY KEY,
+    key TEXT,
+    hash BLOB NOT NULL,
+    seen INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pending (
+    id TEXT PRIMARY KEY,
+    key TEXT,
+    hash BLOB,
+    seen INTEGER NOT NULL,
+    generation INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS passes (
+    id INTEGER PRIMARY KEY,
+    started_at TEXT NOT NULL,
+    finished_at TEXT,
+    finished_generation INTEGER
+);
+CREATE TABLE IF NOT EXISTS generations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT
+);
+"""
+
+# bookmark key of the last generation of the index a STATE covers
+GENERATION_KEY = "diff_generation"
+
+
+def _salesforce_datetime(value: Union[date, datetime]) -> str:
+    # the format salesforce returns datetimes in, so they compare as strings
+    if not isinstance(value, datetime):
+        value = datetime.combine(value, time(), tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "+0000"
+
+
+def content_hash(record: Dict) -> bytes:
+    content = {name: value for name, value in record.items() if name != "attributes"}
+    return hashlib.blake2b(
+        json.dumps(content, sort_keys=True, default=str).encode("utf-8"), digest_size=16
+    ).digest()
+
+
+class DiffIndex:
+    """
+    a persistent sqlite index of Id -> (replication key, content hash) of a resynced table.
+    a full pass over the table only emits records that are new or changed since the last
+    pass, and tombstones for the Ids the pass did not see.
+
+    changes are staged in generations and only applied once a STATE that covers them has
+    been written, so a run that fails before its records are committed downstream does not
+    suppress them in the next run. the index is a state listener of the stream: a
+    generation ends when the stream takes a state, whose bookmark records it, and is
+    applied when that STATE is written.
+
+    a pass that is interrupted is continued by the next run, unless it is older than
+    `max_pass_age`, so the records it already saw are not reported as deleted.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        stream_id: str,
+        replication_key: Optional[str],
+        covered_generation: Optional[int] = None,
+        max_pass_age: timedelta = DEFAULT_MAX_PASS_AGE,
+    ):
+        self.path = path
+        self.stream_id = stream_id
+        self.replication_key = replication_key
+        self.unchanged = 0
+        self._pending = 0
+        self._staged = False
+
+        self._db = sqlite3.connect(path)
+        self._db.executescript(_SCHEMA)
+        if covered_generation is not None:
+            # the last STATE of the previous run covered these, it failed before applying them
+            self._apply(covered_generation)
+        self._db.execute("DELETE FROM pending")
+        self._db.execute("UPDATE passes SET finished_generation = NULL WHERE finished_at IS NULL")
+        self.pass_id = self._begin_pass(max_pass_age)
+        self.generation = self._next_generation()
+
+    @classmethod
+    def for_table(
+        cls, directory: str, table_name: str, replication_key: Optional[str], bookmark: Dict
+    ):
+        os.makedirs(directory, exist_ok=True)
+        return cls(
+            os.path.join(directory, f"{table_name}.sqlite"),
+            table_name,
+            replication_key,
+            bookmark.get(GENERATION_KEY),
+        )
+
+    def changed(self, record: Dict) -> bool:
+        """stages the record in the current pass, returns whether it has to be emitted"""
+        record_id = record.get("Id")
+        if record_id is None:
+            return True
+
+        digest = content_hash(record)
+        key = record.get(self.replication_key or "SystemModstamp")
+        row = self._db.execute(
+            "SELECT COALESCE((SELECT hash FROM pending WHERE id = ?), (SELECT hash FROM records WHERE id = ?))",
+            (record_id, record_id),
+        ).fetchone()
+        self._stage(record_id, key, digest)
+
+        if row[0] == digest:
+            self.unchanged += 1
+            return False
+        return True
+
+    def commit(self):
+        self._db.commit()
+        self._pending = 0
+
+    def missing(
+        self, start: Optional[Union[date, datetime]], end: Optional[datetime]
+    ) -> List[str]:
+        """
+        returns the Ids that were not seen by the pass. with a replication key only records
+        whose last known key falls in the pass window [start, end) are returned, records
+        outside of it were not expected to be read.
+        """
+        query = "SELECT id FROM records WHERE seen != ? AND id NOT IN (SELECT id FROM pending)"
+        params = [self.pass_id]
+        if self.replication_key is not None and start is not None and end is not None:
+            query += " AND key >= ? AND key < ?"
+            params += [_salesforce_datetime(start), _salesforce_datetime(end)]
+        return [row[0] for row in self._db.execute(query, params)]
+
+    def finish(self, deleted: List[str]):
+        """ends the pass once the tombstones of the deleted Ids have been written"""
+        for record_id in deleted:
+            self._stage(record_id, None, None)
+        self._db.execute(
+            "UPDATE passes SET finished_generation = ? WHERE id = ?",
+            (self.generation, self.pass_id),
+        )
+        self._staged = True
+        self.commit()
+        LOGGER.info(
+            f"{os.path.basename(self.path)}: suppressed {self.unchanged} unchanged records, {len(deleted)} deleted"
+        )
+
+    def snapshot(self, stream):
+        """ends the current generation, called before the stream takes a state"""
+        if not self._staged:
+            return
+        stream.set_stream_state(self.stream_id, GENERATION_KEY, self.generation)
+        self.commit()
+        self.generation = self._next_generation()
+        self._staged = False
+
+    def state_written(self, state: Dict):
+        """applies the generations the written STATE covers"""
+        generation = state.get("bookmarks", {}).get(self.stream_id, {}).get(GENERATION_KEY)
+        if generation is not None:
+            self._apply(generation)
+
+    def close(self):
+        self.commit()
+        self._db.close()
+
+    def _stage(self, record_id: str, key: Optional[str], digest: Optional[bytes]):
+        # a deleted Id is staged without a hash
+        self._db.execute(
+            "INSERT OR REPLACE INTO pending (id, key, hash, seen, generation) VALUES (?, ?, ?, ?, ?)",
+            (record_id, key, digest, self.pass_id, self.generation),
+        )
+        self._staged = True
+        self._pending += 1
+        if self._pending >= _COMMIT_INTERVAL:
+            self.commit()
+
+    def _apply(self, generation: int):
+        self._db.execute(
+            """
+            INSERT OR REPLACE INTO records (id, key, hash, seen)
+            SELECT id, key, hash, seen FROM pending WHERE generation <= ? AND hash IS NOT NULL
+            """,
+            (generation,),
+        )
+        self._db.execute(
+            "DELETE FROM records WHERE id IN (SELECT id FROM pending WHERE generation <= ? AND hash IS NULL)",
+            (generation,),
+        )
+        self._db.execute("DELETE FROM pending WHERE generation <= ?", (generation,))
+        self._db.execute(
+            "UPDATE passes SET finished_at = ? WHERE finished_at IS NULL AND finished_generation <= ?",
+            (datetime.now(timezone.utc).isoformat(), generation),
+        )
+        self.commit()
+
+    def _next_generation(self) -> int:
+        cursor = self._db.execute("INSERT INTO generations DEFAULT VALUES")
+        self._db.execute("DELETE FROM generations WHERE id < ?", (cursor.lastrowid,))
+        self.commit()
+        return cursor.lastrowid
+
+    def _begin_pass(self, max_pass_age: timedelta) -> int:
+        row = self._db.execute(
+            "SELECT id, started_at FROM passes WHERE finished_at IS NULL ORDER BY id DESC LIMIT 1"
+        ).fetchone()
+        now = datetime.now(timezone.utc)
+        if row is not None and now - datetime.fromisoformat(row[1]) < max_pass_age:
+            LOGGER.info(f"{os.path.basename(self.path)}: continuing interrupted pass {row[0]}")
+            return row[0]
+
+        cursor = self._db.execute(
+            "INSERT INTO passes (started_at) VALUES (?)", (now.isoformat(),)
+        )
+        self.commit()
+        return cursor.lastrowid
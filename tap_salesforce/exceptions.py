@@ -2,7 +2,6 @@
 import json
 from typing import Optional, List, Tuple
 
-import simplejson
 import singer
 from requests import Response
 
@@ -64,6 +63,14 @@ class SalesforceException(Exception):
         return f"{self.code}: {super().__str__()}"
 
 
+class PipelineError(Exception):
+    """a salesforce error inside the pipeline, the sync continues without it from the checkpoint"""
+
+    def __init__(self, error: SalesforceException):
+        super().__init__(str(error))
+        self.error = error
+
+
 class SalesforceFunctionalityTemporarilyUnavailableException(SalesforceException):
     def __init__(self, message: str) -> None:
         super().__init__(message, "FUNCTIONALITY_TEMPORARILY_UNAVAILABLE")
@@ -101,7 +108,8 @@ class SalesforceQueryTimeoutException(SalesforceException):
 def build_salesforce_exception(resp: Response) -> Optional[SalesforceException]:
     try:
         err_array = resp.json()
-    except simplejson.scanner.JSONDecodeError:
+    except ValueError:
+        # the json decode errors of requests, json and simplejson are all value errors
         LOGGER.error(f"Failed to parse response body: {resp.text}")
         return SalesforceException("response code: " + str(resp.status_code), "UNKNOWN")
 
@@ -0,0 +1,63 @@
+import json
+import hashlib
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Optional
+
+import singer
+
+from tap_salesforce.stream import Stream
+from tap_salesforce.client import Table
+
+LOGGER = singer.get_logger()
+
+DEFAULT_FIELDS_FULL_REFRESH_HOURS = 24
+
+
+def field_digest(field: Dict) -> str:
+    encoded = json.dumps(field, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha1(encoded).hexdigest()[:16]
+
+
+def sync_fields(
+    stream: Stream, table: Table, full_refresh_interval: Optional[timedelta] = None
+):
+    """
+    writes the describe fields of the table to the {table}Fields stream.
+    a digest of every field definition is kept in the state, so only added and changed
+    fields are written, removed fields are written with a `_sdc_deleted_at` marker.
+    every `full_refresh_interval` all fields are written again.
+    """
+    stream_id = f"{table.name}Fields"
+    now = datetime.now(timezone.utc)
+
+    previous: Dict[str, str] = stream.get_bookmark(stream_id).get("digests") or {}
+    refreshed_at = stream.get_stream_state(stream_id, "refreshed_at")
+    full_refresh = (
+        not previous
+        or refreshed_at is None
+        or full_refresh_interval is None
+        or now - refreshed_at >= full_refresh_interval
+    )
+
+    digests = {}
+    written = 0
+    for field in table.fields:
+        digest = field_digest(field)
+        digests[field["name"]] = digest
+        if full_refresh or previous.get(field["name"]) != digest:
+            stream.write_record(field, stream_id)
+            written += 1
+
+    removed = [name for name in previous if name not in digests]
+    for name in removed:
+        stream.write_record(
+            {"name": name, "_sdc_deleted_at": now.isoformat()}, stream_id
+        )
+
+    stream.set_stream_state(stream_id, "digests", digests)
+    if full_refresh:
+        stream.set_stream_state(stream_id, "refreshed_at", now)
+
+    LOGGER.info(
+        f"{stream_id}: wrote {written} of {len(digests)} fields, {len(removed)} removed, full refresh: {full_refresh}"
+    )
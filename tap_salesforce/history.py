@@ -0,0 +1,103 @@
+import time
+from datetime import date, datetime, time as datetime_time, timezone
+from statistics import median
+from typing import Dict, List, Optional, Union
+
+import singer
+
+LOGGER = singer.get_logger()
+
+DEFAULT_HISTORY_SIZE = 10
+DEFAULT_REGRESSION_FACTOR = 2.0
+
+# runs that take less than this are never reported as regressions
+_MIN_REGRESSION_SECONDS = 60.0
+
+
+def _as_datetime(value: Union[date, datetime]) -> datetime:
+    # resyncs start at a date rather than a datetime
+    if isinstance(value, datetime):
+        return value
+    return datetime.combine(value, datetime_time(), tzinfo=timezone.utc)
+
+
+class TableRun:
+    """
+    measures the sync of one table for the performance history of its stream. the request,
+    page, byte and timeout counters of the client are read when the sync starts and ends.
+    """
+
+    def __init__(self, sf, table_name: str):
+        self.sf = sf
+        self.table_name = table_name
+        self.records = 0
+        self.windows = 0
+        self.window_hours = 0.0
+
+        self._started_at = datetime.now(timezone.utc)
+        self._started = time.monotonic()
+        self._counters = self._read_counters()
+
+    def add_window(self, start: Union[date, datetime], end: datetime, records: int):
+        self.windows += 1
+        self.window_hours += (end - _as_datetime(start)).total_seconds() / 3600
+        self.records += records
+
+    def entry(self) -> Dict:
+        counters = self._read_counters()
+        return {
+            "started_at": self._started_at.isoformat(),
+            "seconds": round(time.monotonic() - self._started, 1),
+            "records": self.records,
+            "windows": self.windows,
+            "window_hours": round(self.window_hours, 2),
+            **{name: counters[name] - self._counters[name] for name in counters},
+        }
+
+    def _read_counters(self) -> Dict[str, int]:
+        return self.sf.metrics()
+
+
+def expected_seconds(history: List[Dict]) -> Optional[float]:
+    """returns the median duration of the recorded runs of a table"""
+    if not history:
+        return None
+    return median(entry["seconds"] for entry in history)
+
+
+def expected_records(
+    history: List[Dict], start: Union[date, datetime], end: datetime
+) -> Optional[int]:
+    """estimates the records of a window from the records per hour of the recorded runs"""
+    hours = sum(entry.get("window_hours", 0) for entry in history)
+    if not history or hours <= 0:
+        return None
+    rate = sum(entry["records"] for entry in history) / hours
+    return int(rate * (end - _as_datetime(start)).total_seconds() / 3600)
+
+
+def regressions(history: List[Dict], entry: Dict, factor: float) -> List[str]:
+    """returns what the run took more than `factor` times the median of the recorded runs for"""
+    if not history:
+        return []
+
+    found = []
+    for name in ("seconds", "requests", "timeouts"):
+        usual = median(previous.get(name, 0) for previous in history)
+        if name == "seconds" and entry[name] < _MIN_REGRESSION_SECONDS:
+            continue
+        if entry[name] > max(usual, 1) * factor:
+            found.append(f"{name} {entry[name]} (median {usual})")
+    return found
+
+
+def record_run(stream, run: TableRun, size: int, regression_factor: float):
+    """adds the run to the table's history, logging a warning when it regressed"""
+    history = stream.get_history(run.table_name)
+    entry = run.entry()
+    found = regressions(history, entry, regression_factor)
+    if found:
+        LOGGER.warning(
+            f"{run.table_name} regressed compared to its last {len(history)} runs: {', '.join(found)}"
+        )
+    stream.add_history(run.table_name, entry, size)
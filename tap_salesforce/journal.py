@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+re-emits singer messages of past runs from the local extraction journal.
+
+  tap-salesforce-journal list   --journal-dir journal
+  tap-salesforce-journal replay --journal-dir journal [--table Account] [--since 2024-01-01T00:00:00Z] [--until ...] [--run RUN]
+
+`replay` writes the RECORD and STATE messages of the matching journal segments to
+stdout in the order they were extracted, without any request to Salesforce.
+"""
+import os
+import sys
+import json
+import gzip
+import argparse
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional, TextIO
+
+import singer
+
+LOGGER = singer.get_logger()
+
+DEFAULT_JOURNAL_MAX_AGE_DAYS = 7
+DEFAULT_JOURNAL_MAX_BYTES = 10 * 1024 * 1024 * 1024
+DEFAULT_SEGMENT_BYTES = 64 * 1024 * 1024
+
+INDEX_FILE = "index.json"
+
+
+def _key_datetime(value: str) -> datetime:
+    if value.endswith("Z"):
+        value = value[:-1] + "+00:00"
+    elif value[-5] in "+-" and value[-3] != ":":
+        # salesforce datetimes carry a +0000 offset
+        value = value[:-2] + ":" + value[-2:]
+    return datetime.fromisoformat(value).astimezone(timezone.utc)
+
+
+class Journal:
+    """
+    appends the singer messages of every run to gzip compressed segments in a local
+    directory. the index keeps, per segment, the run it belongs to and the number of
+    records and the replication key range of every table in it, so a replay only reads
+    the segments that overlap the requested range.
+
+    segments older than `max_age` and the oldest segments beyond `max_bytes` of compressed
+    files on disk are removed when a run finishes.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_age: timedelta = timedelta(days=DEFAULT_JOURNAL_MAX_AGE_DAYS),
+        max_bytes: int = DEFAULT_JOURNAL_MAX_BYTES,
+        segment_bytes: int = DEFAULT_SEGMENT_BYTES,
+    ):
+        self.directory = directory
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        # replication key of every table, records of other streams are journaled without a range
+        self.replication_keys: Dict[str, Optional[str]] = {}
+
+        os.makedirs(directory, exist_ok=True)
+        self.run_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+        self._segments = 0
+        self._file = None
+        self._entry: Optional[Dict] = None
+
+    def append(self, message: Dict, line: str):
+        if self._file is None:
+            self._open()
+
+        data = line.encode("utf-8") + b"\n"
+        self._file.write(data)
+        self._entry["bytes"] += len(data)
+
+        if message.get("type") == "RECORD":
+            stream_id = message["stream"]
+            tables = self._entry["tables"]
+            key = self.replication_keys.get(stream_id)
+            table = tables.get(stream_id)
+            if table is None:
+                table = tables[stream_id] = {
+                    "key": key,
+                    "records": 0,
+                    "min_key": None,
+                    "max_key": None,
+                }
+            table["records"] += 1
+
+            value = message["record"].get(key) if key else None
+            if value is not None:
+                value = _key_datetime(value).isoformat()
+                if table["min_key"] is None or value < table["min_key"]:
+                    table["min_key"] = value
+                if table["max_key"] is None or value > table["max_key"]:
+                    table["max_key"] = value
+        elif message.get("type") == "STATE":
+            # a segment ends at a STATE, so replaying whole segments never splits a checkpoint
+            if self._entry["bytes"] >= self.segment_bytes:
+                self._close_segment()
+
+    def close(self):
+        if self._file is not None:
+            self._close_segment()
+        self.apply_retention()
+
+    def apply_retention(self):
+        index = load_index(self.directory)
+        now = datetime.now(timezone.utc)
+        kept, total = [], 0
+        for entry in sorted(index, key=lambda e: e["created_at"], reverse=True):
+            path = os.path.join(self.directory, entry["segment"])
+            expired = now - datetime.fromisoformat(entry["created_at"]) > self.max_age
+            if expired or total + _file_bytes(entry, path) > self.max_bytes:
+                if os.path.exists(path):
+                    os.remove(path)
+                continue
+            total += _file_bytes(entry, path)
+            kept.append(entry)
+
+        if len(kept) < len(index):
+            LOGGER.info(f"journal retention removed {len(index) - len(kept)} segments")
+            _write_index(self.directory, sorted(kept, key=lambda e: e["segment"]))
+
+    def _open(self):
+        name = f"{self.run_id}-{self._segments:05d}.jsonl.gz"
+        self._segments += 1
+        self._file = gzip.open(os.path.join(self.directory, name), "wb", compresslevel=6)
+        self._entry = {
+            "segment": name,
+            "run": self.run_id,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "bytes": 0,
+            "tables": {},
+        }
+
+    def _close_segment(self):
+        self._file.close()
+        self._file = None
+        # "bytes" counts the uncompressed messages, retention goes by the size on disk
+        self._entry["file_bytes"] = os.path.getsize(os.path.join(self.directory, self._entry["segment"]))
+        index = load_index(self.directory)
+        index.append(self._entry)
+        _write_index(self.directory, index)
+        self._entry = None
+
+
+def _file_bytes(entry: Dict, path: str) -> int:
+    if "file_bytes" in entry:
+        return entry["file_bytes"]
+    # segments indexed before the compressed size was recorded
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def load_index(directory: str) -> List[Dict]:
+    path = os.path.join(directory, INDEX_FILE)
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_index(directory: str, index: List[Dict]):
+    path = os.path.join(directory, INDEX_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def replay(
+    directory: str,
+    output: TextIO,
+    table: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    run: Optional[str] = None,
+) -> int:
+    """writes the journaled messages in [since, until) of a table or run, returns the records written"""
+    since_key = since.astimezone(timezone.utc).isoformat() if since else None
+    until_key = until.astimezone(timezone.utc).isoformat() if until else None
+    prefix = None
+    if table is not None:
+        prefix = json.dumps({"type": "RECORD", "stream": table})[:-1]
+
+    written = 0
+    for entry in load_index(directory):
+        if run is not None and entry["run"] != run:
+            continue
+
+        tables = entry["tables"] if table is None else {
+            name: stats for name, stats in entry["tables"].items() if name == table
+        }
+        if table is not None and not tables:
+            continue
+        if not any(_overlaps(stats, since_key, until_key) for stats in tables.values()):
+            continue
+        # only segments with records outside the range need their records parsed
+        whole = all(_within(stats, since_key, until_key) for stats in tables.values())
+
+        for line in _lines(os.path.join(directory, entry["segment"])):
+            if line.startswith('{"type": "STATE"'):
+                output.write(line)
+                continue
+            if prefix is not None and not line.startswith(prefix):
+                continue
+            if not whole and not _line_in_range(line, entry, since_key, until_key):
+                continue
+            output.write(line)
+            written += 1
+    return written
+
+
+def _overlaps(stats: Dict, since_key: Optional[str], until_key: Optional[str]) -> bool:
+    if stats["min_key"] is None:
+        return True
+    if since_key is not None and stats["max_key"] < since_key:
+        return False
+    if until_key is not None and stats["min_key"] >= until_key:
+        return False
+    return True
+
+
+def _within(stats: Dict, since_key: Optional[str], until_key: Optional[str]) -> bool:
+    if since_key is None and until_key is None:
+        return True
+    if stats["min_key"] is None:
+        return False
+    if since_key is not None and stats["min_key"] < since_key:
+        return False
+    if until_key is not None and stats["max_key"] >= until_key:
+        return False
+    return True
+
+
+def _line_in_range(line: str, entry: Dict, since_key: Optional[str], until_key: Optional[str]) -> bool:
+    message = json.loads(line)
+    if message.get("type") != "RECORD":
+        return True
+    stats = entry["tables"].get(message["stream"], {})
+    value = message["record"].get(stats["key"]) if stats.get("key") else None
+    if value is None:
+        return True
+    key = _key_datetime(value).isoformat()
+    return (since_key is None or key >= since_key) and (until_key is None or key < until_key)
+
+
+def _lines(path: str) -> Iterator[str]:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        yield from f
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    list_parser = commands.add_parser("list", help="List the journaled runs")
+    list_parser.add_argument("--journal-dir", required=True, help="Journal directory")
+
+    replay_parser = commands.add_parser("replay", help="Write journaled messages to stdout")
+    replay_parser.add_argument("--journal-dir", required=True, help="Journal directory")
+    replay_parser.add_argument("--table", help="Only replay the records of this table")
+    replay_parser.add_argument("--since", help="Replication key lower bound (inclusive)")
+    replay_parser.add_argument("--until", help="Replication key upper bound (exclusive)")
+    replay_parser.add_argument("--run", help="Only replay this run")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        runs: Dict[str, Dict] = {}
+        for entry in load_index(args.journal_dir):
+            run = runs.setdefault(entry["run"], {"segments": 0, "bytes": 0, "file_bytes": 0, "records": {}})
+            run["segments"] += 1
+            run["bytes"] += entry["bytes"]
+            run["file_bytes"] += entry.get("file_bytes", 0)
+            for name, stats in entry["tables"].items():
+                run["records"][name] = run["records"].get(name, 0) + stats["records"]
+        json.dump(runs, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        return
+
+    written = replay(
+        args.journal_dir,
+        sys.stdout,
+        table=args.table,
+        since=_key_datetime(args.since) if args.since else None,
+        until=_key_datetime(args.until) if args.until else None,
+        run=args.run,
+    )
+    LOGGER.info(f"replayed {written} records")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import threading
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+import singer
+
+LOGGER = singer.get_logger()
+
+# endpoint classes of the salesforce api, requests are timed and limited per class
+LOGIN = "login"
+DESCRIBE = "describe"
+QUERY = "query"
+
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUTS: Dict[str, Tuple[float, float]] = {
+    LOGIN: (10.0, 30.0),
+    DESCRIBE: (10.0, 120.0),
+    QUERY: (10.0, 300.0),
+}
+
+DEFAULT_HEDGE_BUDGET = 20
+# a page is requested again once it takes this many times the p99, and at least the minimum
+HEDGE_FACTOR = 2.0
+MIN_HEDGE_DELAY_SECONDS = 1.0
+
+# latencies kept per endpoint class, and the samples needed before a percentile is used
+_WINDOW = 500
+_MIN_SAMPLES = 20
+
+
+def endpoint(path: str) -> str:
+    """returns the endpoint class of an api path"""
+    if "/query" in path or "/composite" in path:
+        return QUERY
+    return DESCRIBE
+
+
+class LatencyTracker:
+    """
+    keeps the latencies of the recent requests of every endpoint class, to report them at
+    the end of the run and to tell when a request is much slower than usual
+    """
+
+    def __init__(self, window: int = _WINDOW):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint_class: str, seconds: float):
+        with self._lock:
+            samples = self._samples.get(endpoint_class)
+            if samples is None:
+                samples = self._samples[endpoint_class] = deque(maxlen=self.window)
+            samples.append(seconds)
+            self._counts[endpoint_class] = self._counts.get(endpoint_class, 0) + 1
+
+    def requests(self, endpoint_class: str) -> int:
+        return self._counts.get(endpoint_class, 0)
+
+    def percentile(self, endpoint_class: str, percentile: float) -> Optional[float]:
+        """returns the percentile of the recent latencies, None until there are enough of them"""
+        with self._lock:
+            samples = sorted(self._samples.get(endpoint_class, ()))
+        if len(samples) < _MIN_SAMPLES:
+            return None
+        return samples[min(int(len(samples) * percentile / 100), len(samples) - 1)]
+
+    def report(self) -> Dict:
+        report = {}
+        for endpoint_class in list(self._samples):
+            with self._lock:
+                samples = sorted(self._samples[endpoint_class])
+            report[endpoint_class] = {
+                "requests": self._counts[endpoint_class],
+                "p50": round(samples[len(samples) // 2], 3),
+                "p99": round(samples[min(int(len(samples) * 0.99), len(samples) - 1)], 3),
+                "max": round(samples[-1], 3),
+            }
+        if report:
+            LOGGER.info(f"request latency: {report}")
+        return report
@@ -0,0 +1,255 @@
+import os
+import sys
+import time
+import shelve
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import singer
+
+from tap_salesforce.rows import FieldIndex
+
+LOGGER = singer.get_logger()
+
+# salesforce returns between 200 and 2000 records per query page
+MAX_PAGE_SIZE = 2000
+MIN_PAGE_SIZE = 200
+
+# pressure levels of the governor
+OK = 0
+SOFT = 1
+HARD = 2
+
+_PAGE_BYTES = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _value_bytes(value: Any) -> int:
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            sys.getsizeof(key) + _value_bytes(item) for key, item in value.items()
+        )
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_value_bytes(item) for item in value)
+    return sys.getsizeof(value)
+
+
+def row_bytes(values: Iterable[Any]) -> int:
+    """
+    estimates the memory used by a buffered row or record from the sizes of its values,
+    nested values (compound fields, attributes) are counted with their contents
+    """
+    values = list(values)
+    return sys.getsizeof(values) + sum(_value_bytes(value) for value in values)
+
+
+def rss_bytes() -> Optional[int]:
+    """returns the resident set size of the process, None where /proc is not available"""
+    try:
+        with open("/proc/self/statm", encoding="ascii") as f:
+            return int(f.read().split()[1]) * _PAGE_BYTES
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class MemoryGovernor:
+    """
+    keeps the records buffered by the process below a budget. the buffers that hold
+    records (query pages, prefetched pages, pipelined pages, the merge buffer, columnar
+    output buffers) report their size to the governor and ask it for the pressure before
+    they grow:
+
+    - above `soft_ratio` of the budget new queries ask for smaller pages, the merge
+      buffer is spilled to disk and output buffers are flushed early
+    - above the budget the pipeline fetcher waits before reading the next page, until
+      the writer has released pages or `max_wait_seconds` has passed
+
+    the tracked sizes are estimates, so the resident set size of the process is checked
+    as well: at `rss_ratio` times the budget the governor reports hard pressure whatever
+    the buffers report. the rss is read at most every `rss_interval_seconds`.
+
+    without a budget the governor never reports pressure. one governor is shared by the
+    whole process, see `GOVERNOR`.
+    """
+
+    budget: Optional[int] = None
+
+    def __init__(self, soft_ratio: float = 0.8, rss_ratio: float = 2.0, rss_interval_seconds: float = 0.5):
+        self.soft_ratio = soft_ratio
+        self.rss_ratio = rss_ratio
+        self.rss_interval_seconds = rss_interval_seconds
+        self._rss: Optional[int] = None
+        self._rss_read_at: Optional[float] = None
+        self.max_wait_seconds = 30.0
+        self.page_size = MAX_PAGE_SIZE
+        self._buffers: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, budget_bytes: Optional[int], max_wait_seconds: float = 30.0):
+        self.budget = budget_bytes
+        self.max_wait_seconds = max_wait_seconds
+        self.page_size = MAX_PAGE_SIZE
+        self._rss_read_at = None
+        if budget_bytes:
+            LOGGER.info(f"memory budget is {budget_bytes // (1024 * 1024)}MB")
+
+    def track(self, name: str, size_bytes: int):
+        with self._lock:
+            if size_bytes > 0:
+                self._buffers[name] = size_bytes
+            else:
+                self._buffers.pop(name, None)
+
+    def tracked_bytes(self) -> int:
+        with self._lock:
+            return sum(self._buffers.values())
+
+    def rss(self) -> Optional[int]:
+        """returns the resident set size of the process, read again after `rss_interval_seconds`"""
+        now = time.monotonic()
+        if self._rss_read_at is None or now - self._rss_read_at >= self.rss_interval_seconds:
+            self._rss = rss_bytes()
+            self._rss_read_at = now
+        return self._rss
+
+    def pressure(self) -> int:
+        if not self.budget:
+            return OK
+
+        rss = self.rss()
+        if rss is not None and rss >= self.budget * self.rss_ratio:
+            return HARD
+
+        used = self.tracked_bytes()
+        if used >= self.budget:
+            return HARD
+        if used >= self.budget * self.soft_ratio:
+            return SOFT
+        return OK
+
+    def query_page_size(self) -> Optional[int]:
+        """returns the batch size new queries ask for, None while no pressure was seen"""
+        pressure = self.pressure()
+        if pressure != OK and self.page_size > MIN_PAGE_SIZE:
+            self.page_size = max(self.page_size // 2, MIN_PAGE_SIZE)
+            LOGGER.info(f"memory pressure, querying pages of {self.page_size} records")
+        elif pressure == OK and self.page_size < MAX_PAGE_SIZE:
+            self.page_size = min(self.page_size * 2, MAX_PAGE_SIZE)
+
+        if self.page_size == MAX_PAGE_SIZE:
+            return None
+        return self.page_size
+
+    def wait_for_capacity(self):
+        """
+        blocks the calling fetcher while the buffers are above the budget, only call it
+        from a thread whose buffers are released by another thread
+        """
+        if self.pressure() != HARD:
+            return
+
+        started = time.monotonic()
+        while self.pressure() == HARD:
+            if time.monotonic() - started >= self.max_wait_seconds:
+                LOGGER.warning(
+                    f"memory budget exceeded for {self.max_wait_seconds}s, continuing. "
+                    f"rss: {self._rss}, buffers: {self._buffers}"
+                )
+                return
+            time.sleep(0.1)
+
+
+GOVERNOR = MemoryGovernor()
+
+_MISSING = object()
+
+
+class SpillBuffer:
+    """
+    an insertion ordered buffer of records by primary key whose records can be moved to a
+    shelve file on disk, the replication key of spilled records stays in memory. records
+    are buffered as rows of the table's field index.
+    """
+
+    def __init__(self, replication_key: Optional[str], index: Optional[FieldIndex] = None):
+        self.replication_key = replication_key
+        self.index = index or FieldIndex()
+        self.spilled = 0
+        # rows that are not on disk, and the estimated size of the last merged one
+        self._in_memory = 0
+        self._row_bytes = 0
+        # primary key -> row, or None while the row is on disk
+        self._records: "OrderedDict[str, Optional[List[Any]]]" = OrderedDict()
+        self._keys: Dict[str, Any] = {}
+        self._directory: Optional[str] = None
+        self._shelf: Optional[shelve.Shelf] = None
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def memory_bytes(self) -> int:
+        """estimates the memory used by the rows that are not on disk"""
+        return self._in_memory * self._row_bytes
+
+    def merge(self, pk: str, record: Dict):
+        current = self._records.get(pk, _MISSING)
+        if current is _MISSING:
+            current = self._records[pk] = self.index.row(record)
+            self._in_memory += 1
+        elif current is None:
+            current = self._records[pk] = self.index.merge(self._load(pk), record)
+            self._in_memory += 1
+        else:
+            self.index.merge(current, record)
+        self._records.move_to_end(pk)
+        if self._in_memory == 1 or self._in_memory % 1000 == 0:
+            self._row_bytes = row_bytes(current)
+
+    def pop_oldest(self) -> Dict:
+        pk, row = self._records.popitem(last=False)
+        if row is None:
+            row = self._load(pk)
+        else:
+            self._in_memory -= 1
+        return self.index.record(row)
+
+    def pairs(self) -> Iterator[Tuple[Any, str]]:
+        """yields the (replication key, primary key) pair of every buffered record"""
+        for pk, row in self._records.items():
+            if row is None:
+                yield self._keys[pk], pk
+            else:
+                yield self.index.get(row, self.replication_key), pk
+
+    def spill(self):
+        """moves the buffered records to disk"""
+        if self._shelf is None:
+            self._directory = tempfile.mkdtemp(prefix="tap-salesforce-merge-")
+            self._shelf = shelve.open(os.path.join(self._directory, "buffer"))
+
+        count = 0
+        for pk, row in self._records.items():
+            if row is None:
+                continue
+            self._shelf[pk] = row
+            if self.replication_key is not None:
+                self._keys[pk] = self.index.get(row, self.replication_key)
+            self._records[pk] = None
+            count += 1
+        self.spilled += count
+        self._in_memory = 0
+        LOGGER.info(f"spilled {count} merge buffer records to {self._directory}")
+
+    def close(self):
+        if self._shelf is None:
+            return
+        self._shelf.close()
+        for name in os.listdir(self._directory):
+            os.remove(os.path.join(self._directory, name))
+        os.rmdir(self._directory)
+        self._shelf = None
+
+    def _load(self, pk: str) -> List[Any]:
+        self._keys.pop(pk, None)
+        return self._shelf.pop(pk)
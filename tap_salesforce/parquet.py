@@ -0,0 +1,277 @@
+import os
+import json
+from datetime import datetime, date, timezone
+from typing import Any, Callable, Dict, List, Optional, TextIO
+
+import singer
+
+from tap_salesforce.stream import Stream
+from tap_salesforce.exceptions import TapSalesforceException
+from tap_salesforce.catalog import STRING_TYPES
+from tap_salesforce.converter import METADATA_KEYS
+from tap_salesforce.memory import GOVERNOR, OK, row_bytes
+
+LOGGER = singer.get_logger()
+
+DEFAULT_ROW_GROUP_SIZE = 50000
+DEFAULT_PART_MAX_ROWS = 1000000
+# buffered rows between checks of the memory pressure
+_MEMORY_CHECK_INTERVAL = 1000
+
+# salesforce describe field types grouped by the arrow type they are written as,
+# every type not listed here (compound address/location, anyType, ...) is json encoded
+BOOLEAN_TYPES = {"boolean"}
+INTEGER_TYPES = {"int", "long"}
+DOUBLE_TYPES = {"double", "currency", "percent"}
+DATE_TYPES = {"date"}
+DATETIME_TYPES = {"datetime"}
+
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+# columns of records the tap adds itself, e.g. the tombstones of deleted records
+SDC_FIELDS = [{"name": "_sdc_deleted_at", "type": "datetime"}]
+
+
+def _parse_datetime(value: Any) -> Optional[datetime]:
+    if value is None or isinstance(value, datetime):
+        return value
+    try:
+        parsed = datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%f%z")
+    except ValueError:
+        # datetimes the tap writes itself are in isoformat, e.g. _sdc_deleted_at
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return parsed.astimezone(timezone.utc)
+
+
+def _parse_date(value: Any) -> Optional[date]:
+    if value is None or isinstance(value, date):
+        return value
+    return date.fromisoformat(value)
+
+
+def _encode_json(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _identity(value: Any) -> Any:
+    return value
+
+
+class _Column:
+    name: str
+    arrow_type: Any
+    convert: Callable[[Any], Any]
+
+    def __init__(self, pa, field: Dict):
+        self.name = field["name"]
+        field_type = field.get("type")
+
+        if field_type in STRING_TYPES:
+            self.arrow_type, self.convert = pa.string(), _identity
+        elif field_type in BOOLEAN_TYPES:
+            self.arrow_type, self.convert = pa.bool_(), _identity
+        elif field_type in INTEGER_TYPES:
+            self.arrow_type, self.convert = pa.int64(), _identity
+        elif field_type in DOUBLE_TYPES:
+            self.arrow_type, self.convert = pa.float64(), _identity
+        elif field_type in DATE_TYPES:
+            self.arrow_type, self.convert = pa.date32(), _parse_date
+        elif field_type in DATETIME_TYPES:
+            self.arrow_type, self.convert = pa.timestamp("ms", tz="UTC"), _parse_datetime
+        else:
+            self.arrow_type, self.convert = pa.string(), _encode_json
+
+
+class _TableWriter:
+    """buffers the records of one part file of a table column-wise and writes them as record batches"""
+
+    def __init__(
+        self,
+        pa,
+        stream_id: str,
+        path: str,
+        fields: List[Dict],
+        file_format: str,
+        compression: Optional[str],
+    ):
+        self._pa = pa
+        self.stream_id = stream_id
+        self.path = path
+        self.file_format = file_format
+        self.columns = [_Column(pa, field) for field in fields]
+        self.schema = pa.schema([(c.name, c.arrow_type) for c in self.columns])
+        self.rows = 0
+        self._buffer: Dict[str, List[Any]] = {c.name: [] for c in self.columns}
+        self._names = set(self._buffer) | METADATA_KEYS
+
+        if file_format == "parquet":
+            import pyarrow.parquet as pq
+
+            self._writer = pq.ParquetWriter(path, self.schema, compression=compression or "snappy")
+        else:
+            import pyarrow.ipc as ipc
+
+            options = ipc.IpcWriteOptions(compression=compression)
+            self._writer = ipc.new_file(path, self.schema, options=options)
+
+    def __len__(self) -> int:
+        return len(self._buffer[self.columns[0].name]) if self.columns else 0
+
+    def append(self, record: Dict):
+        if not self._names.issuperset(record):
+            unknown = sorted(set(record) - self._names)
+            raise TapSalesforceException(
+                f"record of {self.stream_id} has fields that are not in its {self.file_format} schema: {unknown}"
+            )
+        for column in self.columns:
+            self._buffer[column.name].append(record.get(column.name))
+
+    def flush(self):
+        size = len(self)
+        if size == 0:
+            return
+
+        arrays = []
+        for column in self.columns:
+            values = self._buffer[column.name]
+            if column.convert is not _identity:
+                values = [column.convert(v) for v in values]
+            arrays.append(self._pa.array(values, type=column.arrow_type))
+            self._buffer[column.name] = []
+        GOVERNOR.track(self.path, 0)
+
+        batch = self._pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+        if self.file_format == "parquet":
+            # every flush becomes one row group
+            self._writer.write_table(self._pa.Table.from_batches([batch]))
+        else:
+            self._writer.write_batch(batch)
+        self.rows += size
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+
+
+class ParquetStream(Stream):
+    """
+    writes the records of every table as record batches to columnar part files per table,
+    the schema is built from the describe fields registered with `set_table_fields`.
+    streams without registered fields (e.g. the {table}Fields streams) are still written to
+    stdout as singer messages.
+
+    a part is finished, with its footer, once it has `part_max_rows` records. a STATE is
+    held back until the parts with the records it covers are finished, it is emitted after
+    them, so every emitted STATE only covers records of complete files.
+    """
+
+    def __init__(
+        self,
+        state: Optional[Dict] = None,
+        output: Optional[TextIO] = None,
+        output_dir: str = ".",
+        file_format: str = "parquet",
+        row_group_size: int = DEFAULT_ROW_GROUP_SIZE,
+        compression: Optional[str] = None,
+        part_max_rows: int = DEFAULT_PART_MAX_ROWS,
+    ):
+        super().__init__(state, output)
+
+        if file_format not in FORMATS:
+            raise TapSalesforceException(
+                f"unsupported columnar output format {file_format}, expected one of {list(FORMATS)}"
+            )
+        if row_group_size < 1 or part_max_rows < 1:
+            raise TapSalesforceException(
+                f"invalid row_group_size ({row_group_size}) or part_max_rows ({part_max_rows}): must be greater than 0"
+            )
+
+        try:
+            import pyarrow
+        except ImportError:
+            raise TapSalesforceException(
+                f"output_mode '{file_format}' requires pyarrow: pip install tap-salesforce[parquet]"
+            )
+
+        self._pa = pyarrow
+        self.output_dir = output_dir
+        self.file_format = file_format
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.part_max_rows = part_max_rows
+        self._run_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        self._writers: Dict[str, _TableWriter] = {}
+        self._part_numbers: Dict[str, int] = {}
+        self._fields: Dict[str, List[Dict]] = {}
+        # the last STATE, until the parts with the records it covers are finished
+        self._pending_state: Optional[Dict] = None
+
+    def set_table_fields(self, stream_id: str, fields: List[Dict]):
+        names = {field["name"] for field in fields}
+        self._fields[stream_id] = fields + [
+            field for field in SDC_FIELDS if field["name"] not in names
+        ]
+
+    def write_record(self, record: Dict, stream_id: str, file: Optional[TextIO] = None):
+        writer = self._writers.get(stream_id)
+        if writer is None:
+            if stream_id not in self._fields:
+                super().write_record(record, stream_id, file=file)
+                return
+            writer = self._open(stream_id)
+
+        writer.append(record)
+        if writer.rows + len(writer) >= self.part_max_rows:
+            self._finish_parts(file)
+        elif len(writer) >= self.row_group_size:
+            writer.flush()
+        elif len(writer) % _MEMORY_CHECK_INTERVAL == 0:
+            GOVERNOR.track(writer.path, len(writer) * row_bytes(record.values()))
+            if GOVERNOR.pressure() != OK:
+                # write a smaller row group instead of growing the buffer past the memory budget
+                writer.flush()
+
+    def write_state(self, file: Optional[TextIO] = None):
+        self._pending_state = self.get_state()
+        if not self._writers:
+            self._write_pending_state(file)
+
+    def close(self):
+        self._finish_parts(None)
+        super().close()
+
+    def _open(self, stream_id: str) -> _TableWriter:
+        directory = os.path.join(self.output_dir, stream_id)
+        os.makedirs(directory, exist_ok=True)
+
+        number = self._part_numbers.get(stream_id, 0)
+        self._part_numbers[stream_id] = number + 1
+        path = os.path.join(
+            directory,
+            f"{stream_id}-{self._run_id}-{number:05d}{FORMATS[self.file_format]}",
+        )
+        writer = _TableWriter(
+            self._pa,
+            stream_id,
+            path,
+            self._fields[stream_id],
+            self.file_format,
+            self.compression,
+        )
+        self._writers[stream_id] = writer
+        return writer
+
+    def _finish_parts(self, file: Optional[TextIO]):
+        # a STATE covers the records of every table, so all open parts are finished
+        for stream_id, writer in self._writers.items():
+            writer.close()
+            LOGGER.info(f"wrote {writer.rows} records of {stream_id} to {writer.path}")
+        self._writers = {}
+        self._write_pending_state(file)
+
+    def _write_pending_state(self, file: Optional[TextIO]):
+        if self._pending_state is not None:
+            self.write_message(dict(type="STATE", value=self._pending_state), file=file)
+            self._pending_state = None
@@ -0,0 +1,119 @@
+import re
+import json
+from typing import Dict, List, Optional, Tuple
+
+# salesforce writes the attributes of a record first, a record of the records array
+# starts after the array bracket or the comma between records. quotes inside string
+# values are escaped, so a value can never look like the start of a record.
+_RECORD_START = re.compile(rb'[\[,]\s*(\{)\s*"attributes"\s*:')
+_RECORDS = re.compile(rb'"records"\s*:\s*\[')
+# a string with its escapes, or a bracket
+_TOKENS = re.compile(rb'"(?:[^"\\]|\\.)*"|[{}\[\]]')
+
+_field_patterns: Dict[str, "re.Pattern[bytes]"] = {}
+
+
+def _field_pattern(name: str) -> "re.Pattern[bytes]":
+    pattern = _field_patterns.get(name)
+    if pattern is None:
+        pattern = _field_patterns[name] = re.compile(
+            b'"' + re.escape(name.encode("utf-8")) + rb'"\s*:\s*"([^"\\]*)"'
+        )
+    return pattern
+
+
+def split_page(raw: bytes) -> Optional[List[bytes]]:
+    """
+    returns the raw bytes of every record of a query result page, without decoding it.
+    returns None when the page does not have the layout salesforce writes, so it has to
+    be decoded instead.
+    """
+    records = _RECORDS.search(raw)
+    if records is None:
+        return None
+    start = records.end() - 1
+
+    end = raw.rfind(b"]")
+    if end < start or raw[end + 1 :].strip() != b"}":
+        # the records array is not the last member of the page
+        return None
+    if not raw[start + 1 : end].strip():
+        return []
+
+    matches = list(_RECORD_START.finditer(raw, start, end))
+    if not matches or matches[0].start() != start:
+        return None
+    bounds = [match.start() for match in matches[1:]] + [end]
+    return [
+        raw[match.start(1) : bound].rstrip() for match, bound in zip(matches, bounds)
+    ]
+
+
+def field_value(record: bytes, name: str) -> Optional[str]:
+    """returns the string value of a top level field of raw record bytes, None when it is null"""
+    match = _field_pattern(name).search(record)
+    # only the record and its attributes were opened before the match, so it is top level
+    if (
+        match is not None
+        and record.count(b"{", 0, match.start()) == 2
+        and record.count(b"}", 0, match.start()) == 1
+    ):
+        return match.group(1).decode("utf-8")
+    return _top_level_value(record, name)
+
+
+def _top_level_value(record: bytes, name: str) -> Optional[str]:
+    """
+    scans the strings and brackets of the record for the field, for values with escaped
+    characters and records with nested objects before the field
+    """
+    key = json.dumps(name).encode("utf-8")
+    depth = 0
+    tokens = _TOKENS.finditer(record)
+    for token in tokens:
+        value = token.group()
+        if value in (b"{", b"["):
+            depth += 1
+        elif value in (b"}", b"]"):
+            depth -= 1
+        elif depth == 1 and value == key and record[token.end() :].lstrip().startswith(b":"):
+            rest = record[token.end() :].lstrip()[1:].lstrip()
+            if not rest.startswith(b'"'):
+                # null, or not a string
+                return None
+            return json.loads(next(tokens).group())
+    return None
+
+
+def passthrough_page(
+    raw: bytes,
+    stream_id: str,
+    time_extracted: str,
+    replication_key: Optional[str],
+) -> Optional[List[Tuple[Optional[str], Optional[str], str]]]:
+    """
+    builds the RECORD messages of a page around the original record bytes. only the Id and
+    the replication key are read from the records, for the bookmark, checkpoint and overlap
+    filter.
+    """
+    records = split_page(raw)
+    if records is None:
+        return None
+
+    envelope = (
+        '{"type": "RECORD", "stream": '
+        + json.dumps(stream_id)
+        + ', "time_extracted": '
+        + json.dumps(time_extracted)
+        + ', "record": '
+    )
+    page = []
+    for record in records:
+        page.append(
+            (
+                field_value(record, "Id"),
+                field_value(record, replication_key) if replication_key else None,
+                envelope + record.decode("utf-8", errors="replace") + "}",
+            )
+        )
+    return page
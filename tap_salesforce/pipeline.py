@@ -0,0 +1,287 @@
+import re
+import json
+import queue
+import itertools
+import threading
+import multiprocessing
+from collections import deque
+from datetime import datetime, timezone
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Deque, List, Optional, Tuple
+
+import singer
+
+from tap_salesforce.client import Salesforce, Table, MAX_QUERY_LENGTH
+from tap_salesforce.checkpoint import Checkpoint
+from tap_salesforce.converter import RecordConverter
+from tap_salesforce.dedupe import OverlapFilter
+from tap_salesforce.memory import GOVERNOR
+from tap_salesforce.passthrough import passthrough_page
+from tap_salesforce.stream import Stream, serialize
+from tap_salesforce.exceptions import SalesforceException, PipelineError
+
+LOGGER = singer.get_logger()
+
+DEFAULT_PIPELINE_QUEUE_SIZE = 8
+
+# quotes inside string values are escaped and record fields cannot have this name, so this
+# only matches the key of the response object, which salesforce writes before the records
+_NEXT_RECORDS_URL = re.compile(rb'"nextRecordsUrl"\s*:\s*"([^"]+)"')
+
+_DONE = object()
+
+_pages = itertools.count()
+
+
+def next_records_url(raw: bytes) -> Optional[str]:
+    match = _NEXT_RECORDS_URL.search(raw)
+    return match.group(1).decode("utf-8") if match else None
+
+
+def decode_page(
+    raw: bytes,
+    stream_id: str,
+    replication_key: Optional[str],
+    converter: Optional[RecordConverter],
+    passthrough: bool = False,
+) -> List[Tuple[Optional[str], Optional[str], str]]:
+    """
+    decodes a page and encodes its RECORD messages, runs in a worker process. returns the
+    (Id, replication key, message) of every record of the page.
+    """
+    time_extracted = datetime.now(timezone.utc).isoformat() + "Z"
+    if passthrough and converter is None:
+        page = passthrough_page(raw, stream_id, time_extracted, replication_key)
+        if page is not None:
+            return page
+
+    page = []
+    for record in json.loads(raw).get("records", []):
+        record_id = record.get("Id")
+        key = record.get(replication_key) if replication_key else None
+        if converter is not None:
+            record = converter(record)
+        line = serialize(
+            dict(
+                type="RECORD",
+                stream=stream_id,
+                time_extracted=time_extracted,
+                record=record,
+            )
+        )
+        page.append((record_id, key, line))
+    return page
+
+
+class _Fetcher(threading.Thread):
+    """
+    reads the raw pages of a query into a bounded queue, in order. queued pages are tracked
+    by the memory governor until the writer releases them, the fetcher waits while the
+    buffers are above the budget.
+    """
+
+    def __init__(self, sf: Salesforce, query: str, pages: queue.Queue):
+        super().__init__(daemon=True)
+        self.sf = sf
+        self.query = query
+        self.pages = pages
+        self.error: Optional[Exception] = None
+        self.stopped = threading.Event()
+
+    def run(self):
+        path = f"/services/data/{self.sf.api_version}/queryAll/"
+        params = {"q": self.query}
+        headers = None
+        page_size = GOVERNOR.query_page_size()
+        if page_size is not None:
+            headers = {"Sforce-Query-Options": f"batchSize={page_size}"}
+        prefetched = self.sf.take_prefetched(self.query)
+        # locator url of the current page, the first page of a query has none
+        locator = None
+        try:
+            while not self.stopped.is_set():
+                if prefetched is not None:
+                    raw = json.dumps(prefetched).encode("utf-8")
+                    prefetched = None
+                else:
+                    GOVERNOR.wait_for_capacity()
+                    if locator is None:
+                        resp = self.sf.request("GET", path, params=params, headers=headers)
+                    else:
+                        resp = self.sf.next_page(path, headers)
+                    raw = resp.content
+                buffer_name = f"pipelined page {next(_pages)}"
+                GOVERNOR.track(buffer_name, len(raw))
+                self.pages.put((buffer_name, locator, raw))
+
+                next_url = next_records_url(raw)
+                if next_url is None:
+                    break
+                path, params, locator = next_url, None, next_url
+        except Exception as e:
+            self.error = e
+        finally:
+            self.pages.put(_DONE)
+
+
+class Pipeline:
+    """
+    runs a sync window in stages: a thread fetches raw pages and finds the next page
+    in the raw bytes, a process pool decodes the pages and encodes their RECORD messages,
+    and the calling thread writes the pages in order and keeps the state and checkpoint.
+
+    without workers the pages are decoded by the calling thread. with `passthrough` the
+    records of unconverted pages are written as the bytes salesforce returned, inside
+    their RECORD envelope, instead of being decoded and encoded again.
+
+    only plain singer output of a fresh window is pipelined, `supports` tells when the
+    regular sync has to be used instead.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        passthrough: bool = False,
+        queue_size: int = DEFAULT_PIPELINE_QUEUE_SIZE,
+    ):
+        self.workers = workers
+        self.passthrough = passthrough
+        self.queue_size = queue_size
+        self._pool = None
+        if workers > 0:
+            # workers are started while the fetcher thread runs, so they must not be forked
+            self._pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+
+    def supports(
+        self,
+        sf: Salesforce,
+        stream: Stream,
+        table: Table,
+        query: str,
+        checkpoint: Checkpoint,
+    ) -> bool:
+        return (
+            type(stream) is Stream
+            and stream.journal is None
+            and len(query) <= MAX_QUERY_LENGTH
+            and checkpoint.cursor is None
+            and checkpoint.after is None
+            and (sf.query_plan_advisor is None or sf.tenant_filter(table) is None)
+        )
+
+    def sync(
+        self,
+        sf: Salesforce,
+        stream: Stream,
+        table: Table,
+        query: str,
+        checkpoint: Checkpoint,
+        checkpoint_interval: int,
+        converter: Optional[RecordConverter] = None,
+        overlap_filter: Optional[OverlapFilter] = None,
+    ) -> int:
+        """syncs the window of the query, returns the number of records read"""
+        LOGGER.info(f"pipelined: {query}")
+        sf.retries.table = table.name
+        pages: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        fetcher = _Fetcher(sf, query, pages)
+        fetcher.start()
+
+        pending: Deque[Tuple[str, Optional[str], Future]] = deque()
+        read = 0
+        try:
+            fetching = True
+            while fetching or pending:
+                # keep the workers busy, while the oldest page is written
+                while fetching and len(pending) < max(self.workers * 2, 1):
+                    item = pages.get()
+                    if item is _DONE:
+                        fetching = False
+                        break
+                    buffer_name, locator, raw = item
+                    args = (
+                        raw,
+                        table.name,
+                        table.replication_key,
+                        converter,
+                        self.passthrough,
+                    )
+                    if self._pool is None:
+                        future = Future()
+                        future.set_result(decode_page(*args))
+                    else:
+                        future = self._pool.submit(decode_page, *args)
+                    pending.append((buffer_name, locator, future))
+
+                if not pending:
+                    break
+                buffer_name, locator, future = pending.popleft()
+                page = future.result()
+                previous = read
+                read += len(page)
+                self._write_page(stream, table, page, locator, checkpoint, overlap_filter)
+                GOVERNOR.track(buffer_name, 0)
+
+                if read // checkpoint_interval > previous // checkpoint_interval:
+                    stream.set_stream_state(table.name, "checkpoint", checkpoint.to_dict())
+                    stream.write_state()
+        finally:
+            fetcher.stopped.set()
+            for buffer_name, _, future in pending:
+                future.cancel()
+                GOVERNOR.track(buffer_name, 0)
+            # unblock the fetcher if it waits for room in the queue
+            while fetcher.is_alive() or not pages.empty():
+                try:
+                    item = pages.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if item is not _DONE:
+                    GOVERNOR.track(item[0], 0)
+
+        if fetcher.error is not None:
+            if isinstance(fetcher.error, SalesforceException):
+                raise PipelineError(fetcher.error)
+            raise fetcher.error
+        return read
+
+    def _write_page(
+        self,
+        stream: Stream,
+        table: Table,
+        page: List[Tuple[Optional[str], Optional[str], str]],
+        locator: Optional[str],
+        checkpoint: Checkpoint,
+        overlap_filter: Optional[OverlapFilter],
+    ):
+        if not page:
+            return
+
+        if overlap_filter is None:
+            stream.write_lines([line for _, _, line in page])
+        else:
+            lines = []
+            for record_id, key, line in page:
+                if not overlap_filter.is_duplicate(record_id, key):
+                    lines.append(line)
+                overlap_filter.add(record_id, key, _parse_key(key))
+            stream.write_lines(lines)
+
+        record_id, key, _ = page[-1]
+        if table.replication_key:
+            # like the regular sync, records are identified by their Id
+            checkpoint.record_emitted(
+                {table.replication_key: key, "Id": record_id}, table.replication_key, "Id"
+            )
+            stream.set_stream_state(table.name, table.replication_key, _parse_key(key))
+        checkpoint.set_cursor(locator, len(page))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+
+
+def _parse_key(key: str) -> datetime:
+    return datetime.strptime(key, "%Y-%m-%dT%H:%M:%S.%f%z")
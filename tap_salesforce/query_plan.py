@@ -0,0 +1,199 @@
+import re
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple, TYPE_CHECKING
+
+import singer
+
+if TYPE_CHECKING:
+    from tap_salesforce.client import Salesforce, Table
+
+LOGGER = singer.get_logger()
+
+ADVISOR_MODES = ("off", "log", "auto")
+
+# replication keys that select the same changes, SystemModstamp is also bumped by system
+# changes, so switching between them is only ever recommended, never done automatically
+ALTERNATIVE_REPLICATION_KEYS = {
+    "SystemModstamp": "LastModifiedDate",
+    "LastModifiedDate": "SystemModstamp",
+}
+
+_LITERALS = re.compile(r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}Z|'[^']*'")
+
+
+class QueryPlan:
+    leading_operation: str
+    relative_cost: float
+    cardinality: int
+    sobject_cardinality: int
+
+    def __init__(self, plan: Dict):
+        self.leading_operation = plan.get("leadingOperationType", "Other")
+        self.relative_cost = float(plan.get("relativeCost", 0.0))
+        self.cardinality = int(plan.get("cardinality", 0))
+        self.sobject_cardinality = int(plan.get("sobjectCardinality", 0))
+
+    @property
+    def is_table_scan(self) -> bool:
+        return self.leading_operation == "TableScan"
+
+    def __str__(self) -> str:
+        return (
+            f"{self.leading_operation} (relative cost {self.relative_cost:.2f}, "
+            f"cardinality {self.cardinality} of {self.sobject_cardinality})"
+        )
+
+
+class QueryPlanAdvisor:
+    """
+    asks salesforce for the plan of the generated queries through the REST explain
+    endpoint, logs the leading operation and relative cost, and recommends cheaper
+    equivalent filters when a query would run as a table scan.
+
+    plans are cached per table and query shape (the query with its literals removed), so
+    every shape costs one explain request per run. in "auto" mode a tenant predicate that
+    turns an indexed query into a table scan is moved out of the query and applied to the
+    returned records instead.
+    """
+
+    def __init__(self, sf: "Salesforce", mode: str = "log"):
+        if mode not in ADVISOR_MODES:
+            raise ValueError(
+                f"invalid query_plan_advisor mode {mode}, expected one of {ADVISOR_MODES}"
+            )
+        self.sf = sf
+        self.mode = mode
+        self._plans: Dict[Tuple[str, str], Optional[QueryPlan]] = {}
+        self._decisions: Dict[str, bool] = {}
+
+    def plan(self, table: "Table", query: str) -> Optional[QueryPlan]:
+        key = (table.name, _LITERALS.sub("?", query))
+        if key not in self._plans:
+            self._plans[key] = self._explain(query)
+        return self._plans[key]
+
+    def use_tenant_filter(
+        self, table: "Table", fields: List[str], start_date: datetime, end_date: datetime
+    ) -> bool:
+        """reviews the plan of the table's window query, returns whether the tenant predicate stays in the query"""
+        if table.name in self._decisions:
+            return self._decisions[table.name]
+
+        query = self._window_query(table, fields, start_date, end_date)
+        plan = self.plan(table, query)
+        decision = True
+        if plan is not None:
+            LOGGER.info(f"query plan for {table.name}: {plan}")
+            if plan.is_table_scan:
+                self._recommend_replication_key(table, fields, start_date, end_date, plan)
+                decision = self._review_tenant_filter(table, fields, start_date, end_date)
+
+        self._decisions[table.name] = decision
+        return decision
+
+    def _window_query(
+        self,
+        table: "Table",
+        fields: List[str],
+        start_date: datetime,
+        end_date: datetime,
+        use_tenant_filter: bool = True,
+    ) -> str:
+        # the client module imports this one
+        from tap_salesforce.client import MAX_QUERY_LENGTH
+
+        query = self.sf.construct_query(
+            table, fields, start_date, end_date, use_tenant_filter=use_tenant_filter
+        )
+        if len(query) <= MAX_QUERY_LENGTH or not table.primary_key:
+            return query
+        # a long window query runs as field chunks with the same predicates, like the first chunk
+        chunk = next(self.sf.field_chunker(fields, 8000))
+        return self.sf.construct_query(
+            table,
+            chunk + [table.primary_key, table.replication_key],
+            start_date,
+            end_date,
+            use_tenant_filter=use_tenant_filter,
+        )
+
+    def _recommend_replication_key(
+        self,
+        table: "Table",
+        fields: List[str],
+        start_date: datetime,
+        end_date: datetime,
+        plan: QueryPlan,
+    ):
+        alternative = ALTERNATIVE_REPLICATION_KEYS.get(table.replication_key)
+        if alternative is None:
+            return
+
+        alternative_table = table.copy(update={"replication_key": alternative})
+        query = self._window_query(alternative_table, fields, start_date, end_date)
+        alternative_plan = self.plan(alternative_table, query)
+        if alternative_plan is None:
+            return
+
+        if not alternative_plan.is_table_scan or alternative_plan.relative_cost < plan.relative_cost:
+            LOGGER.warning(
+                f"query plan for {table.name} is a table scan on {table.replication_key}, "
+                f"filtering on {alternative} would be {alternative_plan}. "
+                f"Consider changing the replication key of {table.name} to {alternative}."
+            )
+
+    def _review_tenant_filter(
+        self, table: "Table", fields: List[str], start_date: datetime, end_date: datetime
+    ) -> bool:
+        if self.sf.tenant_filter(table) is None:
+            return True
+
+        query = self._window_query(
+            table, fields, start_date, end_date, use_tenant_filter=False
+        )
+        unfiltered_plan = self.plan(table, query)
+        if unfiltered_plan is None or unfiltered_plan.is_table_scan:
+            return True
+
+        if self.mode != "auto":
+            LOGGER.warning(
+                f"query plan for {table.name} is a table scan because of the tenant predicate, "
+                f"without it the query would be {unfiltered_plan}. "
+                f"Set query_plan_advisor to 'auto' to filter the records after querying them."
+            )
+            return True
+
+        LOGGER.info(
+            f"tenant predicate of {table.name} makes the query a table scan, filtering the records after querying them instead"
+        )
+        return False
+
+    def _explain(self, query: str) -> Optional[QueryPlan]:
+        # the plan is only advice, a query that cannot be explained is synced without it
+        try:
+            resp = self.sf.request(
+                "GET",
+                f"/services/data/{self.sf.api_version}/query/",
+                params={"explain": query},
+            )
+            plans = resp.json().get("plans", [])
+        except Exception as e:
+            LOGGER.warning(f"failed to explain query: {e}")
+            return None
+
+        if not plans:
+            return None
+        # salesforce returns the plans ordered by relative cost, the first one is used
+        return QueryPlan(plans[0])
+
+
+def filter_records(
+    records: Iterator[Dict], tenant_filter: Tuple[str, Tuple[str, ...]], strip: bool = False
+) -> Iterator[Dict]:
+    """yields the records of the tenant, `strip` removes the tenant field from them"""
+    field, values = tenant_filter
+    for record in records:
+        if record.get(field) in values:
+            if strip:
+                record.pop(field, None)
+            yield record
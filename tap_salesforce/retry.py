@@ -0,0 +1,153 @@
+import time
+import random
+from collections import Counter
+from typing import Dict, Optional
+
+import singer
+import requests
+
+from tap_salesforce.exceptions import SalesforceException
+
+LOGGER = singer.get_logger()
+
+DEFAULT_MAX_TRIES = 5
+DEFAULT_RETRY_BUDGET_PER_RUN = 100
+DEFAULT_RETRY_BUDGET_PER_TABLE = 25
+
+# salesforce error codes that can succeed when the same request is sent again
+RETRYABLE_CODES = {
+    "FUNCTIONALITY_TEMPORARILY_UNAVAILABLE",
+    "UNEXPECTED",
+    "SERVER_UNAVAILABLE",
+    "UNABLE_TO_LOCK_ROW",
+    "REQUEST_RUNNING_TOO_LONG",
+}
+
+# codes that are only retried after logging in again
+SESSION_CODES = {"SESSION_EXPIRED", "INVALID_SESSION_ID"}
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+RETRYABLE_REQUEST_EXCEPTIONS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+)
+
+
+class RetryBudgetExhausted(Exception):
+    pass
+
+
+def classify(error: Exception, status_code: Optional[int] = None) -> Optional[str]:
+    """
+    returns the cause a failed request is retried for, or None when the error is fatal.
+    permanent errors such as MALFORMED_QUERY or INVALID_FIELD fail on the first attempt,
+    QUERY_TIMEOUT is not retried either, the caller shrinks the window of the query instead.
+    """
+    if isinstance(error, RETRYABLE_REQUEST_EXCEPTIONS):
+        return type(error).__name__
+
+    if isinstance(error, SalesforceException):
+        if error.code in RETRYABLE_CODES or error.code in SESSION_CODES:
+            return error.code
+        # the concurrent request limit frees up, the daily request limit does not
+        if error.code == "REQUEST_LIMIT_EXCEEDED" and "Concurrent" in str(error):
+            return error.code
+        if error.code == "UNKNOWN" and status_code in RETRYABLE_STATUS_CODES:
+            return f"HTTP {status_code}"
+        return None
+
+    if isinstance(error, requests.exceptions.HTTPError):
+        if status_code in RETRYABLE_STATUS_CODES:
+            return f"HTTP {status_code}"
+    return None
+
+
+def retry_after(resp: Optional[requests.Response]) -> Optional[float]:
+    if resp is None:
+        return None
+    value = resp.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        return None
+
+
+class RetryEngine:
+    """
+    decides whether and when a failed request is sent again. retries wait with full jitter
+    exponential backoff, or the Retry-After of the response, and are limited per request,
+    per table and per run. the number of retries and the time spent waiting are reported
+    per cause.
+    """
+
+    table: Optional[str] = None
+
+    def __init__(
+        self,
+        max_tries: int = DEFAULT_MAX_TRIES,
+        budget_per_run: int = DEFAULT_RETRY_BUDGET_PER_RUN,
+        budget_per_table: int = DEFAULT_RETRY_BUDGET_PER_TABLE,
+        factor: float = 2.0,
+        max_wait: float = 120.0,
+    ):
+        self.max_tries = max_tries
+        self.budget_per_run = budget_per_run
+        self.budget_per_table = budget_per_table
+        self.factor = factor
+        self.max_wait = max_wait
+
+        self.retries = 0
+        self.waited = 0.0
+        self.retries_by_cause: Counter = Counter()
+        self.retries_by_table: Counter = Counter()
+
+    def backoff(
+        self,
+        tries: int,
+        error: Exception,
+        resp: Optional[requests.Response] = None,
+    ) -> Optional[str]:
+        """
+        waits before the next attempt of a request that failed `tries` times and returns the
+        cause of the retry, returns None when the request must not be retried
+        """
+        cause = classify(error, resp.status_code if resp is not None else None)
+        if cause is None or tries >= self.max_tries:
+            return None
+
+        if self.retries >= self.budget_per_run:
+            LOGGER.warning(f"retry budget of {self.budget_per_run} retries per run is exhausted")
+            return None
+        if self.retries_by_table[self.table] >= self.budget_per_table:
+            LOGGER.warning(
+                f"retry budget of {self.budget_per_table} retries for {self.table} is exhausted"
+            )
+            return None
+
+        wait = retry_after(resp)
+        if wait is None:
+            wait = random.uniform(0, self.factor * 2 ** tries)
+        wait = min(wait, self.max_wait)
+
+        self.retries += 1
+        self.waited += wait
+        self.retries_by_cause[cause] += 1
+        self.retries_by_table[self.table] += 1
+        LOGGER.info(f"{cause}: retrying request in {wait:.1f}s, attempt {tries + 1} of {self.max_tries}")
+        time.sleep(wait)
+        return cause
+
+    def report(self) -> Dict:
+        report = {
+            "retries": self.retries,
+            "seconds_waited": round(self.waited, 1),
+            "by_cause": dict(self.retries_by_cause),
+            "by_table": {str(table): count for table, count in self.retries_by_table.items()},
+        }
+        if self.retries:
+            LOGGER.info(f"retry cost: {report}")
+        return report
@@ -0,0 +1,77 @@
+from typing import Any, Dict, Iterable, List, Tuple
+
+
+class _Missing:
+    """marks the slots of fields a row has no value for, pickled by reference"""
+
+    def __repr__(self) -> str:
+        return "MISSING"
+
+    def __reduce__(self) -> str:
+        return "MISSING"
+
+
+MISSING = _Missing()
+
+
+class FieldIndex:
+    """
+    maps the field names of a table to slots, so buffered records can be kept as lists of
+    values instead of a dict per record. all rows of an index share its names, a row only
+    holds the values. fields that are not in the describe field list, like `attributes`,
+    get a slot the first time they are seen.
+
+    rows are turned back into dicts when they leave the buffer.
+    """
+
+    def __init__(self, fields: Iterable[str] = ()):
+        self._names: List[str] = []
+        self._slots: Dict[str, int] = {}
+        for name in fields:
+            self.slot(name)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def slot(self, name: str) -> int:
+        slot = self._slots.get(name)
+        if slot is None:
+            slot = self._slots[name] = len(self._names)
+            self._names.append(name)
+        return slot
+
+    def row(self, record: Dict) -> List[Any]:
+        return self.merge([], record)
+
+    def merge(self, row: List[Any], record: Dict) -> List[Any]:
+        """sets the values of the record in the row, the fields the record lacks are kept"""
+        for name, value in record.items():
+            slot = self.slot(name)
+            if slot >= len(row):
+                row.extend([MISSING] * (slot + 1 - len(row)))
+            row[slot] = value
+        return row
+
+    def get(self, row: List[Any], name: str, default: Any = None) -> Any:
+        slot = self._slots.get(name)
+        if slot is None or slot >= len(row) or row[slot] is MISSING:
+            return default
+        return row[slot]
+
+    def record(self, row: List[Any]) -> Dict:
+        return {
+            name: value
+            for name, value in zip(self._names, row)
+            if value is not MISSING
+        }
+
+
+def pack_page(body: Dict) -> Tuple[FieldIndex, Dict]:
+    """keeps the records of a query result page as rows of a field index"""
+    index = FieldIndex()
+    return index, {**body, "records": [index.row(record) for record in body.get("records", [])]}
+
+
+def unpack_page(packed: Tuple[FieldIndex, Dict]) -> Dict:
+    index, body = packed
+    return {**body, "records": [index.record(row) for row in body["records"]]}
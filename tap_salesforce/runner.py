@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+syncs many salesforce orgs concurrently in a single process.
+
+the runner config lists the orgs to sync, every org gets its own Salesforce client, its
+own output file and its own state file, while the HTTP connection pool and the worker
+pool are shared:
+
+{
+  "workers": 8,
+  "output_dir": "out",
+  "defaults": {"start_date": "2017-11-02T00:00:00Z"},
+  "orgs": [
+    {"name": "acme", "config": {"refresh_token": "...", ...}, "state": "acme-state.json"}
+  ]
+}
+
+singer messages of an org are written to <output_dir>/<name>/output-<run>.jsonl, a new
+file every run. the last STATE the org wrote is kept in <output_dir>/<name>/state.json,
+which is also used as the input state of the next run when the org has no explicit
+"state". the memory budget (memory_budget_mb, memory_max_wait_seconds) is shared by all
+orgs and set at the top level of the runner config.
+"""
+import os
+import re
+import sys
+import json
+import argparse
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import singer
+import requests
+from requests.adapters import HTTPAdapter
+
+from tap_salesforce import (
+    REQUIRED_CONFIG_KEYS,
+    build_salesforce,
+    build_stream,
+    do_sync,
+)
+from tap_salesforce.history import expected_seconds
+from tap_salesforce.memory import GOVERNOR
+from tap_salesforce.exceptions import TapSalesforceException
+
+LOGGER = singer.get_logger()
+
+DEFAULT_WORKERS = 4
+
+# keys of the process-wide memory governor, they are ignored in the config of an org
+MEMORY_CONFIG_KEYS = ("memory_budget_mb", "memory_max_wait_seconds")
+
+
+def org_dir_name(name: str) -> str:
+    """returns the name of the directory of an org, without path separators or leading dots"""
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", name).lstrip(".") or "_"
+
+
+class OrgResult:
+    name: str
+    error: Optional[Exception] = None
+    seconds: float = 0.0
+
+    def __init__(self, name: str):
+        self.name = name
+
+
+class Runner:
+    output_dir: str
+    workers: int
+
+    def __init__(
+        self,
+        orgs: List[Dict],
+        output_dir: str,
+        workers: int = DEFAULT_WORKERS,
+        defaults: Optional[Dict] = None,
+    ):
+        self.orgs = orgs
+        self.output_dir = output_dir
+        self.workers = workers
+        self.defaults = defaults or {}
+        self._run_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+
+        names = [org.get("name") for org in orgs]
+        if None in names or len({org_dir_name(name) for name in names}) != len(names):
+            raise TapSalesforceException("every org needs a unique name")
+
+        # one connection pool shared by the sessions of all orgs, each org keeps its own
+        # session so cookies and auth headers never leak between orgs
+        self._adapter = HTTPAdapter(pool_connections=workers * 2, pool_maxsize=workers * 2)
+
+    def run(self) -> List[OrgResult]:
+        LOGGER.info(f"syncing {len(self.orgs)} orgs with {self.workers} workers")
+        # every org occupies at most one worker, the orgs that took longest in their last
+        # runs are started first so they do not hold up the end of the run
+        ordered = sorted(self.orgs, key=self._expected_seconds, reverse=True)
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="org") as pool:
+            finished = {result.name: result for result in pool.map(self.sync_org, ordered)}
+        results = [finished[org["name"]] for org in self.orgs]
+
+        failed = [r for r in results if r.error is not None]
+        LOGGER.info(f"synced {len(results) - len(failed)} of {len(results)} orgs")
+        for result in failed:
+            LOGGER.error(f"org {result.name} failed: {result.error}")
+        return results
+
+    def sync_org(self, org: Dict) -> OrgResult:
+        result = OrgResult(org["name"])
+        started = datetime.now()
+        org_dir = os.path.join(self.output_dir, org_dir_name(org["name"]))
+        os.makedirs(org_dir, exist_ok=True)
+
+        config = {**self.defaults, **org.get("config", {})}
+        config.setdefault("output_dir", org_dir)
+        for key in MEMORY_CONFIG_KEYS:
+            if config.pop(key, None) is not None:
+                LOGGER.warning(
+                    f"org {org['name']}: {key} is ignored, the memory budget is set for the whole runner"
+                )
+        missing = [key for key in REQUIRED_CONFIG_KEYS if key not in config]
+
+        state_path = os.path.join(org_dir, "state.json")
+        stream = None
+        try:
+            if missing:
+                raise TapSalesforceException(f"config is missing required keys: {missing}")
+
+            state = self._load_state(org.get("state"), state_path)
+
+            session = requests.Session()
+            session.mount("https://", self._adapter)
+
+            LOGGER.info(f"org {org['name']}: starting sync")
+            # the output of earlier runs is kept until it is consumed
+            output_path = os.path.join(org_dir, f"output-{self._run_id}.jsonl")
+            with open(output_path, "w", encoding="utf-8") as output:
+                sf = build_salesforce(config, session=session)
+                stream = build_stream(config, state, output)
+                do_sync(sf, stream, config, org.get("catalog"))
+        except Exception as e:
+            LOGGER.exception(f"org {org['name']}: sync failed")
+            result.error = e
+        finally:
+            # only a STATE that was written covers records of the output, a failed run
+            # continues from the last one it wrote
+            if stream is not None and stream.last_state is not None:
+                _write_json(state_path, stream.last_state)
+
+        result.seconds = (datetime.now() - started).total_seconds()
+        LOGGER.info(f"org {org['name']}: finished in {result.seconds:.1f}s")
+        return result
+
+    def _expected_seconds(self, org: Dict) -> float:
+        """returns the sum of the usual durations of the org's tables, 0 without history"""
+        state_path = os.path.join(
+            self.output_dir, org_dir_name(org.get("name", "")), "state.json"
+        )
+        try:
+            state = self._load_state(org.get("state"), state_path)
+        except (OSError, ValueError):
+            return 0.0
+        return sum(
+            expected_seconds(history) or 0.0
+            for history in state.get("history", {}).values()
+        )
+
+    def _load_state(self, state, previous_path: str) -> Dict:
+        if isinstance(state, dict):
+            return state
+        path = state or previous_path
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        return {}
+
+
+def _write_json(path: str, value: Dict):
+    # a crash while writing must not leave a truncated state behind
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(value, f)
+    os.replace(path + ".tmp", path)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("-c", "--config", required=True, help="Runner config file")
+    parser.add_argument("--workers", type=int, help="Number of orgs synced concurrently")
+    parser.add_argument("--output-dir", help="Directory for the output and state of every org")
+    args = parser.parse_args()
+
+    with open(args.config, encoding="utf-8") as f:
+        runner_config = json.load(f)
+
+    memory_budget_mb = runner_config.get("memory_budget_mb")
+    if memory_budget_mb:
+        GOVERNOR.configure(
+            int(float(memory_budget_mb) * 1024 * 1024),
+            float(runner_config.get("memory_max_wait_seconds") or 30),
+        )
+
+    runner = Runner(
+        runner_config.get("orgs", []),
+        output_dir=args.output_dir or runner_config.get("output_dir", "."),
+        workers=args.workers or runner_config.get("workers", DEFAULT_WORKERS),
+        defaults=runner_config.get("defaults"),
+    )
+    results = runner.run()
+    if any(r.error is not None for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+"""
+splits a sync into independent work units that can run on different nodes.
+
+  tap-salesforce-shard plan  -c config.json [-s state.json] [--catalog catalog.json] --shards 8 -o manifest.json
+  tap-salesforce-shard run   -c config.json -m manifest.json --shard 3 --state-out shard-3.json
+  tap-salesforce-shard merge -m manifest.json -o state.json shard-*.json
+
+`plan` turns the tables of the org and their sync windows into time range units and
+assigns them to shards. `run` syncs the units of one shard, writing singer messages to
+stdout (or the configured output_mode) and the outcome of every unit to its state file.
+`merge` combines the state files of all shards into the state of the next run, with one
+performance history entry per table for the units of all shards.
+"""
+import sys
+import json
+import argparse
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, List, Optional
+
+import singer
+import singer.utils as singer_utils
+
+from tap_salesforce import (
+    REQUIRED_CONFIG_KEYS,
+    Replication,
+    build_salesforce,
+    build_stream,
+    sync,
+    table_window,
+)
+from tap_salesforce.client import Salesforce
+from tap_salesforce.catalog import FieldSelector
+from tap_salesforce.config import flag
+from tap_salesforce.converter import RecordConverter
+from tap_salesforce.fields import sync_fields, DEFAULT_FIELDS_FULL_REFRESH_HOURS
+from tap_salesforce.history import (
+    TableRun,
+    DEFAULT_HISTORY_SIZE,
+    DEFAULT_REGRESSION_FACTOR,
+    expected_seconds,
+    regressions,
+)
+from tap_salesforce.stream import Stream
+from tap_salesforce.exceptions import TapSalesforceException
+
+LOGGER = singer.get_logger()
+
+DEFAULT_UNIT_DAYS = 30
+
+# keys of a table bookmark that only describe the run that wrote them
+_RUN_KEYS = ("checkpoint", "overlap_seen", "overlap_until")
+# performance history counters that are summed over the units of a table
+_HISTORY_TOTALS = (
+    "seconds",
+    "records",
+    "windows",
+    "window_hours",
+    "requests",
+    "pages",
+    "bytes",
+    "timeouts",
+)
+
+
+def _as_datetime(value) -> datetime:
+    # resyncs start at a date rather than a datetime
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, time(), tzinfo=timezone.utc)
+    return datetime.fromisoformat(value)
+
+
+def plan(
+    sf: Salesforce,
+    stream: Stream,
+    config: Dict,
+    catalog: Optional[Dict] = None,
+    shards: int = 1,
+    unit_days: int = DEFAULT_UNIT_DAYS,
+) -> Dict:
+    """
+    returns the manifest of work units for the selected tables. tables with a replication
+    key are split into time ranges of `unit_days` (weekly rule tables into weeks), tables
+    without one are a single full table unit.
+
+    units are assigned to shards longest first, each to the shard with the least expected
+    work, using the duration of the tables' recorded runs. units without an expected
+    duration are spread round robin in the order of their start, so every shard gets a
+    share of recent and old ranges.
+    """
+    if shards < 1 or unit_days < 1:
+        raise TapSalesforceException(
+            f"invalid plan: shards ({shards}) and unit days ({unit_days}) must be greater than 0"
+        )
+
+    selector = FieldSelector(catalog, config)
+    config_start = singer_utils.strptime_with_tz(config["start_date"]).astimezone(
+        timezone.utc
+    )
+
+    units = []
+    for table in sf.get_tables(
+        config.get("advanced_features_enabled", False),
+        config.get("custom_objects", []),
+        config.get("special_objects", []),
+    ):
+        if table.not_found or not table.fields or not selector.is_selected(table):
+            continue
+
+        start_time, end_time, resync = table_window(sf, stream, table, config_start)
+        method = Replication.incremental
+        if resync or table.replication_key is None:
+            method = Replication.full_table
+
+        step = timedelta(days=min(unit_days, 7) if table.apply_weekly_rule else unit_days)
+        start_time = _as_datetime(start_time)
+        ranges = [(start_time, end_time)]
+        if table.replication_key is not None:
+            ranges = []
+            while start_time < end_time:
+                ranges.append((start_time, min(start_time + step, end_time)))
+                start_time += step
+
+        history = stream.get_history(table.name)
+        seconds = expected_seconds(history)
+        hours = sum(entry.get("window_hours", 0) for entry in history)
+        for index, (start, end) in enumerate(ranges):
+            expected = 0.0
+            if seconds is not None:
+                # the duration of full table units and of tables without a usable window is the run's
+                expected = seconds
+                if table.replication_key is not None and hours > 0:
+                    per_hour = sum(entry["seconds"] for entry in history) / hours
+                    expected = per_hour * (end - start).total_seconds() / 3600
+            units.append(
+                {
+                    "id": f"{table.name}-{index:04d}",
+                    "table": table.name,
+                    "start": start.isoformat(),
+                    "end": end.isoformat(),
+                    "replication_key": table.replication_key,
+                    "replication_method": method,
+                    "sync_fields": index == 0 and table.should_sync_fields,
+                    "expected_seconds": round(expected, 1),
+                }
+            )
+
+    assignment: List[List[str]] = [[] for _ in range(shards)]
+    loads = [0.0] * shards
+    measured = [unit for unit in units if unit["expected_seconds"] > 0]
+    for unit in sorted(measured, key=lambda u: u["expected_seconds"], reverse=True):
+        shard = min(range(shards), key=lambda i: loads[i])
+        assignment[shard].append(unit["id"])
+        loads[shard] += unit["expected_seconds"]
+    unmeasured = [unit for unit in units if unit["expected_seconds"] <= 0]
+    for index, unit in enumerate(sorted(unmeasured, key=lambda u: u["start"], reverse=True)):
+        assignment[index % shards].append(unit["id"])
+
+    LOGGER.info(f"planned {len(units)} units in {shards} shards")
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "history_size": int(config.get("performance_history_size", DEFAULT_HISTORY_SIZE) or 0),
+        "regression_factor": float(
+            config.get("regression_factor") or DEFAULT_REGRESSION_FACTOR
+        ),
+        "state": stream.get_state(),
+        "units": units,
+        "shards": assignment,
+    }
+
+
+def run_shard(
+    sf: Salesforce,
+    stream: Stream,
+    config: Dict,
+    manifest: Dict,
+    shard: int,
+    catalog: Optional[Dict] = None,
+) -> Dict:
+    """syncs the units of a shard, returns the outcome of every unit"""
+    if not 0 <= shard < len(manifest["shards"]):
+        raise TapSalesforceException(
+            f"invalid shard {shard}, the manifest has {len(manifest['shards'])} shards"
+        )
+
+    selector = FieldSelector(catalog, config)
+    unit_ids = set(manifest["shards"][shard])
+    units = [unit for unit in manifest["units"] if unit["id"] in unit_ids]
+    table_names = {unit["table"] for unit in units}
+    tables = {
+        table.name: table
+        for table in sf.get_tables(
+            config.get("advanced_features_enabled", False),
+            config.get("custom_objects", []),
+            config.get("special_objects", []),
+        )
+        if table.name in table_names and table.fields
+    }
+
+    fields_full_refresh_hours = config.get(
+        "fields_full_refresh_hours", DEFAULT_FIELDS_FULL_REFRESH_HOURS
+    )
+    fields_full_refresh_interval = None
+    if fields_full_refresh_hours:
+        fields_full_refresh_interval = timedelta(hours=float(fields_full_refresh_hours))
+
+    results = {}
+    try:
+        for unit in units:
+            table = tables.get(unit["table"])
+            if table is None:
+                results[unit["id"]] = {"completed": False, "error": "table not found"}
+                continue
+
+            LOGGER.info(f"processing unit {unit['id']} [{unit['start']}, {unit['end']})")
+            if unit.get("sync_fields"):
+                sync_fields(stream, table, fields_full_refresh_interval)
+
+            selected_fields = selector.select_fields(table)
+            converter = None
+            if flag(config, "convert_records", True):
+                converter = RecordConverter(
+                    selected_fields,
+                    config.get("compound_fields", "keep"),
+                    flag(config, "normalize_types"),
+                )
+            stream.set_table_fields(
+                table.name, converter.fields if converter else selected_fields
+            )
+            run = TableRun(sf, table.name)
+            try:
+                start = datetime.fromisoformat(unit["start"])
+                end = datetime.fromisoformat(unit["end"])
+                records = sync(
+                    sf,
+                    stream,
+                    table,
+                    [field["name"] for field in selected_fields],
+                    start,
+                    end,
+                    converter=converter,
+                )
+                run.add_window(start, end, records)
+                results[unit["id"]] = {"completed": True, "run": run.entry()}
+            except Exception as e:
+                LOGGER.exception(f"unit {unit['id']} failed")
+                results[unit["id"]] = {"completed": False, "error": str(e)}
+    finally:
+        stream.close()
+
+    return {"shard": shard, "units": results, "state": stream.get_state()}
+
+
+def merge(manifest: Dict, shard_states: List[Dict]) -> Dict:
+    """
+    combines the state files of the shards into the state of the next run.
+
+    a table's bookmark only moves to the end of the longest run of completed units from
+    the start of its window, a failed unit keeps everything after it for the next run.
+    a full table sync (no replication key or a resync) is only marked FULL_TABLE when all
+    of its units completed, a partial replacement must never be reported as complete. a
+    completed resync keeps the latest replication key the shards emitted.
+
+    the runs of the units of a completed table are added to its performance history as one
+    entry, like a run that synced all units one after another.
+    """
+    stream = Stream(manifest.get("state"))
+    history_size = manifest.get("history_size", DEFAULT_HISTORY_SIZE)
+    regression_factor = manifest.get("regression_factor", DEFAULT_REGRESSION_FACTOR)
+    completed = {}
+    runs = {}
+    for shard_state in shard_states:
+        for unit_id, result in shard_state.get("units", {}).items():
+            completed[unit_id] = completed.get(unit_id, False) or result.get("completed", False)
+            if result.get("completed", False) and "run" in result:
+                runs[unit_id] = result["run"]
+
+    units_by_table: Dict[str, List[Dict]] = {}
+    for unit in manifest["units"]:
+        units_by_table.setdefault(unit["table"], []).append(unit)
+
+    # bookmarks of streams that are not sharded tables, e.g. the {table}Fields digests. every
+    # shard starts with the manifest's bookmarks, only the shard that changed a value has news
+    previous = Stream(manifest.get("state"))
+    for shard_state in shard_states:
+        for stream_id, bookmark in shard_state.get("state", {}).get("bookmarks", {}).items():
+            if stream_id in units_by_table:
+                continue
+            unchanged = previous.get_bookmark(stream_id)
+            for key, value in bookmark.items():
+                if key not in unchanged or unchanged[key] != value:
+                    stream.set_stream_state(stream_id, key, value)
+
+    for table_name, units in units_by_table.items():
+        units.sort(key=lambda unit: unit["start"])
+        done = 0
+        while done < len(units) and completed.get(units[done]["id"], False):
+            done += 1
+        LOGGER.info(f"{table_name}: {done} of {len(units)} units completed")
+
+        if done == 0:
+            continue
+        method = units[0]["replication_method"]
+        replication_key = units[0]["replication_key"]
+        if method == Replication.full_table:
+            if done < len(units):
+                continue
+            if replication_key is not None:
+                # every shard started from the manifest's bookmark, the latest one includes all emitted records
+                bookmarks = [
+                    Stream(shard_state.get("state")).get_stream_state(table_name, replication_key)
+                    for shard_state in shard_states
+                ]
+                bookmarks = [bookmark for bookmark in bookmarks if bookmark is not None]
+                if bookmarks:
+                    stream.set_stream_state(table_name, replication_key, max(bookmarks))
+        else:
+            # the ranges are contiguous, every record before the end of the last completed unit was emitted
+            stream.set_stream_state(
+                table_name,
+                replication_key,
+                _as_datetime(units[done - 1]["end"]),
+            )
+        if done == len(units):
+            for key in _RUN_KEYS:
+                stream.clear_stream_state(table_name, key)
+            if history_size:
+                _add_history(stream, table_name, units, runs, history_size, regression_factor)
+        stream.set_stream_state(table_name, Replication.key, method)
+
+    return stream.get_state()
+
+
+def _add_history(
+    stream: Stream,
+    table_name: str,
+    units: List[Dict],
+    runs: Dict[str, Dict],
+    size: int,
+    regression_factor: float,
+):
+    unit_runs = [runs[unit["id"]] for unit in units if unit["id"] in runs]
+    if len(unit_runs) < len(units):
+        # without the runs of all units the entry would understate the sync
+        return
+
+    entry = {"started_at": min(run["started_at"] for run in unit_runs)}
+    for name in _HISTORY_TOTALS:
+        entry[name] = round(sum(run.get(name, 0) for run in unit_runs), 2)
+    history = stream.get_history(table_name)
+    found = regressions(history, entry, regression_factor)
+    if found:
+        LOGGER.warning(
+            f"{table_name} regressed compared to its last {len(history)} runs: {', '.join(found)}"
+        )
+    stream.add_history(table_name, entry, size)
+
+
+def _load(path: Optional[str]) -> Optional[Dict]:
+    if path is None:
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    plan_parser = commands.add_parser("plan", help="Write the manifest of work units")
+    plan_parser.add_argument("-c", "--config", required=True, help="Config file")
+    plan_parser.add_argument("-s", "--state", help="State file")
+    plan_parser.add_argument("--catalog", help="Catalog file")
+    plan_parser.add_argument("--shards", type=int, default=1, help="Number of shards")
+    plan_parser.add_argument(
+        "--unit-days", type=int, default=DEFAULT_UNIT_DAYS, help="Days per work unit"
+    )
+    plan_parser.add_argument("-o", "--output", required=True, help="Manifest file")
+
+    run_parser = commands.add_parser("run", help="Sync the work units of one shard")
+    run_parser.add_argument("-c", "--config", required=True, help="Config file")
+    run_parser.add_argument("-m", "--manifest", required=True, help="Manifest file")
+    run_parser.add_argument("--catalog", help="Catalog file")
+    run_parser.add_argument("--shard", type=int, required=True, help="Shard to sync")
+    run_parser.add_argument("--state-out", required=True, help="Shard state file")
+
+    merge_parser = commands.add_parser("merge", help="Merge the shard state files")
+    merge_parser.add_argument("-m", "--manifest", required=True, help="Manifest file")
+    merge_parser.add_argument("-o", "--output", required=True, help="Merged state file")
+    merge_parser.add_argument("shard_states", nargs="+", help="Shard state files")
+
+    args = parser.parse_args()
+
+    if args.command == "merge":
+        state = merge(_load(args.manifest), [_load(path) for path in args.shard_states])
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        return
+
+    config = _load(args.config)
+    missing = [key for key in REQUIRED_CONFIG_KEYS if key not in config]
+    if missing:
+        raise TapSalesforceException(f"config is missing required keys: {missing}")
+    sf = build_salesforce(config)
+
+    if args.command == "plan":
+        manifest = plan(
+            sf,
+            Stream(_load(args.state)),
+            config,
+            _load(args.catalog),
+            args.shards,
+            args.unit_days,
+        )
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        return
+
+    manifest = _load(args.manifest)
+    stream = build_stream(config, manifest.get("state"))
+    result = run_shard(sf, stream, config, manifest, args.shard, _load(args.catalog))
+    with open(args.state_out, "w", encoding="utf-8") as f:
+        json.dump(result, f)
+    if not all(unit["completed"] for unit in result["units"].values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+# only the standard library is imported here, the imports of the tap are timed from here on
+import time
+
+
+class StartupTimer:
+    """
+    measures the phases between the start of the process and the first request of the
+    sync, so the share of short runs spent on startup can be tracked
+    """
+
+    def __init__(self):
+        self._started = time.monotonic()
+        self._last = self._started
+        self.phases = {}
+
+    def mark(self, phase: str):
+        """ends a phase, it took the time since the previous phase ended"""
+        now = time.monotonic()
+        self.phases[phase] = round(now - self._last, 3)
+        self._last = now
+
+    def report(self) -> dict:
+        import singer
+
+        total = round(self._last - self._started, 3)
+        singer.get_logger().info(f"startup took {total}s: {self.phases}")
+        return {**self.phases, "total": total}
+
+
+# started when the tap is imported, the interpreter startup itself is not included
+STARTUP = StartupTimer()
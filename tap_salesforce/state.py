@@ -1,4 +1,4 @@
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 from datetime import datetime, timezone
 
 from pydantic import BaseModel
@@ -6,6 +6,8 @@ from pydantic import BaseModel
 
 class State(BaseModel):
     bookmarks: Dict[str, Dict] = {}
+    # the most recent performance history entries of every stream, oldest first
+    history: Dict[str, List[Dict]] = {}
 
     def set_stream_state(self, stream_id: str, key: str, value: any):
 
@@ -16,6 +18,18 @@ class State(BaseModel):
             state[key] = value
         self.bookmarks[stream_id] = state
 
+    def clear_stream_state(self, stream_id: str, key: str):
+        self.bookmarks.get(stream_id, dict()).pop(key, None)
+
+    def add_history(self, stream_id: str, entry: Dict, size: int):
+        self.history[stream_id] = (self.history.get(stream_id, []) + [entry])[-size:]
+
+    def get_history(self, stream_id: str) -> List[Dict]:
+        return self.history.get(stream_id, [])
+
+    def get_bookmark(self, stream_id: str) -> Dict:
+        return self.bookmarks.get(stream_id, dict())
+
     def get_stream_state(
         self, stream_id: str, replication_key: str
     ) -> Optional[datetime]:
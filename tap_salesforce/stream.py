@@ -2,10 +2,14 @@ import sys
 import json
 import base64
 from datetime import datetime, timezone
-from typing import TextIO, Dict, Optional
+from typing import TYPE_CHECKING, TextIO, Dict, List, Optional
 
 from tap_salesforce.state import State
 
+if TYPE_CHECKING:
+    from tap_salesforce.journal import Journal
+    from tap_salesforce.diff_index import DiffIndex
+
 
 class _DatetimeEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -40,24 +44,61 @@ class _DatetimeEncoder(json.JSONEncoder):
 
 class Stream:
     _state: State
+    _output: TextIO
+    # appends every written message to the local extraction journal when set
+    journal: Optional["Journal"] = None
+    # the value of the last STATE message written
+    last_state: Optional[Dict] = None
 
-    def __init__(self, state: Optional[Dict] = None):
+    def __init__(self, state: Optional[Dict] = None, output: Optional[TextIO] = None):
         if state:
             self._state = State(**state)
         else:
             self._state = State()
+        self._output = output or sys.stdout
+        # told before a state is taken and after a STATE is written, closed with the stream
+        self.state_listeners: List["DiffIndex"] = []
 
     def set_stream_state(self, stream_id: str, key: str, value: any):
         self._state.set_stream_state(stream_id, key, value)
 
+    def clear_stream_state(self, stream_id: str, key: str):
+        self._state.clear_stream_state(stream_id, key)
+
     def get_stream_state(self, stream_id: str, replication_key) -> Optional[datetime]:
         return self._state.get_stream_state(stream_id, replication_key)
 
-    def write_state(self, file: TextIO = sys.stdout):
-        state_message = dict(type="STATE", value=self._state.dict())
+    def get_state(self) -> Dict:
+        for listener in self.state_listeners:
+            listener.snapshot(self)
+        return self._state.dict()
+
+    def get_bookmark(self, stream_id: str) -> Dict:
+        return self._state.get_bookmark(stream_id)
+
+    def add_history(self, stream_id: str, entry: Dict, size: int):
+        self._state.add_history(stream_id, entry, size)
+
+    def get_history(self, stream_id: str) -> List[Dict]:
+        return self._state.get_history(stream_id)
+
+    def set_table_fields(self, stream_id: str, fields: List[Dict]):
+        """registers the describe fields of a table before its records are written,
+        output modes that need a schema up front override this"""
+
+    def close(self):
+        """flushes and closes any output held open by the stream"""
+        if self.journal is not None:
+            self.journal.close()
+        for listener in self.state_listeners:
+            listener.close()
+        self.state_listeners = []
+
+    def write_state(self, file: Optional[TextIO] = None):
+        state_message = dict(type="STATE", value=self.get_state())
         self.write_message(state_message, file=file)
 
-    def write_record(self, record: Dict, stream_id: str, file: TextIO = sys.stdout):
+    def write_record(self, record: Dict, stream_id: str, file: Optional[TextIO] = None):
         self.write_message(
             dict(
                 type="RECORD",
@@ -68,11 +109,31 @@ class Stream:
             file=file,
         )
 
-    def write_message(self, message: Dict, file: TextIO):
-        line = (
-            json.dumps(message, cls=_DatetimeEncoder, ensure_ascii=False)
-            .encode("utf-8", errors="replace")
-            .decode("utf-8")
-        )
+    def write_message(self, message: Dict, file: Optional[TextIO] = None):
+        file = file or self._output
+        line = self.serialize(message)
         file.write(line + "\n")
         file.flush()
+        if message["type"] == "STATE":
+            self.last_state = message["value"]
+            for listener in self.state_listeners:
+                listener.state_written(message["value"])
+        if self.journal is not None:
+            self.journal.append(message, line)
+
+    def write_lines(self, lines: List[str], file: Optional[TextIO] = None):
+        """writes already serialized messages, used by the pipelined sync"""
+        file = file or self._output
+        file.write("".join(line + "\n" for line in lines))
+        file.flush()
+
+    def serialize(self, message: Dict) -> str:
+        return serialize(message)
+
+
+def serialize(message: Dict) -> str:
+    return (
+        json.dumps(message, cls=_DatetimeEncoder, ensure_ascii=False)
+        .encode("utf-8", errors="replace")
+        .decode("utf-8")
+    )
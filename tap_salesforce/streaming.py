@@ -0,0 +1,341 @@
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterator, List, Optional
+
+import singer
+import requests
+
+from tap_salesforce.client import Salesforce, Table
+from tap_salesforce.converter import RecordConverter
+from tap_salesforce.stream import Stream
+from tap_salesforce.exceptions import TapSalesforceException
+
+LOGGER = singer.get_logger()
+
+# replay ids with a special meaning for salesforce
+REPLAY_NEW_EVENTS = -1
+REPLAY_ALL_RETAINED_EVENTS = -2
+
+DEFAULT_STREAMING_TABLES = ["Account", "Contact", "Lead", "Opportunity"]
+DEFAULT_STATE_INTERVAL_SECONDS = 60
+
+# connect requests are held open by the server for up to 110 seconds
+_CONNECT_TIMEOUT = 130
+
+# events committed this long before a repair started are already in its records, the
+# margin covers the clock difference between the tap and salesforce
+_REPAIR_MARGIN = timedelta(minutes=5)
+
+# failed connections in a row before the stream gives up, waiting up to a minute between them
+_MAX_RECONNECTS = 10
+_MAX_RECONNECT_DELAY_SECONDS = 60
+
+
+class CometdException(TapSalesforceException):
+    pass
+
+
+class InvalidReplayIdException(CometdException):
+    pass
+
+
+def change_event_channel(table_name: str) -> str:
+    if table_name.endswith("__c"):
+        return f"/data/{table_name[:-3]}__ChangeEvent"
+    return f"/data/{table_name}ChangeEvent"
+
+
+class CometdClient:
+    """a minimal bayeux long-polling client for the salesforce streaming api"""
+
+    client_id: Optional[str] = None
+
+    def __init__(
+        self,
+        session: requests.Session,
+        url: str,
+        headers: Callable[[], Dict[str, str]],
+    ):
+        self.session = session
+        self.url = url
+        self.headers = headers
+        self._message_id = 0
+
+    def handshake(self):
+        (response,) = self._send(
+            {
+                "channel": "/meta/handshake",
+                "version": "1.0",
+                "minimumVersion": "1.0",
+                "supportedConnectionTypes": ["long-polling"],
+                "ext": {"replay": True},
+            }
+        )
+        if not response.get("successful"):
+            raise CometdException(f"handshake failed: {response.get('error')}")
+        self.client_id = response["clientId"]
+
+    def subscribe(self, channel: str, replay_id: int):
+        (response,) = self._send(
+            {
+                "channel": "/meta/subscribe",
+                "clientId": self.client_id,
+                "subscription": channel,
+                "ext": {"replay": {channel: replay_id}},
+            }
+        )
+        if not response.get("successful"):
+            error = response.get("error") or ""
+            if "replayId" in error:
+                raise InvalidReplayIdException(f"{channel}: {error}")
+            raise CometdException(f"subscribe to {channel} failed: {error}")
+
+    def connect(self) -> Iterator[Dict]:
+        """long-polls for events, yields the event messages of the response"""
+        messages = self._send(
+            {
+                "channel": "/meta/connect",
+                "clientId": self.client_id,
+                "connectionType": "long-polling",
+            }
+        )
+        for message in messages:
+            if message.get("channel") != "/meta/connect":
+                yield message
+                continue
+
+            if message.get("successful"):
+                continue
+            advice = message.get("advice", {})
+            if advice.get("reconnect") == "handshake" or "403" in (message.get("error") or ""):
+                self.client_id = None
+                return
+            raise CometdException(f"connect failed: {message.get('error')}")
+
+    def disconnect(self):
+        if self.client_id is None:
+            return
+        try:
+            self._send({"channel": "/meta/disconnect", "clientId": self.client_id})
+        finally:
+            self.client_id = None
+
+    def _send(self, message: Dict) -> List[Dict]:
+        self._message_id += 1
+        message["id"] = str(self._message_id)
+        resp = self.session.post(
+            self.url,
+            json=[message],
+            headers=self.headers(),
+            timeout=_CONNECT_TIMEOUT,
+        )
+        if resp.status_code == 401:
+            self.client_id = None
+        resp.raise_for_status()
+        return resp.json()
+
+
+class ChangeDataCaptureSync:
+    """
+    subscribes to the change data capture channels of the tables and writes the records
+    their change events are about. events only carry the fields that changed, so the
+    records are read again by Id with the selected fields and written like the records
+    of a query sync. deleted records are written with `_sdc_deleted_at`. the replay id of
+    every channel is kept in the table's bookmark once the records of its events have been
+    written, so a restart continues after the last written event.
+
+    when there is no replay id yet, or salesforce no longer retains the events after it,
+    `repair` is called to catch the table up with a regular query sync before the channel
+    is subscribed to all retained events. events committed before the repair started are
+    skipped, the records of the repair already include them.
+
+    failed connections are retried with a backoff and a new handshake, a 401 logs in again.
+    """
+
+    def __init__(
+        self,
+        sf: Salesforce,
+        stream: Stream,
+        tables: List[Table],
+        fields: Dict[str, List[str]],
+        repair: Callable[[Table], None],
+        client: Optional[CometdClient] = None,
+        state_interval_seconds: int = DEFAULT_STATE_INTERVAL_SECONDS,
+        converters: Optional[Dict[str, RecordConverter]] = None,
+    ):
+        self.sf = sf
+        self.stream = stream
+        self.tables = {change_event_channel(table.name): table for table in tables}
+        self.fields = fields
+        self.repair = repair
+        self.converters = converters or {}
+        self.client = client or CometdClient(
+            sf.session,
+            f"{sf.instance_url}/cometd/{sf.api_version[1:]}",
+            sf.auth_headers,
+        )
+        self.state_interval_seconds = state_interval_seconds
+        self.events = 0
+
+        # commit time before which the events of a repaired table are skipped
+        self._repaired_at: Dict[str, datetime] = {}
+        # changed records per table whose events were read but not written yet, by Id,
+        # with the commit time of deletes and None for records that are read again
+        self._changes: Dict[str, Dict[str, Optional[datetime]]] = {}
+        self._replay_ids: Dict[str, int] = {}
+        self._commit_times: Dict[str, datetime] = {}
+
+    def run(self, max_runtime_seconds: Optional[float] = None):
+        deadline = None
+        if max_runtime_seconds is not None:
+            deadline = time.monotonic() + max_runtime_seconds
+        last_state = time.monotonic()
+        failures = 0
+
+        try:
+            while deadline is None or time.monotonic() < deadline:
+                try:
+                    if self.client.client_id is None:
+                        self._subscribe_all()
+
+                    for message in self.client.connect():
+                        self._handle(message)
+                    self._write_changes()
+                    failures = 0
+                except (requests.exceptions.RequestException, CometdException) as e:
+                    if not self._reconnectable(e):
+                        raise
+                    failures += 1
+                    if failures > _MAX_RECONNECTS:
+                        raise
+                    delay = min(2 ** (failures - 1), _MAX_RECONNECT_DELAY_SECONDS)
+                    LOGGER.warning(f"streaming connection failed: {e}, reconnecting in {delay}s")
+                    self.client.client_id = None
+                    time.sleep(delay)
+
+                if time.monotonic() - last_state >= self.state_interval_seconds:
+                    self.stream.write_state()
+                    last_state = time.monotonic()
+        finally:
+            self.stream.write_state()
+            try:
+                self.client.disconnect()
+            except (requests.exceptions.RequestException, CometdException) as e:
+                LOGGER.info(f"disconnect failed: {e}")
+            LOGGER.info(f"streamed {self.events} change events")
+
+    def _reconnectable(self, error: Exception) -> bool:
+        """returns whether the connection is set up again after the error"""
+        if isinstance(error, InvalidReplayIdException):
+            return False
+        if isinstance(error, CometdException):
+            # the server forgot the client, e.g. after a long repair: 403::Unknown client
+            return "403" in str(error)
+        if isinstance(error, requests.exceptions.HTTPError):
+            status = error.response.status_code if error.response is not None else None
+            if status == 401:
+                self.sf.expire_session()
+                return True
+            return status is None or status == 403 or status >= 500
+        return isinstance(
+            error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+        )
+
+    def _subscribe_all(self):
+        # repairs run before the handshake, a long repair would expire the client
+        replay_ids = {}
+        for channel, table in self.tables.items():
+            replay_id = self.stream.get_bookmark(table.name).get("replay_id")
+            if replay_id is None:
+                replay_id = self._repair(table)
+            replay_ids[channel] = replay_id
+
+        self.client.handshake()
+        for channel, table in self.tables.items():
+            replay_id = replay_ids[channel]
+            try:
+                self.client.subscribe(channel, replay_id)
+            except InvalidReplayIdException as e:
+                LOGGER.info(f"{e}, repairing {table.name} with a query sync")
+                self.stream.clear_stream_state(table.name, "replay_id")
+                replay_id = self._repair(table, again=True)
+                self.client.subscribe(channel, replay_id)
+            LOGGER.info(f"subscribed to {channel} from replay id {replay_id}")
+
+    def _repair(self, table: Table, again: bool = False) -> int:
+        """catches the table up with a query sync, returns the replay id to subscribe from"""
+        if again or table.name not in self._repaired_at:
+            LOGGER.info(f"no usable replay id for {table.name}, repairing with a query sync")
+            repaired_at = datetime.now(timezone.utc) - _REPAIR_MARGIN
+            self.repair(table)
+            self._repaired_at[table.name] = repaired_at
+        return REPLAY_ALL_RETAINED_EVENTS
+
+    def _handle(self, message: Dict):
+        table = self.tables.get(message.get("channel"))
+        if table is None:
+            return
+
+        data = message.get("data", {})
+        header = data.get("payload", {}).get("ChangeEventHeader", {})
+        change_type = header.get("changeType", "")
+        commit_time = datetime.fromtimestamp(
+            header.get("commitTimestamp", 0) / 1000, tz=timezone.utc
+        )
+
+        # events committed before the repair are already in its records, they are skipped
+        repaired_at = self._repaired_at.get(table.name)
+        if repaired_at is None or commit_time >= repaired_at:
+            if change_type == "GAP_OVERFLOW":
+                LOGGER.info(f"overflow event on {table.name}, repairing with a query sync")
+                self._write_changes()
+                self.repair(table)
+            else:
+                changes = self._changes.setdefault(table.name, {})
+                for record_id in header.get("recordIds", []):
+                    # the last change of a record decides if it is read again or deleted
+                    changes[record_id] = commit_time if change_type == "DELETE" else None
+
+        self.events += 1
+        self._replay_ids[table.name] = data.get("event", {}).get("replayId")
+        latest = self._commit_times.get(table.name)
+        if latest is None or commit_time > latest:
+            self._commit_times[table.name] = commit_time
+
+    def _write_changes(self):
+        """writes the records of the events read so far, then moves their bookmarks"""
+        for table in self.tables.values():
+            changes = self._changes.pop(table.name, {})
+            self._fetch_records(
+                table, [record_id for record_id, deleted_at in changes.items() if deleted_at is None]
+            )
+            for record_id, deleted_at in changes.items():
+                if deleted_at is not None:
+                    self.stream.write_record(
+                        {"Id": record_id, "_sdc_deleted_at": deleted_at.isoformat()}, table.name
+                    )
+
+            if table.name in self._replay_ids:
+                self.stream.set_stream_state(
+                    table.name, "replay_id", self._replay_ids.pop(table.name)
+                )
+            commit_time = self._commit_times.pop(table.name, None)
+            if table.replication_key and commit_time is not None:
+                bookmark = self.stream.get_stream_state(table.name, table.replication_key)
+                if bookmark is None or commit_time > bookmark:
+                    self.stream.set_stream_state(table.name, table.replication_key, commit_time)
+
+    def _fetch_records(self, table: Table, record_ids: List[str]):
+        # change events only carry the changed fields, the records are read with a query instead
+        converter = self.converters.get(table.name)
+        for i in range(0, len(record_ids), 200):
+            ids = ",".join(f"'{record_id}'" for record_id in record_ids[i : i + 200])
+            query = f"SELECT {','.join(self.fields[table.name])} FROM {table.name} WHERE Id IN ({ids})"
+            for record in self.sf.paginate(
+                "GET",
+                f"/services/data/{self.sf.api_version}/queryAll/",
+                params={"q": query},
+            ):
+                self.stream.write_record(
+                    converter(record) if converter is not None else record, table.name
+                )
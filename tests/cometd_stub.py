@@ -0,0 +1,122 @@
+"""an in-process bayeux server that serves change data capture channels like the streaming api"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+
+class CometdStub:
+    """
+    keeps the published events of every channel and delivers them to the subscribed
+    channels from their replay id: -1 only delivers events published after the subscribe,
+    -2 all events. `fail_next` are http status codes returned by the next requests instead.
+    """
+
+    def __init__(self):
+        self.events: Dict[str, List[Dict]] = {}
+        self.invalid_replay_ids = set()
+        self.fail_next: List[int] = []
+        self.handshakes = 0
+        self.subscriptions: List[Dict] = []
+        self._positions: Dict[str, int] = {}
+        self._replay_id = 0
+        self._client_id: Optional[str] = None
+        self._lock = threading.Lock()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                status, response = stub.handle(json.loads(body))
+                data = json.dumps(response).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def instance_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self) -> "CometdStub":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def publish(self, channel: str, change_type: str, record_ids: List[str], commit_timestamp: int, **fields) -> int:
+        with self._lock:
+            self._replay_id += 1
+            payload = dict(
+                fields,
+                ChangeEventHeader={
+                    "changeType": change_type,
+                    "recordIds": record_ids,
+                    "commitTimestamp": commit_timestamp,
+                },
+            )
+            self.events.setdefault(channel, []).append(
+                {"channel": channel, "data": {"event": {"replayId": self._replay_id}, "payload": payload}}
+            )
+            return self._replay_id
+
+    def handle(self, messages: List[Dict]):
+        with self._lock:
+            if self.fail_next:
+                return self.fail_next.pop(0), [{"error": "stub failure"}]
+
+            message = messages[0]
+            channel = message["channel"]
+            reply = {"channel": channel, "id": message.get("id"), "successful": True}
+
+            if channel == "/meta/handshake":
+                self.handshakes += 1
+                self._client_id = f"client-{self.handshakes}"
+                self._positions = {}
+                reply["clientId"] = self._client_id
+                return 200, [reply]
+
+            if message.get("clientId") != self._client_id:
+                reply.update(successful=False, error="403::Unknown client", advice={"reconnect": "handshake"})
+                return 200, [reply]
+
+            if channel == "/meta/subscribe":
+                subscription = message["subscription"]
+                replay_id = message["ext"]["replay"][subscription]
+                self.subscriptions.append({subscription: replay_id})
+                if replay_id in self.invalid_replay_ids:
+                    reply.update(successful=False, error=f"400::The replayId {{{replay_id}}} you provided was invalid.")
+                    return 200, [reply]
+                if replay_id == -1:
+                    replay_id = self._replay_id
+                elif replay_id == -2:
+                    replay_id = 0
+                self._positions[subscription] = replay_id
+                return 200, [reply]
+
+            if channel == "/meta/connect":
+                delivered = []
+                for subscription, position in self._positions.items():
+                    events = [
+                        event
+                        for event in self.events.get(subscription, [])
+                        if event["data"]["event"]["replayId"] > position
+                    ]
+                    if events:
+                        self._positions[subscription] = events[-1]["data"]["event"]["replayId"]
+                    delivered.extend(events)
+                return 200, delivered + [reply]
+
+            if channel == "/meta/disconnect":
+                self._client_id = None
+            return 200, [reply]
@@ -0,0 +1,189 @@
+"""a requests session that serves the login, describe, query and composite api like salesforce"""
+import re
+import json
+import time
+import hashlib
+import threading
+from datetime import datetime
+from urllib.parse import urlparse, parse_qs
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from tap_salesforce.client import Salesforce
+from tap_salesforce.retry import RetryEngine
+
+INSTANCE_URL = "https://example.my.salesforce.com"
+
+_TOKEN = re.compile(r"\d{4}-\d\d-\d\dT\d\d:\d\d:\d\dZ|'[^']*'|>=|<=|!=|[=<>(),\[\]]|\w+")
+_IN = re.compile(r"(\w+) IN \(([^)]*)\)")
+
+
+def connect(stub: "SalesforceStub", **kwargs) -> Salesforce:
+    """returns a client of the stub whose retries do not wait"""
+    kwargs.setdefault("retries", RetryEngine(factor=0.0))
+    return Salesforce("refresh_token", "client_id", "client_secret", session=stub, **kwargs)
+
+
+def response(status_code: int, body: Any, headers: Optional[Dict] = None) -> requests.Response:
+    resp = requests.Response()
+    resp.status_code = status_code
+    resp._content = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+    resp.headers = CaseInsensitiveDict({"Sforce-Limit-Info": "api-usage=1/100000", **(headers or {})})
+    resp.encoding = "utf-8"
+    return resp
+
+
+def error(status_code: int, code: str, message: str = "failed", headers: Optional[Dict] = None) -> requests.Response:
+    return response(status_code, [{"message": message, "errorCode": code}], headers)
+
+
+def _value(value: Any) -> Any:
+    if isinstance(value, str) and re.match(r"\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d\.\d{3}\+\d{4}$", value):
+        return datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%f%z")
+    return value
+
+
+def _where(clause: str):
+    """translates the predicate of a query to a function of a record"""
+    clause = _IN.sub(lambda match: f"_in('{match.group(1)}', [{match.group(2)}])", clause)
+    expression = []
+    for token in _TOKEN.findall(clause):
+        if re.match(r"\d{4}-", token):
+            expression.append(f"_date('{token}')")
+        elif token in ("AND", "OR", "NOT"):
+            expression.append(token.lower())
+        elif token == "=":
+            expression.append("==")
+        elif token.startswith("'") or token in ("(", ")", "<", ">", ",", "[", "]", ">=", "<=", "!=", "_in"):
+            expression.append(token)
+        else:
+            expression.append(f"_field('{token}')")
+    code = compile(" ".join(expression) or "True", "<soql>", "eval")
+
+    def matches(record: Dict) -> bool:
+        scope = {
+            "_date": lambda value: datetime.strptime(value, "%Y-%m-%dT%H:%M:%S%z"),
+            "_field": lambda name: _value(record.get(name)),
+            "_in": lambda name, values: record.get(name) in values,
+        }
+        try:
+            return eval(code, scope)  # pylint: disable=eval-used
+        except TypeError:
+            # a null value does not match a comparison
+            return False
+
+    return matches
+
+
+class SalesforceStub:
+    """
+    keeps the records of every table and answers queries in pages of `page_size` records,
+    continued through nextRecordsUrl locators. `fail_next` are responses returned by the next
+    requests instead, None answers a request, `delays` are the seconds the next requests take.
+    `failing` are responses returned for every request of a path ending with the key.
+    """
+
+    instance_url = INSTANCE_URL
+
+    def __init__(self, tables: Optional[Dict[str, List[Dict]]] = None, page_size: int = 2):
+        self.tables = tables or {}
+        self.page_size = page_size
+        self.describes: Dict[str, List[Dict]] = {}
+        self.fail_next: List[requests.Response] = []
+        self.failing: Dict[str, requests.Response] = {}
+        self.delays: List[float] = []
+        self.queries: List[str] = []
+        self.requests: List[Tuple[str, str]] = []
+        self.tokens: List[str] = []
+        self.logins = 0
+        self._cursors: Dict[str, List[Dict]] = {}
+        self._lock = threading.Lock()
+
+    def expire_locators(self):
+        self._cursors.clear()
+
+    def post(self, url, headers=None, data=None, timeout=None):
+        self.logins += 1
+        return response(200, {"access_token": f"token{self.logins}", "instance_url": self.instance_url})
+
+    def request(self, method, url, headers=None, params=None, data=None, json=None, timeout=None):
+        path = url[len(self.instance_url) :]
+        with self._lock:
+            self.requests.append((method, path))
+            self.tokens.append(headers.get("Authorization"))
+            delay = self.delays.pop(0) if self.delays else 0
+            failure = self.fail_next.pop(0) if self.fail_next else None
+        if delay:
+            time.sleep(delay)
+        if failure is not None:
+            return failure
+        for suffix, failure in self.failing.items():
+            if path.endswith(suffix):
+                return failure
+
+        if path.endswith("/composite"):
+            return response(200, {"compositeResponse": self._composite(json["compositeRequest"])})
+        if path.endswith("/describe/"):
+            table = path.split("/")[-3]
+            if table not in self.describes:
+                return error(404, "NOT_FOUND", "The requested resource does not exist")
+            return response(200, {"name": table, "fields": self.describes[table]})
+        if "/tooling/" in path:
+            return response(200, {"totalSize": 0, "done": True, "records": []})
+        if params is not None and "q" in params:
+            return response(200, self.query(params["q"]))
+        return self._locator(path)
+
+    def query(self, query: str) -> Dict:
+        self.queries.append(query)
+        match = re.match(r"SELECT (.*?)\s+FROM (\w+)\s*(.*)$", query.strip(), re.S)
+        fields = [field.strip() for field in match.group(1).split(",")]
+        rest = match.group(3)
+        where = re.search(r"WHERE (.*?)(ORDER BY|LIMIT|$)", rest, re.S)
+        matches = _where(where.group(1) if where else "")
+        records = [record for record in self.tables.get(match.group(2), []) if matches(record)]
+        if fields == ["COUNT()"]:
+            return {"totalSize": len(records), "done": True, "records": []}
+
+        order = re.search(r"ORDER BY (\w+) ASC", rest)
+        if order is not None:
+            records.sort(key=lambda record: (_value(record[order.group(1)]), record.get("Id") or ""))
+        limit = re.search(r"LIMIT (\d+)", rest)
+        if limit is not None:
+            records = records[: int(limit.group(1))]
+
+        rows = []
+        for record in records:
+            row = {"attributes": {"type": match.group(2), "url": f"/services/data/v52.0/sobjects/{match.group(2)}/{record.get('Id')}"}}
+            row.update((field, record.get(field)) for field in fields)
+            rows.append(row)
+        # the same query has the same locator, so runs of a query can be compared
+        locator = "/services/data/v52.0/query/01g" + hashlib.md5(query.encode("utf-8")).hexdigest()[:15]
+        return self._page(locator, rows, 0)
+
+    def _page(self, locator: str, rows: List[Dict], offset: int) -> Dict:
+        end = offset + self.page_size
+        page = {"totalSize": len(rows), "done": end >= len(rows)}
+        if end < len(rows):
+            self._cursors[locator] = rows
+            page["nextRecordsUrl"] = f"{locator}-{end}"
+        page["records"] = rows[offset:end]
+        return page
+
+    def _locator(self, path: str) -> requests.Response:
+        locator, offset = path.rsplit("-", 1)
+        rows = self._cursors.get(locator)
+        if rows is None:
+            return error(400, "INVALID_QUERY_LOCATOR", "invalid query locator")
+        return response(200, self._page(locator, rows, int(offset)))
+
+    def _composite(self, subrequests: List[Dict]) -> List[Dict]:
+        results = []
+        for subrequest in subrequests:
+            query = parse_qs(urlparse(subrequest["url"]).query)["q"][0]
+            results.append(
+                {"body": self.query(query), "httpStatusCode": 200, "referenceId": subrequest["referenceId"]}
+            )
+        return results
@@ -0,0 +1,94 @@
+import io
+import gzip
+import json
+import shutil
+import tempfile
+import unittest
+
+from tap_salesforce.batch import BatchStream
+from tap_salesforce.exceptions import TapSalesforceException
+
+
+def _record(i):
+    return {"Id": f"001{i:02d}", "Name": f"Account {i}", "SystemModstamp": f"2024-01-{i + 1:02d}T10:00:00.000+0000"}
+
+
+class BatchStreamTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.output = io.StringIO()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def stream(self, **kwargs):
+        return BatchStream(None, self.output, output_dir=self.directory, **kwargs)
+
+    def messages(self):
+        return [json.loads(line) for line in self.output.getvalue().splitlines()]
+
+    def read(self, manifest):
+        (url,) = manifest
+        self.assertTrue(url.startswith("file://"))
+        with gzip.open(url[len("file://") :], "rt", encoding="utf-8") as part:
+            return [json.loads(line) for line in part]
+
+    def test_rotates_parts_after_max_rows(self):
+        stream = self.stream(max_rows=2)
+        for i in range(5):
+            stream.write_record(_record(i), "Account")
+        stream.close()
+
+        batches = self.messages()
+        self.assertEqual([message["type"] for message in batches], ["BATCH"] * 3)
+        self.assertEqual(batches[0]["stream"], "Account")
+        self.assertEqual(batches[0]["encoding"], {"format": "jsonl", "compression": "gzip"})
+        self.assertEqual(
+            [self.read(message["manifest"]) for message in batches],
+            [[_record(0), _record(1)], [_record(2), _record(3)], [_record(4)]],
+        )
+
+    def test_rotates_parts_after_max_bytes(self):
+        stream = self.stream(max_bytes=len(json.dumps(_record(0))) + 1)
+        for i in range(3):
+            stream.write_record(_record(i), "Account")
+        stream.close()
+
+        self.assertEqual([len(self.read(message["manifest"])) for message in self.messages()], [1, 1, 1])
+
+    def test_holds_the_state_until_its_parts_are_finished(self):
+        stream = self.stream(max_rows=3)
+        stream.write_record(_record(0), "Account")
+        stream.write_record({"name": "Name", "type": "string"}, "AccountFields")
+        stream.set_stream_state("Account", "SystemModstamp", "2024-01-01T10:00:00+00:00Z")
+        stream.write_state()
+        stream.write_record(_record(1), "Account")
+
+        self.assertEqual(self.messages(), [])
+
+        stream.write_record(_record(2), "Account")
+        messages = self.messages()
+        # the STATE covers the records of every stream, all parts are finished before it
+        self.assertEqual([message["type"] for message in messages], ["BATCH", "BATCH", "STATE"])
+        self.assertEqual({message["stream"] for message in messages[:2]}, {"Account", "AccountFields"})
+        self.assertEqual(messages[2]["value"]["bookmarks"]["Account"]["SystemModstamp"], "2024-01-01T10:00:00+00:00Z")
+
+        stream.close()
+        self.assertEqual(len(self.messages()), 3)
+
+    def test_a_state_without_open_parts_is_written_at_once(self):
+        stream = self.stream()
+        stream.write_state()
+
+        self.assertEqual([message["type"] for message in self.messages()], ["STATE"])
+        stream.close()
+
+    def test_rejects_invalid_settings(self):
+        with self.assertRaises(TapSalesforceException):
+            self.stream(compression="bz2")
+        with self.assertRaises(TapSalesforceException):
+            self.stream(max_rows=0)
+
+
+if __name__ == "__main__":
+    unittest.main()
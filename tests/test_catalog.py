@@ -0,0 +1,126 @@
+import unittest
+
+from tap_salesforce.catalog import FieldSelector, build_catalog
+from tap_salesforce.client import Table
+from tap_salesforce.config import flag
+
+FIELDS = [
+    {"name": "Id", "type": "id"},
+    {"name": "Name", "type": "string"},
+    {"name": "SystemModstamp", "type": "datetime"},
+    {"name": "BillingAddress", "type": "address"},
+    {"name": "BillingCity", "type": "string"},
+    {"name": "Score__c", "type": "double", "calculated": True},
+    {"name": "Legacy__c", "type": "string", "deprecatedAndHidden": True},
+    {"name": "NumberOfEmployees", "type": "int"},
+]
+
+
+def _table(name="Account", fields=FIELDS):
+    table = Table(name=name, replication_key="SystemModstamp", primary_key="Id")
+    table.set_fields(fields)
+    return table
+
+
+def _names(fields):
+    return [field["name"] for field in fields]
+
+
+class FieldSelectorTest(unittest.TestCase):
+    def test_selects_every_field_by_default(self):
+        self.assertEqual(FieldSelector().select_fields(_table()), FIELDS)
+
+    def test_exclusion_policies(self):
+        cases = [
+            ({"exclude_compound_fields": True}, "BillingAddress"),
+            ({"exclude_formula_fields": True}, "Score__c"),
+            ({"exclude_deprecated_fields": True}, "Legacy__c"),
+            ({"exclude_fields": {"Account": ["NumberOfEmployees"]}}, "NumberOfEmployees"),
+        ]
+        for config, excluded in cases:
+            with self.subTest(config=config):
+                names = _names(FieldSelector(config=config).select_fields(_table()))
+                self.assertEqual(names, [name for name in _names(FIELDS) if name != excluded])
+
+    def test_policies_passed_as_strings(self):
+        selector = FieldSelector(config={"exclude_compound_fields": "false", "exclude_formula_fields": "true"})
+
+        names = _names(selector.select_fields(_table()))
+
+        self.assertIn("BillingAddress", names)
+        self.assertNotIn("Score__c", names)
+
+    def test_automatic_fields_are_never_excluded(self):
+        selector = FieldSelector(config={"exclude_fields": {"Account": ["Id", "SystemModstamp", "Name"]}})
+
+        self.assertNotIn("Name", _names(selector.select_fields(_table())))
+        self.assertIn("Id", _names(selector.select_fields(_table())))
+        self.assertIn("SystemModstamp", _names(selector.select_fields(_table())))
+
+    def test_selects_the_tables_and_fields_of_the_catalog(self):
+        catalog = build_catalog([_table(), _table("Contact")])
+        account, contact = catalog["streams"]
+        contact["metadata"][0]["metadata"]["selected"] = False
+        for entry in account["metadata"][1:]:
+            if entry["breadcrumb"][-1] in ("Name", "NumberOfEmployees"):
+                entry["metadata"]["selected"] = False
+        # a field added to the org after discovery follows select_fields_by_default
+        table = _table(fields=FIELDS + [{"name": "Industry", "type": "picklist"}])
+
+        selector = FieldSelector(catalog)
+        self.assertTrue(selector.is_selected(_table()))
+        self.assertFalse(selector.is_selected(_table("Contact")))
+        self.assertFalse(selector.is_selected(_table("Lead")))
+        self.assertEqual(
+            _names(selector.select_fields(table)),
+            [name for name in _names(FIELDS) if name not in ("Name", "NumberOfEmployees")] + ["Industry"],
+        )
+        selector = FieldSelector(catalog, {"select_fields_by_default": False})
+        self.assertNotIn("Industry", _names(selector.select_fields(table)))
+
+
+class BuildCatalogTest(unittest.TestCase):
+    def test_describes_the_tables(self):
+        (stream,) = build_catalog([_table()], select_fields_by_default=False)["streams"]
+
+        self.assertEqual(stream["tap_stream_id"], "Account")
+        self.assertEqual(stream["schema"]["properties"]["Name"], {"type": ["null", "string"]})
+        self.assertEqual(stream["schema"]["properties"]["NumberOfEmployees"], {"type": ["null", "integer"]})
+        self.assertEqual(stream["schema"]["properties"]["BillingAddress"]["type"], ["null", "object"])
+        self.assertEqual(
+            stream["metadata"][0]["metadata"],
+            {
+                "selected": True,
+                "table-key-properties": ["Id"],
+                "valid-replication-keys": ["SystemModstamp"],
+                "forced-replication-method": "INCREMENTAL",
+            },
+        )
+        fields = {entry["breadcrumb"][-1]: entry["metadata"] for entry in stream["metadata"][1:]}
+        self.assertEqual(fields["Id"], {"inclusion": "automatic", "selected-by-default": False})
+        self.assertEqual(fields["SystemModstamp"]["inclusion"], "automatic")
+        self.assertEqual(fields["Name"]["inclusion"], "available")
+
+    def test_tables_without_replication_key_are_full_table(self):
+        table = Table(name="Territory", replication_key=None, primary_key="Id")
+        table.set_fields(FIELDS[:2])
+
+        (stream,) = build_catalog([table])["streams"]
+
+        self.assertEqual(stream["metadata"][0]["metadata"]["forced-replication-method"], "FULL_TABLE")
+
+
+class FlagTest(unittest.TestCase):
+    def test_reads_boolean_config_values(self):
+        config = {"yes": True, "no": False, "text_yes": "True", "text_no": "false", "zero": 0}
+
+        self.assertEqual(
+            [flag(config, key) for key in ("yes", "no", "text_yes", "text_no", "zero")],
+            [True, False, True, False, False],
+        )
+        self.assertFalse(flag(config, "missing"))
+        self.assertTrue(flag(config, "missing", True))
+
+
+if __name__ == "__main__":
+    unittest.main()
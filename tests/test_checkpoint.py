@@ -0,0 +1,116 @@
+import io
+import json
+import unittest
+from datetime import datetime, timezone
+
+from tap_salesforce import sync
+from tap_salesforce.client import Table
+from tap_salesforce.checkpoint import Checkpoint
+from tap_salesforce.stream import Stream
+from tests.salesforce_stub import SalesforceStub, connect
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+END = datetime(2024, 2, 1, tzinfo=timezone.utc)
+FIELDS = ["Id", "Name", "SystemModstamp"]
+
+
+def _accounts(keys):
+    return [
+        {"Id": f"001{i:02d}", "Name": f"Account {i}", "SystemModstamp": key}
+        for i, key in enumerate(keys)
+    ]
+
+
+class InterruptedStream(Stream):
+    """fails writing the record after `records` records were written"""
+
+    def __init__(self, records, output):
+        super().__init__(None, output)
+        self.records = records
+
+    def write_record(self, record, stream_id, file=None):
+        if self.records == 0:
+            raise RuntimeError("interrupted")
+        self.records -= 1
+        super().write_record(record, stream_id, file)
+
+
+class CheckpointResumeTest(unittest.TestCase):
+    def setUp(self):
+        self.output = io.StringIO()
+        self.table = Table(name="Account", replication_key="SystemModstamp", primary_key="Id")
+
+    def interrupt(self, stub, records):
+        """syncs until `records` records were written, returns the checkpoint of the state"""
+        stream = InterruptedStream(records, self.output)
+        with self.assertRaises(RuntimeError):
+            sync(connect(stub), stream, self.table, FIELDS, START, END)
+        return Checkpoint.from_dict(stream.get_bookmark("Account")["checkpoint"])
+
+    def resume(self, stub, checkpoint):
+        stream = Stream(None, self.output)
+        sync(
+            connect(stub),
+            stream,
+            self.table,
+            FIELDS,
+            checkpoint.start,
+            checkpoint.end,
+            checkpoint=checkpoint,
+        )
+        self.assertNotIn("checkpoint", stream.get_bookmark("Account"))
+
+    def written(self):
+        return [
+            json.loads(line)["record"]["Id"]
+            for line in self.output.getvalue().splitlines()
+            if json.loads(line)["type"] == "RECORD"
+        ]
+
+    def test_resumes_the_cursor_within_a_partial_page(self):
+        accounts = _accounts([f"2024-01-{day:02d}T10:00:00.000+0000" for day in range(2, 9)])
+        stub = SalesforceStub({"Account": accounts}, page_size=3)
+
+        checkpoint = self.interrupt(stub, 4)
+        self.assertIsNotNone(checkpoint.cursor)
+        self.assertEqual(checkpoint.offset, 1)
+        cursor = checkpoint.cursor
+
+        self.resume(stub, checkpoint)
+
+        self.assertEqual(self.written(), [account["Id"] for account in accounts])
+        self.assertIn(("GET", cursor), stub.requests)
+
+    def test_ties_on_the_replication_key_continue_after_the_last_id(self):
+        accounts = _accounts(["2024-01-02T10:00:00.000+0000"] * 5 + ["2024-01-03T10:00:00.000+0000"])
+        stub = SalesforceStub({"Account": accounts}, page_size=4)
+
+        # the first page has no locator, the window continues after the last written record
+        checkpoint = self.interrupt(stub, 2)
+        self.assertIsNone(checkpoint.cursor)
+        self.assertEqual(checkpoint.after, ("2024-01-02T10:00:00.000+0000", "00101"))
+
+        self.resume(stub, checkpoint)
+
+        self.assertEqual(self.written(), [account["Id"] for account in accounts])
+        self.assertIn("Id > '00101'", stub.queries[-1])
+
+    def test_an_expired_cursor_continues_after_the_last_record(self):
+        accounts = _accounts(["2024-01-02T10:00:00.000+0000"] * 3 + ["2024-01-03T10:00:00.000+0000"] * 4)
+        stub = SalesforceStub({"Account": accounts}, page_size=2)
+
+        checkpoint = self.interrupt(stub, 3)
+        self.assertIsNotNone(checkpoint.cursor)
+        stub.expire_locators()
+
+        self.resume(stub, checkpoint)
+
+        self.assertEqual(self.written(), [account["Id"] for account in accounts])
+        self.assertIn(
+            "(SystemModstamp > 2024-01-02T10:00:00Z OR (SystemModstamp = 2024-01-02T10:00:00Z AND Id > '00102'))",
+            stub.queries[-1],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+import unittest
+from datetime import date, datetime, timedelta, timezone
+
+from tap_salesforce.converter import RecordConverter
+from tap_salesforce.exceptions import TapSalesforceException
+
+FIELDS = [
+    {"name": "Id", "type": "id"},
+    {"name": "BillingAddress", "type": "address"},
+    {"name": "Location__c", "type": "location"},
+]
+ADDRESS = {"city": "Berlin", "country": "Germany", "latitude": 52.5}
+
+
+def _record(**fields):
+    return {"attributes": {"type": "Account", "url": "/sobjects/Account/001A"}, "Id": "001A", **fields}
+
+
+class CompoundFieldsTest(unittest.TestCase):
+    def test_keeps_compound_fields(self):
+        converter = RecordConverter(FIELDS, "keep")
+
+        record = converter(_record(BillingAddress=ADDRESS, Location__c=None))
+
+        self.assertEqual(record, {"Id": "001A", "BillingAddress": ADDRESS, "Location__c": None})
+        self.assertEqual(converter.fields, FIELDS)
+
+    def test_flattens_compound_fields(self):
+        converter = RecordConverter(FIELDS, "flatten")
+
+        record = converter(_record(BillingAddress=ADDRESS, Location__c={"latitude": 1.0, "longitude": 2.0}))
+
+        self.assertEqual(
+            record,
+            {
+                "Id": "001A",
+                "BillingAddress_city": "Berlin",
+                "BillingAddress_country": "Germany",
+                "BillingAddress_latitude": 52.5,
+                "Location__c_latitude": 1.0,
+                "Location__c_longitude": 2.0,
+            },
+        )
+        names = [field["name"] for field in converter.fields]
+        self.assertIn("BillingAddress_postalCode", names)
+        self.assertIn("Location__c_longitude", names)
+        self.assertNotIn("BillingAddress", names)
+
+    def test_omits_compound_fields(self):
+        converter = RecordConverter(FIELDS, "omit")
+
+        record = converter(_record(BillingAddress=ADDRESS, Location__c=None))
+
+        self.assertEqual(record, {"Id": "001A"})
+        self.assertEqual(converter.fields, FIELDS[:1])
+
+    def test_rejects_unknown_modes(self):
+        with self.assertRaises(TapSalesforceException):
+            RecordConverter(FIELDS, "nest")
+
+
+class NormalizeTypesTest(unittest.TestCase):
+    fields = [
+        {"name": "SystemModstamp", "type": "datetime"},
+        {"name": "CloseDate", "type": "date"},
+        {"name": "NumberOfEmployees", "type": "int"},
+        {"name": "Views__c", "type": "long"},
+        {"name": "Score__c", "type": "double"},
+        {"name": "AnnualRevenue", "type": "currency"},
+        {"name": "Probability", "type": "percent"},
+        {"name": "IsDeleted", "type": "boolean"},
+        {"name": "Name", "type": "string"},
+    ]
+
+    def test_coerces_values_to_their_field_type(self):
+        converter = RecordConverter(self.fields, normalize_types=True)
+        record = _record(
+            SystemModstamp="2024-01-01T10:00:00.000+0000",
+            CloseDate="2024-02-01",
+            NumberOfEmployees="12.0",
+            Views__c=7.0,
+            Score__c="1.5",
+            AnnualRevenue="1000",
+            Probability=50,
+            IsDeleted="false",
+            Name="12",
+        )
+
+        self.assertEqual(
+            converter(record),
+            {
+                "Id": "001A",
+                "SystemModstamp": "2024-01-01T10:00:00.000000Z",
+                "CloseDate": "2024-02-01",
+                "NumberOfEmployees": 12,
+                "Views__c": 7,
+                "Score__c": 1.5,
+                "AnnualRevenue": 1000.0,
+                "Probability": 50.0,
+                "IsDeleted": False,
+                "Name": "12",
+            },
+        )
+
+    def test_converts_datetimes_to_utc(self):
+        converter = RecordConverter(self.fields, normalize_types=True)
+        tz = timezone(timedelta(hours=2))
+
+        self.assertEqual(
+            converter({"SystemModstamp": "2024-01-01T12:00:00.000+0200"})["SystemModstamp"],
+            "2024-01-01T10:00:00.000000Z",
+        )
+        self.assertEqual(
+            converter({"SystemModstamp": datetime(2024, 1, 1, 12, tzinfo=tz)})["SystemModstamp"],
+            "2024-01-01T10:00:00.000000Z",
+        )
+
+    def test_normalizes_dates(self):
+        converter = RecordConverter(self.fields, normalize_types=True)
+
+        for value in ["2024-02-01", "2024-02-01T00:00:00.000+0000", date(2024, 2, 1), datetime(2024, 2, 1, 10)]:
+            self.assertEqual(converter({"CloseDate": value}), {"CloseDate": "2024-02-01"})
+        self.assertEqual(converter({"CloseDate": None}), {"CloseDate": None})
+
+    def test_keeps_the_values_without_normalize_types(self):
+        converter = RecordConverter(self.fields)
+        record = {"NumberOfEmployees": "12.0", "IsDeleted": "false", "CloseDate": "2024-02-01"}
+
+        self.assertEqual(converter(record), record)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import io
+import json
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from tap_salesforce import do_sync
+from tap_salesforce.dedupe import OverlapFilter
+from tap_salesforce.stream import Stream
+from tests.salesforce_stub import SalesforceStub, connect
+
+OVERLAP = timedelta(minutes=3)
+FIELDS = [
+    {"name": "Id", "type": "id"},
+    {"name": "Name", "type": "string"},
+    {"name": "SystemModstamp", "type": "datetime"},
+]
+
+
+def _key(value: datetime) -> str:
+    return value.strftime("%Y-%m-%dT%H:%M:%S.000+0000")
+
+
+def _parse(key: str) -> datetime:
+    return datetime.strptime(key, "%Y-%m-%dT%H:%M:%S.%f%z")
+
+
+class OverlapFilterTest(unittest.TestCase):
+    def test_keeps_the_emitted_records_through_the_state(self):
+        previous = OverlapFilter(OVERLAP)
+        previous.add("001A", "2024-01-01T10:00:00.000+0000", _parse("2024-01-01T10:00:00.000+0000"))
+        previous.add("001B", "2024-01-01T10:01:00.000+0000", _parse("2024-01-01T10:01:00.000+0000"))
+
+        state = previous.to_state()
+        self.assertEqual(state["overlap_until"], "2024-01-01T10:01:00+00:00")
+        restored = OverlapFilter.from_state(state, OVERLAP)
+
+        self.assertTrue(restored.is_duplicate("001A", "2024-01-01T10:00:00.000+0000"))
+        self.assertTrue(restored.is_duplicate("001B", "2024-01-01T10:01:00.000+0000"))
+        self.assertFalse(restored.is_duplicate("001C", "2024-01-01T10:01:00.000+0000"))
+        self.assertEqual(restored.suppressed, 2)
+        # the previous tail is kept until the new run emits past it
+        carried = OverlapFilter.from_state(restored.to_state(), OVERLAP)
+        self.assertEqual(restored.to_state()["overlap_until"], state["overlap_until"])
+        self.assertTrue(carried.is_duplicate("001A", "2024-01-01T10:00:00.000+0000"))
+
+    def test_a_changed_replication_key_is_emitted(self):
+        previous = OverlapFilter(OVERLAP)
+        previous.add("001A", "2024-01-01T10:00:00.000+0000", _parse("2024-01-01T10:00:00.000+0000"))
+
+        restored = OverlapFilter.from_state(previous.to_state(), OVERLAP)
+
+        self.assertFalse(restored.is_duplicate("001A", "2024-01-01T10:02:00.000+0000"))
+        self.assertEqual(restored.suppressed, 0)
+
+    def test_evicts_the_records_before_the_horizon(self):
+        overlap_filter = OverlapFilter(OVERLAP)
+        for record_id, key in [
+            ("001A", "2024-01-01T10:00:00.000+0000"),
+            ("001B", "2024-01-01T10:02:00.000+0000"),
+            ("001C", "2024-01-01T10:04:00.000+0000"),
+        ]:
+            overlap_filter.add(record_id, key, _parse(key))
+
+        restored = OverlapFilter.from_state(overlap_filter.to_state(), OVERLAP)
+
+        # 001A is older than the overlap before the last emitted record
+        self.assertFalse(restored.is_duplicate("001A", "2024-01-01T10:00:00.000+0000"))
+        self.assertTrue(restored.is_duplicate("001B", "2024-01-01T10:02:00.000+0000"))
+        self.assertTrue(restored.is_duplicate("001C", "2024-01-01T10:04:00.000+0000"))
+
+    def test_keeps_at_most_max_size_records(self):
+        overlap_filter = OverlapFilter(OVERLAP, max_size=2)
+        key = "2024-01-01T10:00:00.000+0000"
+        for record_id in ["001A", "001B", "001C"]:
+            overlap_filter.add(record_id, key, _parse(key))
+
+        restored = OverlapFilter.from_state(overlap_filter.to_state(), OVERLAP, max_size=2)
+
+        self.assertFalse(restored.is_duplicate("001A", key))
+        self.assertTrue(restored.is_duplicate("001B", key))
+        self.assertTrue(restored.is_duplicate("001C", key))
+
+    def test_the_previous_tail_is_evicted_once_the_run_passed_it(self):
+        previous = OverlapFilter(OVERLAP)
+        previous.add("001A", "2024-01-01T10:00:00.000+0000", _parse("2024-01-01T10:00:00.000+0000"))
+
+        overlap_filter = OverlapFilter.from_state(previous.to_state(), OVERLAP)
+        overlap_filter.add("001B", "2024-01-01T10:10:00.000+0000", _parse("2024-01-01T10:10:00.000+0000"))
+        restored = OverlapFilter.from_state(overlap_filter.to_state(), OVERLAP)
+
+        self.assertFalse(restored.is_duplicate("001A", "2024-01-01T10:00:00.000+0000"))
+        self.assertTrue(restored.is_duplicate("001B", "2024-01-01T10:10:00.000+0000"))
+
+
+class OverlapDedupeSyncTest(unittest.TestCase):
+    def test_resync_tables_are_never_filtered(self):
+        key = _key(datetime.now(timezone.utc) - timedelta(hours=1))
+        records = [{"Id": "001A", "Name": "Acme", "SystemModstamp": key}]
+        stub = SalesforceStub({"Account": records, "OpportunityLineItem": records})
+        stub.describes = {
+            name: FIELDS for name in ["Account", "Contact", "User", "Opportunity", "OpportunityLineItem"]
+        }
+
+        previous = OverlapFilter(OVERLAP)
+        previous.add("001A", key, _parse(key))
+        bookmark = {"SystemModstamp": _parse(key).isoformat()[:-6] + "Z", **previous.to_state()}
+        state = {"bookmarks": {"Account": dict(bookmark), "OpportunityLineItem": dict(bookmark)}}
+        output = io.StringIO()
+
+        do_sync(
+            connect(stub),
+            Stream(state, output),
+            {
+                "start_date": "2024-01-01T00:00:00Z",
+                "change_probes": False,
+                "special_objects": [
+                    {"name": "OpportunityLineItem", "replication_key": "SystemModstamp", "primary_key": "Id"}
+                ],
+            },
+        )
+
+        messages = [json.loads(line) for line in output.getvalue().splitlines()]
+        written = [message["stream"] for message in messages if message["type"] == "RECORD"]
+        # the incremental table suppresses the record it emitted in the previous run
+        self.assertNotIn("Account", written)
+        self.assertEqual(written.count("OpportunityLineItem"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import io
+import shutil
+import tempfile
+import unittest
+
+from tap_salesforce.diff_index import DiffIndex, GENERATION_KEY
+from tap_salesforce.stream import Stream
+
+
+def _record(record_id, name="Acme"):
+    return {"Id": record_id, "Name": name, "SystemModstamp": "2024-01-01T10:00:00.000+0000"}
+
+
+class DiffIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.output = io.StringIO()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def open(self, state=None):
+        stream = Stream(state, self.output)
+        index = DiffIndex.for_table(
+            self.directory, "OpportunityLineItem", None, stream.get_bookmark("OpportunityLineItem")
+        )
+        stream.state_listeners.append(index)
+        return stream, index
+
+    def test_changes_are_only_kept_with_a_covering_state(self):
+        stream, index = self.open()
+        self.assertTrue(index.changed(_record("001A")))
+        # the run fails before a STATE covers the record
+        stream.close()
+
+        stream, index = self.open()
+        self.assertTrue(index.changed(_record("001A")))
+        stream.write_state()
+        state = stream.get_state()
+        stream.close()
+
+        stream, index = self.open(state)
+        self.assertFalse(index.changed(_record("001A")))
+        self.assertTrue(index.changed(_record("001A", name="changed")))
+        stream.close()
+
+    def test_changes_after_the_state_are_not_kept(self):
+        stream, index = self.open()
+        index.changed(_record("001A"))
+        stream.write_state()
+        state = stream.get_state()
+        index.changed(_record("001B"))
+        stream.close()
+
+        stream, index = self.open(state)
+        self.assertFalse(index.changed(_record("001A")))
+        self.assertTrue(index.changed(_record("001B")))
+        stream.close()
+
+    def test_applies_the_generation_of_the_last_state_of_a_failed_run(self):
+        stream, index = self.open()
+        index.changed(_record("001A"))
+        # the STATE was written, the run failed before the index applied it
+        stream.state_listeners.remove(index)
+        index.snapshot(stream)
+        state = stream.get_state()
+        index.close()
+        self.assertIn(GENERATION_KEY, state["bookmarks"]["OpportunityLineItem"])
+
+        stream, index = self.open(state)
+        self.assertFalse(index.changed(_record("001A")))
+        stream.close()
+
+    def test_deleted_ids_are_removed_after_their_tombstones(self):
+        stream, index = self.open()
+        index.changed(_record("001A"))
+        index.changed(_record("001B"))
+        index.finish(index.missing(None, None))
+        stream.write_state()
+        state = stream.get_state()
+        stream.close()
+
+        # the next pass does not see 001B, its tombstone is not covered by a STATE
+        stream, index = self.open(state)
+        index.changed(_record("001A"))
+        self.assertEqual(index.missing(None, None), ["001B"])
+        index.finish(["001B"])
+        stream.close()
+
+        stream, index = self.open(state)
+        index.changed(_record("001A"))
+        self.assertEqual(index.missing(None, None), ["001B"])
+        index.finish(["001B"])
+        stream.write_state()
+        state = stream.get_state()
+        stream.close()
+
+        # 001B has left the index, a new pass has not seen 001A yet
+        stream, index = self.open(state)
+        self.assertEqual(index.missing(None, None), ["001A"])
+        self.assertTrue(index.changed(_record("001B")))
+        stream.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
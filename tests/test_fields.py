@@ -0,0 +1,73 @@
+import io
+import json
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from tap_salesforce.client import Table
+from tap_salesforce.fields import sync_fields
+from tap_salesforce.stream import Stream
+
+REFRESH_INTERVAL = timedelta(hours=24)
+
+
+def _table(*fields):
+    table = Table(name="Account", replication_key="SystemModstamp", primary_key="Id")
+    table.set_fields(list(fields))
+    return table
+
+
+class SyncFieldsTest(unittest.TestCase):
+    def sync(self, state, table):
+        output = io.StringIO()
+        stream = Stream(state, output)
+        sync_fields(stream, table, REFRESH_INTERVAL)
+        records = [json.loads(line)["record"] for line in output.getvalue().splitlines()]
+        return records, stream.get_state()
+
+    def test_writes_all_fields_of_the_first_run(self):
+        fields = [{"name": "Id", "type": "id"}, {"name": "Name", "type": "string"}]
+
+        records, state = self.sync(None, _table(*fields))
+
+        self.assertEqual(records, fields)
+        self.assertEqual(set(state["bookmarks"]["AccountFields"]["digests"]), {"Id", "Name"})
+
+    def test_writes_changed_fields_and_markers_for_removed_fields(self):
+        _, state = self.sync(
+            None,
+            _table(
+                {"name": "Id", "type": "id"},
+                {"name": "Name", "type": "string", "length": 80},
+                {"name": "Fax", "type": "phone"},
+            ),
+        )
+
+        changed = {"name": "Name", "type": "string", "length": 255}
+        added = {"name": "Industry", "type": "picklist"}
+        records, state = self.sync(state, _table({"name": "Id", "type": "id"}, changed, added))
+
+        self.assertEqual(records[:2], [changed, added])
+        self.assertEqual(len(records), 3)
+        self.assertEqual(records[2]["name"], "Fax")
+        self.assertIn("_sdc_deleted_at", records[2])
+        self.assertEqual(set(state["bookmarks"]["AccountFields"]["digests"]), {"Id", "Name", "Industry"})
+
+        # the removed field is only marked once
+        records, _ = self.sync(state, _table({"name": "Id", "type": "id"}, changed, added))
+        self.assertEqual(records, [])
+
+    def test_writes_all_fields_after_the_refresh_interval(self):
+        fields = [{"name": "Id", "type": "id"}, {"name": "Name", "type": "string"}]
+        _, state = self.sync(None, _table(*fields))
+
+        refreshed_at = datetime.now(timezone.utc) - REFRESH_INTERVAL - timedelta(minutes=1)
+        state["bookmarks"]["AccountFields"]["refreshed_at"] = refreshed_at.isoformat() + "Z"
+        records, state = self.sync(state, _table(*fields))
+
+        self.assertEqual(records, fields)
+        refreshed_at = datetime.fromisoformat(state["bookmarks"]["AccountFields"]["refreshed_at"][:-1])
+        self.assertLess(datetime.now(timezone.utc) - refreshed_at, timedelta(minutes=1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from tap_salesforce.journal import Journal, load_index
+
+
+def _messages(i):
+    record = {"Id": f"001{i:02d}", "Description": "x" * 10000, "SystemModstamp": f"2024-01-{i + 1:02d}T10:00:00.000+0000"}
+    return [
+        {"type": "RECORD", "stream": "Account", "record": record},
+        {"type": "STATE", "value": {"bookmarks": {"Account": {"SystemModstamp": record["SystemModstamp"]}}}},
+    ]
+
+
+class JournalRetentionTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, journal, segments):
+        journal.replication_keys["Account"] = "SystemModstamp"
+        for i in range(segments):
+            for message in _messages(i):
+                journal.append(message, json.dumps(message))
+        journal.close()
+
+    def test_retention_goes_by_the_compressed_size(self):
+        journal = Journal(self.directory, max_bytes=5000, segment_bytes=1)
+        self.write(journal, 3)
+
+        index = load_index(self.directory)
+        self.assertEqual(len(index), 3)
+        for entry in index:
+            self.assertEqual(entry["file_bytes"], os.path.getsize(os.path.join(self.directory, entry["segment"])))
+            self.assertLess(entry["file_bytes"], entry["bytes"])
+
+    def test_removes_the_oldest_segments_beyond_max_bytes(self):
+        self.write(Journal(self.directory, segment_bytes=1), 3)
+        index = load_index(self.directory)
+        newest = index[-1]
+
+        Journal(self.directory, max_bytes=newest["file_bytes"] + 1).apply_retention()
+
+        self.assertEqual(load_index(self.directory), [newest])
+        self.assertEqual(sorted(os.listdir(self.directory)), sorted(["index.json", newest["segment"]]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import time
+import unittest
+from unittest import mock
+
+from tap_salesforce.latency import QUERY
+from tests.salesforce_stub import SalesforceStub, connect
+
+SLOW_SECONDS = 1.0
+
+
+@mock.patch("tap_salesforce.client.MIN_HEDGE_DELAY_SECONDS", 0.05)
+class HedgedPageTest(unittest.TestCase):
+    def setUp(self):
+        accounts = [{"Id": f"001{i:02d}", "Name": f"Account {i}"} for i in range(6)]
+        self.stub = SalesforceStub({"Account": accounts}, page_size=2)
+        self.sf = connect(self.stub, hedge_budget=1)
+        for _ in range(20):
+            self.sf.latency.record(QUERY, 0.01)
+        self.locator = self.stub.query("SELECT Id,Name FROM Account")["nextRecordsUrl"]
+
+    def test_the_first_response_wins(self):
+        self.stub.delays = [SLOW_SECONDS]
+
+        started = time.monotonic()
+        resp = self.sf.next_page(self.locator)
+
+        self.assertLess(time.monotonic() - started, SLOW_SECONDS)
+        self.assertEqual([record["Id"] for record in resp.json()["records"]], ["00102", "00103"])
+        self.assertEqual(self.stub.requests, [("GET", self.locator)] * 2)
+        self.assertEqual(self.sf.hedges, 1)
+
+    def test_pages_are_not_hedged_beyond_the_budget(self):
+        self.stub.delays = [SLOW_SECONDS]
+        self.sf.next_page(self.locator)
+        self.stub.requests.clear()
+
+        self.stub.delays = [0.2]
+        started = time.monotonic()
+        self.sf.next_page(self.locator)
+
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+        self.assertEqual(self.stub.requests, [("GET", self.locator)])
+        self.assertEqual(self.sf.hedges, 1)
+
+    def test_fast_pages_are_not_hedged(self):
+        self.sf.next_page(self.locator)
+
+        self.assertEqual(self.stub.requests, [("GET", self.locator)])
+        self.assertEqual(self.sf.hedges, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+from unittest import mock
+
+from tap_salesforce.memory import HARD, OK, SOFT, MemoryGovernor, SpillBuffer, row_bytes, rss_bytes
+from tap_salesforce.rows import FieldIndex, MISSING, pack_page, unpack_page
+
+FIELDS = ["Id", "Name", "SystemModstamp", "BillingAddress"]
+
+
+def _record(record_id, **fields):
+    return {"attributes": {"type": "Account", "url": f"/sobjects/Account/{record_id}"}, "Id": record_id, **fields}
+
+
+class SpillBufferTest(unittest.TestCase):
+    def test_records_round_trip_through_spilled_rows(self):
+        buffer = SpillBuffer("SystemModstamp", FieldIndex(FIELDS))
+        try:
+            # the field chunks of a record come from separate subqueries
+            buffer.merge("001A", _record("001A", Name="Acme", SystemModstamp="2024-01-01T10:00:00.000+0000"))
+            buffer.merge("001B", _record("001B", Name=None, SystemModstamp="2024-01-02T10:00:00.000+0000"))
+            buffer.spill()
+            self.assertEqual(buffer.spilled, 2)
+            self.assertEqual(buffer.memory_bytes(), 0)
+
+            address = {"city": "Berlin", "street": "Main St.", "latitude": 52.5}
+            buffer.merge("001A", {"Id": "001A", "BillingAddress": address, "SystemModstamp": "2024-01-01T10:00:00.000+0000"})
+            buffer.merge("001C", _record("001C", SystemModstamp="2024-01-03T10:00:00.000+0000", Custom__c=1.5))
+
+            self.assertEqual(
+                sorted(buffer.pairs()),
+                [
+                    ("2024-01-01T10:00:00.000+0000", "001A"),
+                    ("2024-01-02T10:00:00.000+0000", "001B"),
+                    ("2024-01-03T10:00:00.000+0000", "001C"),
+                ],
+            )
+            records = [buffer.pop_oldest() for _ in range(len(buffer))]
+        finally:
+            buffer.close()
+
+        self.assertEqual(
+            records,
+            [
+                _record("001B", Name=None, SystemModstamp="2024-01-02T10:00:00.000+0000"),
+                _record("001A", Name="Acme", SystemModstamp="2024-01-01T10:00:00.000+0000", BillingAddress=address),
+                _record("001C", SystemModstamp="2024-01-03T10:00:00.000+0000", Custom__c=1.5),
+            ],
+        )
+        # the fields a record lacks are not added as nulls
+        self.assertNotIn("Name", records[2])
+
+
+class MemoryGovernorTest(unittest.TestCase):
+    def setUp(self):
+        self.governor = MemoryGovernor(rss_interval_seconds=0)
+        self.governor.configure(1000)
+
+    def test_pressure_follows_the_tracked_buffers(self):
+        with mock.patch("tap_salesforce.memory.rss_bytes", return_value=None):
+            self.governor.track("page", 500)
+            self.assertEqual(self.governor.pressure(), OK)
+            self.governor.track("merge", 300)
+            self.assertEqual(self.governor.pressure(), SOFT)
+            self.governor.track("merge", 600)
+            self.assertEqual(self.governor.pressure(), HARD)
+            self.governor.track("merge", 0)
+            self.assertEqual(self.governor.pressure(), OK)
+
+    def test_the_rss_is_a_hard_ceiling(self):
+        with mock.patch("tap_salesforce.memory.rss_bytes", return_value=1999):
+            self.assertEqual(self.governor.pressure(), OK)
+        with mock.patch("tap_salesforce.memory.rss_bytes", return_value=2000):
+            self.assertEqual(self.governor.pressure(), HARD)
+
+    def test_the_rss_is_read_at_intervals(self):
+        governor = MemoryGovernor(rss_interval_seconds=60)
+        governor.configure(1000)
+        with mock.patch("tap_salesforce.memory.rss_bytes", return_value=100) as rss:
+            governor.pressure()
+            governor.pressure()
+        self.assertEqual(rss.call_count, 1)
+
+    def test_reads_the_rss_of_the_process(self):
+        rss = rss_bytes()
+        if rss is not None:
+            self.assertGreater(rss, 0)
+
+    def test_row_bytes_counts_nested_values(self):
+        address = {"city": "Berlin", "street": "Main St. " * 50, "latitude": 52.5}
+
+        self.assertGreater(row_bytes(["001A", address]), row_bytes(["001A", {}]) + len(address["street"]))
+
+
+class FieldIndexTest(unittest.TestCase):
+    def test_rows_only_hold_the_values_of_the_record(self):
+        index = FieldIndex(FIELDS)
+
+        row = index.row({"Id": "001A", "SystemModstamp": "2024-01-01T10:00:00.000+0000"})
+
+        self.assertEqual(row, ["001A", MISSING, "2024-01-01T10:00:00.000+0000"])
+        self.assertEqual(index.get(row, "Name", "default"), "default")
+        self.assertEqual(index.record(row), {"Id": "001A", "SystemModstamp": "2024-01-01T10:00:00.000+0000"})
+
+    def test_pages_round_trip(self):
+        body = {
+            "totalSize": 2,
+            "done": False,
+            "nextRecordsUrl": "/services/data/v52.0/query/01g-2",
+            "records": [_record("001A", Name="Acme"), _record("001B", Custom__c=True)],
+        }
+
+        self.assertEqual(unpack_page(pack_page(body)), body)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+import io
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from datetime import date, datetime, timezone
+
+try:
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    ipc = pq = None
+
+from tap_salesforce.parquet import ParquetStream
+from tap_salesforce.exceptions import TapSalesforceException
+
+FIELDS = [
+    {"name": "Id", "type": "id"},
+    {"name": "SystemModstamp", "type": "datetime"},
+    {"name": "CloseDate", "type": "date"},
+    {"name": "Amount", "type": "currency"},
+    {"name": "IsWon", "type": "boolean"},
+    {"name": "BillingAddress", "type": "address"},
+]
+
+
+def _record(i):
+    return {
+        "Id": f"006{i:02d}",
+        "SystemModstamp": f"2024-01-{i + 1:02d}T10:00:00.000+0000",
+        "CloseDate": f"2024-02-{i + 1:02d}",
+        "Amount": 100.5 * i,
+        "IsWon": i % 2 == 0,
+        "BillingAddress": {"city": "Berlin"} if i == 0 else None,
+    }
+
+
+@unittest.skipIf(pq is None, "the parquet output requires pyarrow")
+class ParquetStreamTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.output = io.StringIO()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def stream(self, **kwargs):
+        stream = ParquetStream(None, self.output, output_dir=self.directory, **kwargs)
+        stream.set_table_fields("Opportunity", FIELDS)
+        return stream
+
+    def messages(self):
+        return [json.loads(line) for line in self.output.getvalue().splitlines()]
+
+    def parts(self, extension=".parquet"):
+        directory = os.path.join(self.directory, "Opportunity")
+        return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(extension))
+
+    def test_rotates_parts_and_converts_the_field_types(self):
+        stream = self.stream(part_max_rows=2)
+        for i in range(5):
+            stream.write_record(_record(i), "Opportunity")
+        stream.close()
+
+        parts = self.parts()
+        self.assertEqual([pq.read_metadata(part).num_rows for part in parts], [2, 2, 1])
+        rows = [row for part in parts for row in pq.read_table(part).to_pylist()]
+        self.assertEqual([row["Id"] for row in rows], [f"006{i:02d}" for i in range(5)])
+        self.assertEqual(rows[0]["SystemModstamp"], datetime(2024, 1, 1, 10, tzinfo=timezone.utc))
+        self.assertEqual(rows[0]["CloseDate"], date(2024, 2, 1))
+        self.assertEqual(rows[0]["BillingAddress"], '{"city": "Berlin"}')
+        self.assertIsNone(rows[1]["BillingAddress"])
+        self.assertIn("_sdc_deleted_at", rows[0])
+
+    def test_writes_row_groups_of_a_part(self):
+        stream = self.stream(row_group_size=2)
+        for i in range(5):
+            stream.write_record(_record(i), "Opportunity")
+        stream.close()
+
+        (part,) = self.parts()
+        self.assertEqual(pq.ParquetFile(part).num_row_groups, 3)
+
+    def test_holds_the_state_until_its_parts_are_finished(self):
+        stream = self.stream(part_max_rows=2)
+        stream.write_record(_record(0), "Opportunity")
+        stream.set_stream_state("Opportunity", "SystemModstamp", "2024-01-01T10:00:00+00:00Z")
+        stream.write_state()
+
+        self.assertEqual(self.messages(), [])
+
+        stream.write_record(_record(1), "Opportunity")
+        messages = self.messages()
+        self.assertEqual([message["type"] for message in messages], ["STATE"])
+        self.assertEqual(messages[0]["value"]["bookmarks"]["Opportunity"]["SystemModstamp"], "2024-01-01T10:00:00+00:00Z")
+        # the part is complete once its STATE is emitted
+        self.assertEqual([pq.read_metadata(part).num_rows for part in self.parts()], [2])
+        stream.close()
+
+    def test_a_state_without_open_parts_is_written_at_once(self):
+        stream = self.stream()
+        stream.write_state()
+
+        self.assertEqual([message["type"] for message in self.messages()], ["STATE"])
+        stream.close()
+
+    def test_writes_arrow_files(self):
+        stream = self.stream(file_format="arrow", compression="zstd")
+        for i in range(3):
+            stream.write_record(_record(i), "Opportunity")
+        stream.close()
+
+        (part,) = self.parts(".arrow")
+        with ipc.open_file(part) as reader:
+            self.assertEqual(reader.read_all().num_rows, 3)
+
+    def test_streams_without_fields_are_written_as_messages(self):
+        stream = self.stream()
+        stream.write_record({"name": "Amount", "type": "currency"}, "OpportunityFields")
+        stream.close()
+
+        (message,) = self.messages()
+        self.assertEqual(message["stream"], "OpportunityFields")
+
+    def test_rejects_fields_that_are_not_in_the_schema(self):
+        stream = self.stream()
+        with self.assertRaises(TapSalesforceException):
+            stream.write_record({**_record(0), "Unknown__c": 1}, "Opportunity")
+        # the attributes of the query result are dropped
+        stream.write_record({**_record(0), "attributes": {"type": "Opportunity"}}, "Opportunity")
+        stream.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
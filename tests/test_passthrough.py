@@ -0,0 +1,145 @@
+import json
+import unittest
+from datetime import datetime, timezone
+from unittest import mock
+
+from tap_salesforce.passthrough import split_page, field_value, passthrough_page
+from tap_salesforce.pipeline import decode_page
+
+TIME_EXTRACTED = "2024-03-01T10:00:00.000000+00:00Z"
+
+
+def _record(record_id, **fields):
+    record = {
+        "attributes": {"type": "Account", "url": f"/services/data/v58.0/sobjects/Account/{record_id}"},
+        "Id": record_id,
+    }
+    record.update(fields)
+    return record
+
+
+def _page(records, **kwargs):
+    """encodes a page like salesforce, without whitespace"""
+    page = {"totalSize": len(records), "done": True, "records": records}
+    return json.dumps(page, separators=(",", ":"), **kwargs).encode("utf-8")
+
+
+class SplitPageTest(unittest.TestCase):
+    def test_returns_the_raw_bytes_of_every_record(self):
+        records = [
+            _record("001A", Name="Acme", SystemModstamp="2024-01-01T10:00:00.000+0000"),
+            _record("001B", Name="Globex", SystemModstamp="2024-01-02T10:00:00.000+0000"),
+        ]
+
+        parts = split_page(_page(records))
+
+        self.assertEqual([json.loads(part) for part in parts], records)
+
+    def test_an_empty_records_list(self):
+        self.assertEqual(split_page(_page([])), [])
+        self.assertEqual(passthrough_page(_page([]), "Account", TIME_EXTRACTED, "SystemModstamp"), [])
+
+    def test_records_without_leading_attributes_are_decoded(self):
+        records = [{"Id": "001A", "attributes": {"type": "Account"}, "Name": "Acme"}]
+        self.assertIsNone(split_page(_page(records)))
+
+    def test_records_array_that_is_not_the_last_member_is_decoded(self):
+        raw = json.dumps({"records": [_record("001A")], "done": True}).encode("utf-8")
+        self.assertIsNone(split_page(raw))
+
+    def test_strings_that_look_like_records(self):
+        records = [
+            _record("001A", Name='Acme}, {"attributes": {"type": "Account"}, "Id": "001X"'),
+            _record("001B", Description='say "hello" ] }', Name="{\"attributes\":"),
+        ]
+
+        parts = split_page(_page(records))
+
+        self.assertEqual([json.loads(part) for part in parts], records)
+        self.assertEqual([field_value(part, "Id") for part in parts], ["001A", "001B"])
+
+    def test_nested_compound_fields(self):
+        records = [
+            _record(
+                "001A",
+                BillingAddress={"city": "Berlin", "street": "Main St. }]", "geocodeAccuracy": None},
+                Location={"latitude": 52.5, "longitude": 13.4},
+            ),
+            _record("001B", BillingAddress=None, Location=None),
+        ]
+
+        parts = split_page(_page(records))
+
+        self.assertEqual([json.loads(part) for part in parts], records)
+
+
+class FieldValueTest(unittest.TestCase):
+    def test_reads_top_level_string_values(self):
+        record = json.dumps(_record("001A", SystemModstamp="2024-01-01T10:00:00.000+0000")).encode("utf-8")
+        self.assertEqual(field_value(record, "Id"), "001A")
+        self.assertEqual(field_value(record, "SystemModstamp"), "2024-01-01T10:00:00.000+0000")
+        self.assertIsNone(field_value(record, "Name"))
+
+    def test_a_null_value(self):
+        record = json.dumps(_record(None, Name="Acme")).encode("utf-8")
+        self.assertIsNone(field_value(record, "Id"))
+
+    def test_skips_fields_of_nested_objects(self):
+        owner = {"attributes": {"type": "User"}, "Id": "005A", "Name": "Owner"}
+        record = {"attributes": {"type": "Account"}, "Owner": owner, "Name": "Acme", "Id": "001A"}
+        raw = json.dumps(record).encode("utf-8")
+
+        self.assertEqual(field_value(raw, "Id"), "001A")
+        self.assertEqual(field_value(raw, "Name"), "Acme")
+
+    def test_escaped_values(self):
+        record = json.dumps(_record("001A", Name='say "hello" \\ é')).encode("utf-8")
+        self.assertEqual(field_value(record, "Name"), 'say "hello" \\ é')
+
+
+class DecodePageTest(unittest.TestCase):
+    def decode(self, raw, passthrough):
+        now = datetime(2024, 3, 1, 10, 0, tzinfo=timezone.utc)
+        with mock.patch("tap_salesforce.pipeline.datetime") as fake:
+            fake.now.return_value = now
+            return decode_page(raw, "Account", "SystemModstamp", None, passthrough)
+
+    def test_passthrough_writes_the_messages_of_the_decoded_path(self):
+        records = [
+            _record("001A", Name='Acme "Corp"', SystemModstamp="2024-01-01T10:00:00.000+0000"),
+            _record("001B", Name="Müller", BillingAddress={"city": "Köln"}, SystemModstamp=None),
+            _record("001C", AnnualRevenue=1.5, IsDeleted=False, SystemModstamp="2024-01-03T10:00:00.000+0000"),
+        ]
+        # salesforce pages are encoded like the records of the decoded path
+        raw = json.dumps({"totalSize": 3, "done": True, "records": records}, ensure_ascii=False).encode("utf-8")
+
+        passthrough = self.decode(raw, True)
+        decoded = self.decode(raw, False)
+
+        self.assertEqual(passthrough, decoded)
+        self.assertEqual(
+            [(record_id, key) for record_id, key, _ in passthrough],
+            [("001A", "2024-01-01T10:00:00.000+0000"), ("001B", None), ("001C", "2024-01-03T10:00:00.000+0000")],
+        )
+
+    def test_compact_pages_have_the_same_records(self):
+        records = [_record("001A", Name="Acme", SystemModstamp="2024-01-01T10:00:00.000+0000")]
+        raw = _page(records)
+
+        passthrough = self.decode(raw, True)
+        decoded = self.decode(raw, False)
+
+        self.assertEqual([json.loads(line) for _, _, line in passthrough], [json.loads(line) for _, _, line in decoded])
+
+    def test_falls_back_to_decoding_pages_it_cannot_split(self):
+        records = [{"Id": "001A", "attributes": {"type": "Account"}, "SystemModstamp": "2024-01-01T10:00:00.000+0000"}]
+        raw = _page(records)
+
+        page = self.decode(raw, True)
+
+        self.assertEqual(page, self.decode(raw, False))
+        self.assertEqual(json.loads(page[0][2])["record"], records[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import io
+import json
+import unittest
+from datetime import datetime, timezone
+
+from tap_salesforce import sync, OVERLAP_WINDOW
+from tap_salesforce.client import Table
+from tap_salesforce.checkpoint import Checkpoint
+from tap_salesforce.dedupe import OverlapFilter
+from tap_salesforce.pipeline import Pipeline
+from tap_salesforce.stream import Stream
+from tests.salesforce_stub import SalesforceStub, connect, error
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+END = datetime(2024, 2, 1, tzinfo=timezone.utc)
+FIELDS = ["Id", "Name", "SystemModstamp"]
+
+
+def _accounts():
+    keys = [
+        ("001A", "2024-01-02T10:00:00.000+0000"),
+        ("001B", "2024-01-03T10:00:00.000+0000"),
+        # ties on the replication key across a page boundary
+        ("001C", "2024-01-04T10:00:00.000+0000"),
+        ("001D", "2024-01-04T10:00:00.000+0000"),
+        ("001E", "2024-01-04T10:00:00.000+0000"),
+        ("001F", "2024-01-05T10:00:00.000+0000"),
+        ("001G", "2024-01-06T10:00:00.000+0000"),
+    ]
+    return [{"Id": record_id, "Name": f"Account {record_id}", "SystemModstamp": key} for record_id, key in keys]
+
+
+def _overlap_filter():
+    """a filter that has seen the first account in the previous run"""
+    previous = OverlapFilter(OVERLAP_WINDOW)
+    first = _accounts()[0]
+    key = first["SystemModstamp"]
+    previous.add(first["Id"], key, datetime.strptime(key, "%Y-%m-%dT%H:%M:%S.%f%z"))
+    return OverlapFilter.from_state(previous.to_state(), OVERLAP_WINDOW)
+
+
+class PipelineTest(unittest.TestCase):
+    def setUp(self):
+        self.stub = SalesforceStub({"Account": _accounts()}, page_size=2)
+        self.sf = connect(self.stub)
+        self.table = Table(name="Account", replication_key="SystemModstamp", primary_key="Id")
+
+    def run_sync(self, pipeline):
+        output = io.StringIO()
+        stream = Stream(None, output)
+        checkpoint = Checkpoint(START, END)
+        sync(
+            self.sf,
+            stream,
+            self.table,
+            FIELDS,
+            START,
+            END,
+            checkpoint=checkpoint,
+            checkpoint_interval=3,
+            overlap_filter=_overlap_filter(),
+            pipeline=pipeline,
+        )
+        messages = [json.loads(line) for line in output.getvalue().splitlines()]
+        records = [message["record"] for message in messages if message["type"] == "RECORD"]
+        return records, checkpoint.to_dict(), stream.get_state()
+
+    def test_writes_the_records_and_state_of_the_regular_sync(self):
+        records, checkpoint, state = self.run_sync(None)
+        pipeline = Pipeline(0)
+        try:
+            pipelined = self.run_sync(pipeline)
+        finally:
+            pipeline.close()
+
+        self.assertEqual([record["Id"] for record in records], ["001B", "001C", "001D", "001E", "001F", "001G"])
+        self.assertEqual(pipelined, (records, checkpoint, state))
+        bookmark = state["bookmarks"]["Account"]
+        self.assertNotIn("checkpoint", bookmark)
+        self.assertIn("overlap_seen", bookmark)
+
+    def test_continues_without_the_pipeline_from_its_checkpoint(self):
+        expected, _, state = self.run_sync(None)
+        # the second page of the pipelined query fails
+        self.stub.fail_next = [None, error(400, "QUERY_TIMEOUT", "Your query request was running for too long.")]
+
+        pipeline = Pipeline(0)
+        try:
+            records, _, pipelined_state = self.run_sync(pipeline)
+        finally:
+            pipeline.close()
+
+        self.assertEqual(records, expected)
+        self.assertEqual(pipelined_state["bookmarks"]["Account"], state["bookmarks"]["Account"])
+        # the regular sync continued after the last record of the first page
+        self.assertIn("(SystemModstamp > 2024-01-03T10:00:00Z OR (SystemModstamp = 2024-01-03T10:00:00Z AND Id > '001B'))", self.stub.queries[-1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import io
+import json
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from tap_salesforce import do_sync, split_window
+from tap_salesforce.stream import Stream
+from tests.salesforce_stub import SalesforceStub, connect, response
+
+FIELDS = [
+    {"name": "Id", "type": "id"},
+    {"name": "Name", "type": "string"},
+    {"name": "SystemModstamp", "type": "datetime"},
+]
+TABLES = ["Account", "Contact", "User", "Opportunity"]
+
+
+def _accounts(count, since):
+    return [
+        {
+            "Id": f"001{i:02d}",
+            "Name": f"Account {i}",
+            "SystemModstamp": (since + timedelta(minutes=10 * (i + 1))).strftime("%Y-%m-%dT%H:%M:%S.000+0000"),
+        }
+        for i in range(count)
+    ]
+
+
+class SplitWindowTest(unittest.TestCase):
+    def test_splits_into_contiguous_parts(self):
+        start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        end = datetime(2024, 1, 1, 10, 0, 1, tzinfo=timezone.utc)
+
+        parts = split_window(start, end, 3)
+
+        self.assertEqual(len(parts), 3)
+        self.assertEqual(parts[0][0], start)
+        self.assertEqual(parts[-1][1], end)
+        for (_, part_end), (next_start, _) in zip(parts, parts[1:]):
+            self.assertEqual(part_end, next_start)
+
+
+class ProbeChangesTest(unittest.TestCase):
+    def setUp(self):
+        self.bookmark = datetime.now(timezone.utc) - timedelta(hours=2)
+        self.stub = SalesforceStub({"Account": []}, page_size=10)
+        self.stub.describes = {name: FIELDS for name in TABLES}
+        self.state = {
+            "bookmarks": {name: {"SystemModstamp": self.bookmark.isoformat() + "Z"} for name in TABLES}
+        }
+
+    def sync(self, **config):
+        output = io.StringIO()
+        stream = Stream(self.state, output)
+        do_sync(connect(self.stub), stream, {"start_date": "2024-01-01T00:00:00Z", **config})
+        messages = [json.loads(line) for line in output.getvalue().splitlines()]
+        records = [message["record"]["Id"] for message in messages if message.get("stream") == "Account"]
+        return records, stream.get_state()
+
+    def account_queries(self):
+        return [
+            query
+            for query in self.stub.queries
+            if "FROM Account" in query and not query.startswith("SELECT COUNT()")
+        ]
+
+    def test_skips_the_query_of_a_table_without_changes(self):
+        records, state = self.sync()
+
+        self.assertEqual(records, [])
+        self.assertEqual(self.account_queries(), [])
+        self.assertEqual(sum(1 for query in self.stub.queries if query.startswith("SELECT COUNT()")), len(TABLES))
+        bookmark = state["bookmarks"]["Account"]
+        self.assertGreater(datetime.fromisoformat(bookmark["SystemModstamp"][:-1]), self.bookmark)
+        self.assertEqual(bookmark["replication_method"], "INCREMENTAL")
+
+    def test_splits_a_window_with_more_records_than_probe_split_records(self):
+        accounts = _accounts(5, self.bookmark)
+        self.stub.tables["Account"] = accounts
+
+        records, _ = self.sync(probe_split_records=2)
+
+        self.assertEqual(records, [account["Id"] for account in accounts])
+        self.assertEqual(len(self.account_queries()), 3)
+
+    def test_syncs_all_tables_when_the_probes_fail(self):
+        accounts = _accounts(2, self.bookmark)
+        self.stub.tables["Account"] = accounts
+        self.stub.failing["/composite"] = response(500, {})
+
+        records, _ = self.sync(probe_split_records=1)
+
+        self.assertEqual(records, [account["Id"] for account in accounts])
+        # without a count the window is not split
+        self.assertEqual(len(self.account_queries()), 1)
+        self.assertFalse(any(query.startswith("SELECT COUNT()") for query in self.stub.queries))
+
+
+if __name__ == "__main__":
+    unittest.main()
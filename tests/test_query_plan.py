@@ -0,0 +1,93 @@
+import io
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from tap_salesforce import prefetch_small_tables
+from tap_salesforce.catalog import FieldSelector
+from tap_salesforce.client import Table
+from tap_salesforce.memory import GOVERNOR
+from tap_salesforce.stream import Stream
+from tests.salesforce_stub import SalesforceStub, connect
+
+FIELDS = [
+    {"name": "Id", "type": "id"},
+    {"name": "Name", "type": "string"},
+    {"name": "SystemModstamp", "type": "datetime"},
+]
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+END = datetime(2024, 2, 1, tzinfo=timezone.utc)
+
+
+def _records(prefix):
+    units = ["Afterpay", "Square", "afterpay"]
+    return [
+        {
+            "Id": f"{prefix}{i:02d}",
+            "Name": f"Record {i}",
+            "SystemModstamp": (START + timedelta(days=i + 1)).strftime("%Y-%m-%dT%H:%M:%S.000+0000"),
+            "Business_Unit__c": unit,
+        }
+        for i, unit in enumerate(units)
+    ]
+
+
+def _table(name):
+    table = Table(name=name, replication_key="SystemModstamp", primary_key="Id")
+    table.set_fields(FIELDS)
+    return table
+
+
+class TenantFilterTest(unittest.TestCase):
+    def setUp(self):
+        self.stub = SalesforceStub({"Account": _records("001"), "Contact": _records("003")}, page_size=10)
+        self.stub.instance_url = "https://squareinc.my.salesforce.com"
+        self.sf = connect(self.stub)
+        # the advisor moves the tenant predicate out of every query
+        self.sf.query_plan_advisor = mock.Mock()
+        self.sf.query_plan_advisor.use_tenant_filter.return_value = False
+
+    def test_the_records_are_filtered_without_the_tenant_field(self):
+        records = list(self.sf.get_records(_table("Account"), ["Id", "Name", "SystemModstamp"], START, END))
+
+        self.assertEqual([record["Id"] for record in records], ["00100", "00102"])
+        self.assertNotIn("Business_Unit__c", records[0])
+        self.assertNotIn("Business_Unit__c IN", self.stub.queries[-1])
+
+    def test_a_selected_tenant_field_is_kept(self):
+        fields = ["Id", "Name", "SystemModstamp", "Business_Unit__c"]
+
+        records = list(self.sf.get_records(_table("Account"), fields, START, END))
+
+        self.assertEqual([record["Business_Unit__c"] for record in records], ["Afterpay", "afterpay"])
+
+    def test_prefetched_queries_match_the_queries_of_the_sync(self):
+        stream = Stream({"bookmarks": {}}, io.StringIO())
+        tables = [_table("Account"), _table("Contact")]
+
+        windows = prefetch_small_tables(self.sf, stream, tables, FieldSelector(), START, ["Account", "Contact"])
+        self.assertEqual(set(windows), {"Account", "Contact"})
+        self.assertGreater(GOVERNOR.tracked_bytes(), 0)
+        queries = len(self.stub.queries)
+
+        for table in tables:
+            start, end, _ = windows[table.name]
+            records = list(self.sf.get_records(table, [field["name"] for field in FIELDS], start, end))
+            self.assertEqual(len(records), 2)
+
+        # both tables were synced from their prefetched page
+        self.assertEqual(len(self.stub.queries), queries)
+        self.assertEqual(GOVERNOR.tracked_bytes(), 0)
+
+    def test_unused_prefetched_pages_are_released(self):
+        stream = Stream({"bookmarks": {}}, io.StringIO())
+        tables = [_table("Account"), _table("Contact")]
+        prefetch_small_tables(self.sf, stream, tables, FieldSelector(), START, ["Account", "Contact"])
+
+        self.sf.discard_prefetched()
+
+        self.assertEqual(GOVERNOR.tracked_bytes(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+import unittest
+from unittest import mock
+
+import requests
+
+from tap_salesforce.exceptions import SalesforceException, build_salesforce_exception
+from tap_salesforce.retry import RetryEngine, classify
+from tests.salesforce_stub import SalesforceStub, connect, error, response
+
+QUERY = {"q": "SELECT Id FROM Account"}
+QUERY_PATH = "/services/data/v52.0/queryAll/"
+
+
+def _http_error(status_code):
+    return requests.exceptions.HTTPError(response=response(status_code, {}))
+
+
+class ClassifyTest(unittest.TestCase):
+    def test_throttling_and_server_errors_are_retried(self):
+        for status_code in [429, 500, 502, 503, 504]:
+            self.assertEqual(classify(_http_error(status_code), status_code), f"HTTP {status_code}")
+        unparsable = build_salesforce_exception(response(503, b"<html>unavailable</html>"))
+        self.assertEqual(classify(unparsable, 503), "HTTP 503")
+        self.assertIsNone(classify(_http_error(404), 404))
+
+    def test_temporary_salesforce_errors_are_retried(self):
+        for code in ["UNABLE_TO_LOCK_ROW", "SERVER_UNAVAILABLE", "FUNCTIONALITY_TEMPORARILY_UNAVAILABLE"]:
+            self.assertEqual(classify(SalesforceException("busy", code), 503), code)
+        concurrent = SalesforceException("ConcurrentPerOrgLongTxn Limit exceeded", "REQUEST_LIMIT_EXCEEDED")
+        self.assertEqual(classify(concurrent, 403), "REQUEST_LIMIT_EXCEEDED")
+        self.assertIsNone(classify(SalesforceException("TotalRequests Limit exceeded", "REQUEST_LIMIT_EXCEEDED"), 403))
+
+    def test_invalid_sessions_are_retried(self):
+        self.assertEqual(classify(SalesforceException("invalid", "INVALID_SESSION_ID"), 401), "INVALID_SESSION_ID")
+        expired = build_salesforce_exception(error(401, "INVALID_SESSION_ID", "Session expired or invalid"))
+        self.assertEqual(classify(expired, 401), "SESSION_EXPIRED")
+
+    def test_connection_errors_are_retried(self):
+        self.assertEqual(classify(requests.exceptions.ReadTimeout()), "ReadTimeout")
+        self.assertEqual(classify(requests.exceptions.ConnectionError()), "ConnectionError")
+
+    def test_permanent_errors_and_query_timeouts_are_not_retried(self):
+        for code in ["MALFORMED_QUERY", "INVALID_FIELD", "INVALID_TYPE", "QUERY_TIMEOUT"]:
+            self.assertIsNone(classify(SalesforceException("failed", code), 400))
+
+
+@mock.patch("tap_salesforce.retry.time.sleep")
+class RetryEngineTest(unittest.TestCase):
+    def test_logs_in_again_after_an_invalid_session(self, sleep):
+        stub = SalesforceStub()
+        sf = connect(stub)
+        stub.fail_next = [error(401, "INVALID_SESSION_ID", "Session expired or invalid")]
+
+        sf.request("GET", QUERY_PATH, params=QUERY)
+
+        self.assertEqual(stub.logins, 2)
+        self.assertEqual(stub.tokens, ["Bearer token1", "Bearer token2"])
+        self.assertEqual(sf.retries.retries_by_cause, {"SESSION_EXPIRED": 1})
+
+    def test_honors_retry_after(self, sleep):
+        stub = SalesforceStub()
+        sf = connect(stub, retries=RetryEngine())
+        stub.fail_next = [response(429, {}, {"Retry-After": "7"}), response(503, {}, {"Retry-After": "1.5"})]
+
+        sf.request("GET", QUERY_PATH, params=QUERY)
+
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [7.0, 1.5])
+        self.assertEqual(sf.retries.waited, 8.5)
+        self.assertEqual(sf.retries.retries_by_cause, {"HTTP 429": 1, "HTTP 503": 1})
+
+    def test_does_not_retry_permanent_errors(self, sleep):
+        stub = SalesforceStub()
+        sf = connect(stub)
+        stub.fail_next = [error(400, "MALFORMED_QUERY", "unexpected token")]
+
+        with self.assertRaises(SalesforceException):
+            sf.request("GET", QUERY_PATH, params=QUERY)
+        self.assertEqual(len(stub.requests), 1)
+        sleep.assert_not_called()
+
+    def test_gives_up_after_the_tries_of_a_request(self, sleep):
+        stub = SalesforceStub()
+        sf = connect(stub, retries=RetryEngine(max_tries=3, factor=0.0))
+        stub.fail_next = [response(503, {})] * 3
+
+        with self.assertRaises(requests.exceptions.HTTPError):
+            sf.request("GET", QUERY_PATH, params=QUERY)
+        self.assertEqual(len(stub.requests), 3)
+        self.assertEqual(sf.retries.retries, 2)
+
+    def test_limits_the_retries_of_a_table(self, sleep):
+        retries = RetryEngine(budget_per_table=2, factor=0.0)
+        failure = SalesforceException("busy", "UNABLE_TO_LOCK_ROW")
+
+        retries.table = "Account"
+        self.assertIsNotNone(retries.backoff(1, failure))
+        self.assertIsNotNone(retries.backoff(1, failure))
+        self.assertIsNone(retries.backoff(1, failure))
+
+        retries.table = "Contact"
+        self.assertIsNotNone(retries.backoff(1, failure))
+        self.assertEqual(retries.report()["by_table"], {"Account": 2, "Contact": 1})
+
+    def test_limits_the_retries_of_a_run(self, sleep):
+        retries = RetryEngine(budget_per_run=3, factor=0.0)
+        failure = requests.exceptions.ConnectionError()
+
+        for table in ["Account", "Contact", "Lead"]:
+            retries.table = table
+            self.assertIsNotNone(retries.backoff(1, failure))
+        retries.table = "Opportunity"
+        self.assertIsNone(retries.backoff(1, failure))
+        self.assertEqual(retries.retries, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,220 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from tap_salesforce import Replication
+from tap_salesforce.client import Table
+from tap_salesforce.stream import Stream
+from tap_salesforce.shard import plan, merge
+
+FIELDS = [{"name": name, "type": "string"} for name in ["Id", "SystemModstamp", "Name"]]
+
+
+class FakeSalesforce:
+    """returns the tables of the plan"""
+
+    instance_url = "https://example.my.salesforce.com"
+
+    def __init__(self, tables):
+        self.tables = tables
+
+    def get_tables(self, *args):
+        for table in self.tables:
+            table.set_fields(FIELDS)
+            yield table
+
+
+def _unit(unit_id, table, start, end, method=Replication.incremental, replication_key="SystemModstamp"):
+    return {
+        "id": unit_id,
+        "table": table,
+        "start": start,
+        "end": end,
+        "replication_key": replication_key,
+        "replication_method": method,
+        "sync_fields": False,
+        "expected_seconds": 0.0,
+    }
+
+
+def _run(seconds, records, started_at="2024-03-01T00:00:00+00:00"):
+    return {
+        "started_at": started_at,
+        "seconds": seconds,
+        "records": records,
+        "windows": 1,
+        "window_hours": 720.0,
+        "requests": 2,
+        "pages": 1,
+        "bytes": 100,
+        "timeouts": 0,
+    }
+
+
+class PlanTest(unittest.TestCase):
+    def test_splits_incremental_tables_into_ranges(self):
+        start = datetime.now(timezone.utc) - timedelta(days=65)
+        sf = FakeSalesforce(
+            [
+                Table(name="Account", replication_key="SystemModstamp", primary_key="Id"),
+                Table(name="Territory", replication_key=None, primary_key="Id"),
+            ]
+        )
+
+        manifest = plan(sf, Stream(), {"start_date": start.isoformat()}, shards=2, unit_days=30)
+
+        accounts = [unit for unit in manifest["units"] if unit["table"] == "Account"]
+        self.assertEqual(len(accounts), 3)
+        self.assertEqual(accounts[0]["start"], start.isoformat())
+        self.assertEqual(accounts[1]["start"], accounts[0]["end"])
+        self.assertEqual(accounts[2]["start"], accounts[1]["end"])
+        self.assertTrue(all(unit["replication_method"] == Replication.incremental for unit in accounts))
+
+        territories = [unit for unit in manifest["units"] if unit["table"] == "Territory"]
+        self.assertEqual(len(territories), 1)
+        self.assertEqual(territories[0]["replication_method"], Replication.full_table)
+
+        assigned = sorted(unit_id for shard in manifest["shards"] for unit_id in shard)
+        self.assertEqual(assigned, sorted(unit["id"] for unit in manifest["units"]))
+        self.assertEqual([len(shard) for shard in manifest["shards"]], [2, 2])
+
+    def test_assigns_measured_units_to_the_least_loaded_shard(self):
+        start = datetime.now(timezone.utc) - timedelta(days=89)
+        history = {
+            "Account": [{"seconds": 90.0, "records": 10, "window_hours": 24 * 90}],
+            "Territory": [{"seconds": 100.0, "records": 10, "window_hours": 0}],
+        }
+        sf = FakeSalesforce(
+            [
+                Table(name="Account", replication_key="SystemModstamp", primary_key="Id"),
+                Table(name="Territory", replication_key=None, primary_key="Id"),
+            ]
+        )
+
+        manifest = plan(
+            sf,
+            Stream({"history": history}),
+            {"start_date": start.isoformat()},
+            shards=2,
+            unit_days=30,
+        )
+
+        # the full table unit takes longer than the three account ranges of about 30s together
+        self.assertEqual(manifest["shards"][0], ["Territory-0000"])
+        self.assertEqual(manifest["shards"][1], ["Account-0000", "Account-0001", "Account-0002"])
+        self.assertEqual([unit["expected_seconds"] for unit in manifest["units"]][3], 100.0)
+
+
+class MergeTest(unittest.TestCase):
+    def test_moves_the_bookmark_to_the_last_contiguous_completed_unit(self):
+        manifest = {
+            "state": {"bookmarks": {"Account": {"SystemModstamp": "2024-01-01T00:00:00+00:00Z"}}},
+            "units": [
+                _unit("Account-0000", "Account", "2024-01-01T00:00:00+00:00", "2024-01-31T00:00:00+00:00"),
+                _unit("Account-0001", "Account", "2024-01-31T00:00:00+00:00", "2024-03-01T00:00:00+00:00"),
+                _unit("Account-0002", "Account", "2024-03-01T00:00:00+00:00", "2024-03-31T00:00:00+00:00"),
+            ],
+            "shards": [["Account-0000", "Account-0002"], ["Account-0001"]],
+        }
+        shard_states = [
+            {"units": {"Account-0000": {"completed": True}, "Account-0002": {"completed": True}}},
+            {"units": {"Account-0001": {"completed": False, "error": "failed"}}},
+        ]
+
+        state = merge(manifest, shard_states)
+
+        bookmark = state["bookmarks"]["Account"]
+        self.assertEqual(bookmark["SystemModstamp"], "2024-01-31T00:00:00+00:00Z")
+        self.assertEqual(bookmark[Replication.key], Replication.incremental)
+        self.assertNotIn("Account", state.get("history", {}))
+
+    def test_full_table_is_only_marked_when_every_unit_completed(self):
+        manifest = {
+            "state": {},
+            "units": [
+                _unit("Territory-0000", "Territory", "2024-01-01T00:00:00+00:00", "2024-03-01T00:00:00+00:00", Replication.full_table, None),
+            ],
+            "shards": [["Territory-0000"]],
+        }
+
+        state = merge(manifest, [{"units": {"Territory-0000": {"completed": False}}}])
+        self.assertNotIn("Territory", state["bookmarks"])
+
+        state = merge(manifest, [{"units": {"Territory-0000": {"completed": True}}}])
+        self.assertEqual(state["bookmarks"]["Territory"][Replication.key], Replication.full_table)
+
+    def test_resync_keeps_the_latest_replication_key_of_the_shards(self):
+        manifest = {
+            "state": {"bookmarks": {"OpportunityLineItem": {"SystemModstamp": "2024-01-01T00:00:00+00:00Z"}}},
+            "units": [
+                _unit("OpportunityLineItem-0000", "OpportunityLineItem", "2020-01-01T00:00:00+00:00", "2022-01-01T00:00:00+00:00", Replication.full_table),
+                _unit("OpportunityLineItem-0001", "OpportunityLineItem", "2022-01-01T00:00:00+00:00", "2024-03-01T00:00:00+00:00", Replication.full_table),
+            ],
+            "shards": [["OpportunityLineItem-0000"], ["OpportunityLineItem-0001"]],
+        }
+        shard_states = [
+            {
+                "units": {"OpportunityLineItem-0000": {"completed": True}},
+                "state": {"bookmarks": {"OpportunityLineItem": {"SystemModstamp": "2021-12-31T10:00:00+00:00Z"}}},
+            },
+            {
+                "units": {"OpportunityLineItem-0001": {"completed": True}},
+                "state": {"bookmarks": {"OpportunityLineItem": {"SystemModstamp": "2024-02-29T10:00:00+00:00Z"}}},
+            },
+        ]
+
+        state = merge(manifest, shard_states)
+
+        bookmark = state["bookmarks"]["OpportunityLineItem"]
+        self.assertEqual(bookmark["SystemModstamp"], "2024-02-29T10:00:00+00:00Z")
+        self.assertEqual(bookmark[Replication.key], Replication.full_table)
+
+    def test_adds_one_history_entry_for_the_units_of_all_shards(self):
+        previous = _run(10.0, 5, started_at="2024-02-01T00:00:00+00:00")
+        manifest = {
+            "history_size": 2,
+            "state": {"history": {"Account": [previous, previous]}},
+            "units": [
+                _unit("Account-0000", "Account", "2024-01-01T00:00:00+00:00", "2024-01-31T00:00:00+00:00"),
+                _unit("Account-0001", "Account", "2024-01-31T00:00:00+00:00", "2024-03-01T00:00:00+00:00"),
+            ],
+            "shards": [["Account-0000"], ["Account-0001"]],
+        }
+        shard_states = [
+            {"units": {"Account-0000": {"completed": True, "run": _run(4.0, 3, started_at="2024-03-01T00:00:05+00:00")}}},
+            {"units": {"Account-0001": {"completed": True, "run": _run(6.5, 7)}}},
+        ]
+
+        state = merge(manifest, shard_states)
+
+        history = state["history"]["Account"]
+        self.assertEqual(len(history), 2)
+        self.assertEqual(history[0], previous)
+        self.assertEqual(history[1]["started_at"], "2024-03-01T00:00:00+00:00")
+        self.assertEqual(history[1]["seconds"], 10.5)
+        self.assertEqual(history[1]["records"], 10)
+        self.assertEqual(history[1]["windows"], 2)
+        self.assertEqual(history[1]["requests"], 4)
+
+    def test_keeps_the_fields_digests_of_the_shard_that_changed_them(self):
+        manifest = {
+            "state": {"bookmarks": {"AccountFields": {"digests": {"Name": "old"}, "refreshed_at": "2024-01-01T00:00:00+00:00"}}},
+            "units": [
+                _unit("Account-0000", "Account", "2024-01-01T00:00:00+00:00", "2024-01-31T00:00:00+00:00"),
+                _unit("Account-0001", "Account", "2024-01-31T00:00:00+00:00", "2024-03-01T00:00:00+00:00"),
+            ],
+            "shards": [["Account-0000"], ["Account-0001"]],
+        }
+        updated = {"digests": {"Name": "new", "Industry": "added"}, "refreshed_at": "2024-03-01T00:00:00+00:00"}
+        shard_states = [
+            {"units": {"Account-0000": {"completed": True}}, "state": {"bookmarks": {"AccountFields": updated}}},
+            # the second shard did not sync the fields and carries the bookmark of the manifest
+            {"units": {"Account-0001": {"completed": True}}, "state": manifest["state"]},
+        ]
+
+        state = merge(manifest, shard_states)
+
+        self.assertEqual(state["bookmarks"]["AccountFields"], updated)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import subprocess
+from unittest import mock
+
+import tap_salesforce
+from tap_salesforce.startup import STARTUP
+from tests.salesforce_stub import SalesforceStub, connect
+
+CONFIG = {
+    "refresh_token": "refresh_token",
+    "client_id": "client_id",
+    "client_secret": "client_secret",
+    "start_date": "2024-01-01T00:00:00Z",
+}
+
+
+class StartupTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, value):
+        path = f"{self.directory}/{name}"
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(value, f)
+        return path
+
+    def test_reports_the_startup_phases(self):
+        argv = ["tap-salesforce", "-c", self.write("config.json", CONFIG), "-s", self.write("state.json", {})]
+        stub = SalesforceStub()
+
+        with mock.patch.object(sys, "argv", argv), mock.patch.object(
+            tap_salesforce, "build_salesforce", side_effect=lambda config, login_async: connect(stub)
+        ), mock.patch.object(tap_salesforce, "do_sync") as do_sync, mock.patch.object(
+            STARTUP, "report", wraps=STARTUP.report
+        ) as report:
+            tap_salesforce.main_impl()
+
+        do_sync.assert_called_once()
+        report.assert_called_once()
+        self.assertEqual(list(STARTUP.phases), ["imports", "arguments", "state", "login"])
+        self.assertTrue(all(seconds >= 0 for seconds in STARTUP.phases.values()))
+
+    def test_the_modules_of_the_sync_are_imported_when_it_starts(self):
+        deferred = [
+            "dateutil.rrule",
+            "tap_salesforce.catalog",
+            "tap_salesforce.converter",
+            "tap_salesforce.dedupe",
+            "tap_salesforce.fields",
+            "tap_salesforce.history",
+        ]
+        code = f"import sys, tap_salesforce; print([m for m in {deferred!r} if m in sys.modules])"
+
+        output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout
+
+        self.assertEqual(output.strip(), "[]")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+import io
+import re
+import json
+import unittest
+from unittest import mock
+from datetime import datetime, timezone
+
+import requests
+
+from tap_salesforce.client import Table
+from tap_salesforce.converter import RecordConverter
+from tap_salesforce.stream import Stream
+from tap_salesforce.streaming import ChangeDataCaptureSync, REPLAY_ALL_RETAINED_EVENTS
+
+from tests.cometd_stub import CometdStub
+
+CHANNEL = "/data/AccountChangeEvent"
+FIELDS = [
+    {"name": "Id", "type": "id"},
+    {"name": "Name", "type": "string"},
+    {"name": "NumberOfEmployees", "type": "int"},
+    {"name": "SystemModstamp", "type": "datetime"},
+]
+
+
+def _timestamp(value: datetime) -> int:
+    return int(value.timestamp() * 1000)
+
+
+class FakeSalesforce:
+    """answers the queries by Id of the change data capture sync from a dict of records"""
+
+    api_version = "v52.0"
+
+    def __init__(self, instance_url: str, records: dict):
+        self.instance_url = instance_url
+        self.session = requests.Session()
+        self.records = records
+        self.queries = []
+        self.expired_sessions = 0
+
+    def auth_headers(self):
+        return {"Authorization": "Bearer token"}
+
+    def expire_session(self):
+        self.expired_sessions += 1
+
+    def paginate(self, method, path, data=None, params=None):
+        self.queries.append(params["q"])
+        ids = re.findall(r"'(\w+)'", params["q"])
+        return [dict(self.records[record_id]) for record_id in ids if record_id in self.records]
+
+
+class ChangeDataCaptureSyncTest(unittest.TestCase):
+    def setUp(self):
+        self.stub = CometdStub().start()
+        self.sf = FakeSalesforce(
+            self.stub.instance_url,
+            {
+                "001A": {"Id": "001A", "Name": "Acme", "NumberOfEmployees": "12.0", "SystemModstamp": "2024-01-01T10:00:00.000+0000"},
+                "001B": {"Id": "001B", "Name": "Globex", "NumberOfEmployees": "3.0", "SystemModstamp": "2024-01-01T10:00:00.000+0000"},
+            },
+        )
+        self.output = io.StringIO()
+        self.table = Table(name="Account", replication_key="SystemModstamp", primary_key="Id")
+        self.repairs = []
+
+    def tearDown(self):
+        self.stub.stop()
+
+    def run_sync(self, state, max_runtime_seconds=0.3):
+        stream = Stream(state, self.output)
+        ChangeDataCaptureSync(
+            self.sf,
+            stream,
+            [self.table],
+            {"Account": [field["name"] for field in FIELDS]},
+            self.repairs.append,
+            state_interval_seconds=3600,
+            converters={"Account": RecordConverter(FIELDS, normalize_types=True)},
+        ).run(max_runtime_seconds)
+        return stream
+
+    def messages(self, message_type):
+        return [
+            message
+            for message in map(json.loads, self.output.getvalue().splitlines())
+            if message["type"] == message_type
+        ]
+
+    def test_handshake_subscribe_and_replay_id(self):
+        self.stub.publish(CHANNEL, "UPDATE", ["001A"], _timestamp(datetime.now(timezone.utc)), Name="Acme")
+        replay_id = self.stub.publish(CHANNEL, "DELETE", ["001B"], _timestamp(datetime.now(timezone.utc)))
+
+        stream = self.run_sync({"bookmarks": {"Account": {"replay_id": 0}}})
+
+        self.assertEqual(self.stub.handshakes, 1)
+        self.assertEqual(self.stub.subscriptions, [{CHANNEL: 0}])
+        self.assertEqual(self.repairs, [])
+        records = [message["record"] for message in self.messages("RECORD")]
+        # the updated record is read again with all selected fields and converted
+        self.assertEqual(records[0]["Id"], "001A")
+        self.assertEqual(records[0]["NumberOfEmployees"], 12)
+        self.assertEqual(records[0]["SystemModstamp"], "2024-01-01T10:00:00.000000Z")
+        self.assertEqual(records[1]["Id"], "001B")
+        self.assertIn("_sdc_deleted_at", records[1])
+        self.assertEqual(stream.get_bookmark("Account")["replay_id"], replay_id)
+        self.assertEqual(self.messages("STATE")[-1]["value"]["bookmarks"]["Account"]["replay_id"], replay_id)
+
+    def test_repair_skips_events_before_the_repair(self):
+        self.stub.publish(CHANNEL, "UPDATE", ["001B"], _timestamp(datetime(2024, 1, 1, tzinfo=timezone.utc)), Name="stale")
+        replay_id = self.stub.publish(CHANNEL, "UPDATE", ["001A"], _timestamp(datetime.now(timezone.utc)), Name="Acme")
+
+        stream = self.run_sync({})
+
+        self.assertEqual([table.name for table in self.repairs], ["Account"])
+        self.assertEqual(self.stub.subscriptions, [{CHANNEL: REPLAY_ALL_RETAINED_EVENTS}])
+        self.assertEqual([message["record"]["Id"] for message in self.messages("RECORD")], ["001A"])
+        self.assertEqual(stream.get_bookmark("Account")["replay_id"], replay_id)
+
+    def test_invalid_replay_id_repairs(self):
+        self.stub.invalid_replay_ids.add(5)
+
+        stream = self.run_sync({"bookmarks": {"Account": {"replay_id": 5}}})
+
+        self.assertEqual([table.name for table in self.repairs], ["Account"])
+        self.assertEqual(
+            self.stub.subscriptions, [{CHANNEL: 5}, {CHANNEL: REPLAY_ALL_RETAINED_EVENTS}]
+        )
+        self.assertNotIn("replay_id", stream.get_bookmark("Account"))
+
+    def test_reconnects_after_expired_session_and_server_errors(self):
+        self.stub.fail_next = [401, 503]
+        self.stub.publish(CHANNEL, "UPDATE", ["001A"], _timestamp(datetime.now(timezone.utc)), Name="Acme")
+
+        with mock.patch("tap_salesforce.streaming.time.sleep") as sleep:
+            self.run_sync({"bookmarks": {"Account": {"replay_id": 0}}})
+
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [1, 2])
+        self.assertEqual(self.sf.expired_sessions, 1)
+        self.assertEqual(self.stub.handshakes, 1)
+        self.assertEqual([message["record"]["Id"] for message in self.messages("RECORD")], ["001A"])
+
+
+if __name__ == "__main__":
+    unittest.main()